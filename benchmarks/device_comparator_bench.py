@@ -0,0 +1,168 @@
+"""
+Benchmark the device comparator on synthetic inventories.
+
+Each size runs in a fresh Python process so peak RSS is measured per size and
+nothing is shared between runs. Inventories are generated once per size and
+seed and kept in the data directory, generation is not part of the timings.
+
+Usage (from the repository root):
+
+    python -m benchmarks.device_comparator_bench                      # 1k and 10k devices
+    python -m benchmarks.device_comparator_bench --sizes 1000 10000 100000
+    python -m benchmarks.device_comparator_bench --workers 4
+    python -m benchmarks.device_comparator_bench --similarity rapidfuzz
+    python -m benchmarks.device_comparator_bench --check              # exit 1 on regression
+    python -m benchmarks.device_comparator_bench --output bench_output.txt
+
+--check compares wall time and peak RSS against benchmarks/thresholds.json.
+Peak RSS is the larger of the main process and its largest worker process.
+Sizes without an entry there are reported but not checked.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+THRESHOLDS_FILE = os.path.join(BENCHMARK_DIR, 'thresholds.json')
+DEFAULT_SIZES = [1000, 10000]
+STAGES = ['load', 'parse', 'match', 'output']
+
+
+def peak_rss_mb(children: bool = False) -> float:
+    """
+    Peak resident set size of this process in MB, or with children of the
+    largest finished child process (the pool workers with --workers).
+    """
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_once(data_dir: str, workers: int = 1, similarity: str = None) -> dict:
+    """Run one comparison over the inventory in data_dir and return its measurements."""
+    sys.path.insert(0, REPO_ROOT)
+    import multiprocessing
+    from tools import device_comparator
+    from tools.device_comparator import StageTimer, compare_devices
+    from tools.similarity import get_similarity_backend
+
+    # Workers started by a fork server are not children of this process, so their peak would be
+    # missing from RUSAGE_CHILDREN. Forking is safe here, this process runs no other threads.
+    if 'fork' in multiprocessing.get_all_start_methods():
+        device_comparator.POOL_CONTEXT = multiprocessing.get_context('fork')
+
+    paths = {name: os.path.join(data_dir, f"{name}.csv") for name in ['jc', 'sentinels', 'agents', 'mapping', 'ns']}
+    timer = StageTimer()
+    start = time.perf_counter()
+    # The comparator reports progress with print, keep it out of the results
+    with contextlib.redirect_stdout(io.StringIO()):
+        report = compare_devices(paths['jc'], paths['sentinels'], paths['agents'], paths['mapping'], paths['ns'],
+                                 hours_min=24, hours_max=100, workers=workers, timer=timer,
+                                 similarity_backend=get_similarity_backend(similarity))
+    wall_seconds = time.perf_counter() - start
+    # Pool workers have exited by now, so their peak is in the children's usage
+    worker_peak = peak_rss_mb(children=True)
+    return {
+        'wall_seconds': round(wall_seconds, 3),
+        'peak_rss_mb': round(max(peak_rss_mb(), worker_peak), 1),
+        'worker_peak_rss_mb': round(worker_peak, 1),
+        'stages': {name: round(seconds, 3) for name, seconds in timer.timings.items()},
+        'stage_rss_mb': {name: None if memory['rss_mb'] is None else round(memory['rss_mb'], 1)
+                         for name, memory in timer.memory.items()},
+        'report_rows': len(report)
+    }
+
+
+def ensure_inventory(size: int, seed: int, data_root: str) -> str:
+    from benchmarks.synthetic_inventory import generate_inventory
+
+    data_dir = os.path.join(data_root, f"devices_{size}_seed_{seed}")
+    if not os.path.exists(os.path.join(data_dir, 'ns.csv')):
+        print(f"Generating {size} devices in {data_dir}")
+        generate_inventory(size, data_dir, seed=seed)
+    return data_dir
+
+
+def run_in_subprocess(data_dir: str, workers: int, similarity: str = None) -> dict:
+    command = [sys.executable, '-m', 'benchmarks.device_comparator_bench', '--run-once', data_dir,
+               '--workers', str(workers)]
+    if similarity:
+        command += ['--similarity', similarity]
+    result = subprocess.run(command, cwd=REPO_ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Benchmark run failed for {data_dir}:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def check_thresholds(results: dict, thresholds: dict) -> list:
+    """Return a message for every measurement above its threshold."""
+    failures = []
+    for size, measured in results.items():
+        limits = thresholds.get(str(size))
+        if not limits:
+            continue
+        for metric in ['wall_seconds', 'peak_rss_mb']:
+            if metric in limits and measured[metric] > limits[metric]:
+                failures.append(f"{size} devices: {metric} {measured[metric]} > {limits[metric]}")
+    return failures
+
+
+def format_results(results: dict) -> str:
+    lines = [f"{'devices':>8} {'wall s':>8} {'rss MB':>8} {'wkr MB':>8} " + ' '.join(f"{name:>8}" for name in STAGES) + f" {'rows':>7}"]
+    for size, measured in results.items():
+        stages = ' '.join(f"{measured['stages'].get(name, 0.0):>8.3f}" for name in STAGES)
+        lines.append(f"{size:>8} {measured['wall_seconds']:>8.3f} {measured['peak_rss_mb']:>8.1f} "
+                     f"{measured['worker_peak_rss_mb']:>8.1f} {stages} "
+                     f"{measured['report_rows']:>7}")
+    return '\n'.join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Inventory sizes in devices')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic inventories')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes for the matching stage')
+    parser.add_argument('--similarity', help='Similarity backend for hostname matching (e.g. rapidfuzz)')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'device_comparator_bench'),
+                        help='Where generated inventories are kept between runs')
+    parser.add_argument('--check', action='store_true', help='Fail if a run is above benchmarks/thresholds.json')
+    parser.add_argument('--output', help='Also write the results as JSON to this file')
+    parser.add_argument('--run-once', metavar='DATA_DIR', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_once:
+        print(json.dumps(run_once(args.run_once, args.workers, args.similarity)))
+        return 0
+
+    results = {}
+    for size in args.sizes:
+        data_dir = ensure_inventory(size, args.seed, args.data_dir)
+        results[size] = run_in_subprocess(data_dir, args.workers, args.similarity)
+    print(format_results(results))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({str(size): measured for size, measured in results.items()}, f, indent=2)
+
+    if args.check:
+        with open(THRESHOLDS_FILE) as f:
+            thresholds = json.load(f)
+        failures = check_thresholds(results, thresholds)
+        for failure in failures:
+            print(f"REGRESSION: {failure}")
+        if failures:
+            return 1
+        print("All benchmarks within thresholds")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+Seeded generator for synthetic device inventories.
+
+Writes JumpCloud, SentinelOne, Rapid7 agent, mapping and NetSkope exports with
+the columns the device comparator reads plus the unused columns real exports
+carry. Hostnames get the usual noise (case, domain suffixes, typos, renamed
+agents), a few cells are missing and each date column mixes in other formats.
+"""
+import os
+import random
+import string
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+import pandas as pd
+
+FIRST_NAMES = [
+    'james', 'mary', 'john', 'patricia', 'robert', 'jennifer', 'michael', 'linda', 'william', 'elizabeth',
+    'david', 'barbara', 'richard', 'susan', 'joseph', 'jessica', 'thomas', 'sarah', 'charles', 'karen',
+    'chris', 'nancy', 'daniel', 'lisa', 'matthew', 'betty', 'anthony', 'margaret', 'mark', 'sandra'
+]
+LAST_NAMES = [
+    'smith', 'johnson', 'williams', 'brown', 'jones', 'garcia', 'miller', 'davis', 'rodriguez', 'martinez',
+    'hernandez', 'lopez', 'gonzalez', 'wilson', 'anderson', 'thomas', 'taylor', 'moore', 'jackson', 'martin',
+    'lee', 'perez', 'thompson', 'white', 'harris', 'sanchez', 'clark', 'ramirez', 'lewis', 'robinson'
+]
+MODELS = ['mbp', 'mba', 'laptop', 'lt', 'desktop', 'pc', 'imac', 'ws']
+DOMAINS = ['.corp.example.com', '.local', '.example.internal']
+OPERATING_SYSTEMS = ['Mac OS X', 'Windows', 'Ubuntu']
+
+# Date formats per source, the first one is what the source normally exports
+JC_DATE_FORMATS = ['%Y-%m-%dT%H:%M:%S.%fZ', '%Y-%m-%dT%H:%M:%S%z', '%Y-%m-%d %H:%M:%S']
+SENTINEL_DATE_FORMATS = ['%b %d, %Y %I:%M:%S %p', '%Y-%m-%dT%H:%M:%S.%fZ', '%m/%d/%Y %H:%M']
+AGENT_DATE_FORMATS = ['%Y-%m-%d %H:%M:%S', '%m/%d/%Y %H:%M', '%Y-%m-%dT%H:%M:%S']
+
+# Benchmark sizes in devices
+SIZES = [1000, 10000, 100000]
+
+
+def _format_date(rng: random.Random, when: datetime, formats, mixed_rate: float = 0.03) -> Optional[str]:
+    if rng.random() < 0.01:
+        return None
+    fmt = formats[0] if rng.random() >= mixed_rate else rng.choice(formats[1:])
+    if '%z' in fmt:
+        return when.strftime('%Y-%m-%dT%H:%M:%S') + '+00:00'
+    return when.strftime(fmt)
+
+
+def _typo(rng: random.Random, hostname: str) -> str:
+    chars = list(hostname)
+    position = rng.randrange(len(chars))
+    action = rng.random()
+    if action < 0.4:
+        chars[position] = rng.choice(string.ascii_lowercase)
+    elif action < 0.7:
+        del chars[position]
+    else:
+        chars.insert(position, rng.choice(string.ascii_lowercase))
+    return ''.join(chars)
+
+
+def generate_inventory(device_count: int, output_dir: str, seed: int = 0,
+                       now: Optional[datetime] = None) -> Dict[str, str]:
+    """
+    Write a synthetic inventory of device_count devices to output_dir.
+
+    Returns the paths of the jc, sentinels, agents, mapping and ns CSV files.
+    The same seed and now always produce the same files. now defaults to the
+    current minute so the comparator's hour windows land on real devices.
+    """
+    rng = random.Random(seed)
+    now = now or datetime.now().replace(second=0, microsecond=0)
+    os.makedirs(output_dir, exist_ok=True)
+
+    jc_rows, sentinel_rows, agent_rows, mapping_rows, ns_rows = [], [], [], [], []
+    for i in range(device_count):
+        owner = rng.choice(FIRST_NAMES)[0] + rng.choice(LAST_NAMES) + (str(rng.randint(1, 99)) if rng.random() < 0.3 else '')
+        hostname = f"{owner}-{rng.choice(MODELS)}" + (f"-{rng.randint(1, 9999):04d}" if rng.random() < 0.5 else '')
+        serial = ''.join(rng.choice(string.ascii_uppercase + string.digits) for _ in range(12))
+        public_ip = f"{rng.choice([203, 198, 100])}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+        os_name = rng.choice(OPERATING_SYSTEMS)
+        email = f"{owner}@example.com"
+
+        # Most devices are healthy, a long tail has not reported for days or weeks
+        jc_seen = now - timedelta(hours=rng.expovariate(1 / 60))
+        remote_ip = f"['{public_ip}']" if rng.random() < 0.2 else public_ip
+        jc_rows.append({
+            '_id': f"{i:024x}",
+            'displayName': hostname.upper() if rng.random() < 0.3 else hostname,
+            'hostname': hostname if rng.random() > 0.01 else None,
+            'serialNumber': serial,
+            'os': os_name,
+            'osVersion': f"{rng.randint(10, 14)}.{rng.randint(0, 6)}",
+            'arch': rng.choice(['x86_64', 'arm64']),
+            'agentVersion': f"1.{rng.randint(100, 200)}.0",
+            'active': rng.random() > 0.1,
+            'allowMultiFactorAuthentication': rng.random() > 0.5,
+            'created': (now - timedelta(days=rng.randint(30, 2000))).strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            'fde': rng.random() > 0.2,
+            'systemTimezone': rng.choice(['-300', '0', '60', '330']),
+            'lastContact': _format_date(rng, jc_seen, JC_DATE_FORMATS),
+            'remoteIP': remote_ip,
+            'templateName': f"{os_name.lower().replace(' ', '')}-template"
+        })
+
+        if rng.random() < 0.9:
+            sentinel_seen = jc_seen + timedelta(hours=rng.uniform(-48, 48))
+            sentinel_rows.append({
+                'Endpoint Name': hostname + (rng.choice(DOMAINS) if rng.random() < 0.2 else ''),
+                'Serial Number': serial if rng.random() > 0.02 else None,
+                'Last Active': _format_date(rng, min(sentinel_seen, now), SENTINEL_DATE_FORMATS),
+                'OS': os_name,
+                'Agent Version': f"23.{rng.randint(1, 4)}.{rng.randint(0, 9)}",
+                'Site': rng.choice(['Default', 'Remote', 'HQ']),
+                'Network Status': rng.choice(['Connected', 'Disconnected'])
+            })
+
+        if rng.random() < 0.85:
+            roll = rng.random()
+            if roll < 0.7:
+                agent_hostname = hostname.upper() if rng.random() < 0.5 else hostname + rng.choice(DOMAINS)
+            elif roll < 0.9:
+                agent_hostname = _typo(rng, hostname)
+            else:
+                agent_hostname = f"desktop-{rng.randint(0, 16 ** 6):06x}"
+            agent_seen = jc_seen + timedelta(hours=rng.uniform(-72, 24))
+            agent_rows.append({
+                'Hostname': agent_hostname,
+                'Last Seen': _format_date(rng, min(agent_seen, now), AGENT_DATE_FORMATS),
+                'Public IP Address': public_ip,
+                'IP Address (Primary)': f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+                'OS': os_name,
+                'Agent Version': f"4.0.{rng.randint(0, 20)}"
+            })
+
+        if rng.random() < 0.95:
+            mapping_rows.append({
+                'HostName': hostname.upper() if rng.random() < 0.5 else hostname,
+                'displayname': owner.title(),
+                'email': email
+            })
+            if rng.random() < 0.7:
+                ns_rows.append({'User': email.upper() if rng.random() < 0.3 else email, 'Status': 'Enabled'})
+
+    # Devices only known to one of the security tools
+    for i in range(device_count // 50):
+        hostname = f"orphan-{i:05d}"
+        seen = now - timedelta(hours=rng.expovariate(1 / 60))
+        if i % 2:
+            sentinel_rows.append({
+                'Endpoint Name': hostname, 'Serial Number': f"ORPHAN{i:06d}",
+                'Last Active': _format_date(rng, seen, SENTINEL_DATE_FORMATS), 'OS': 'Windows',
+                'Agent Version': '23.1.0', 'Site': 'Default', 'Network Status': 'Connected'
+            })
+        else:
+            agent_rows.append({
+                'Hostname': hostname, 'Last Seen': _format_date(rng, seen, AGENT_DATE_FORMATS),
+                'Public IP Address': None, 'IP Address (Primary)': None, 'OS': 'Windows', 'Agent Version': '4.0.0'
+            })
+
+    # Exports are not in the same order as each other
+    rng.shuffle(sentinel_rows)
+    rng.shuffle(agent_rows)
+
+    paths = {}
+    for name, rows in [('jc', jc_rows), ('sentinels', sentinel_rows), ('agents', agent_rows),
+                       ('mapping', mapping_rows), ('ns', ns_rows)]:
+        paths[name] = os.path.join(output_dir, f"{name}.csv")
+        pd.DataFrame(rows).to_csv(paths[name], index=False)
+    return paths
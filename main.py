@@ -3,15 +3,22 @@ from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, StreamingResponse
 from tools.rapid7_metrics import Rapid7Metrics
-from tools.insightvm_processor import process_insightvm_files
+from tools.insightvm_processor import MatchCache, process_insightvm_files
 from tools.query_converter import QueryConverter, QueryLanguage
 from tools.pdf_to_word import router as pdf_to_word_router
-from tools.device_comparator import compare_devices
+from tools.device_snapshot import DeviceSnapshot
+from tools.similarity import get_similarity_backend
+from tools.device_comparator import (
+    OUTPUT_FORMATS, STALENESS_BUCKETS, ComparisonJobStore, ComparisonSessionStore, bucket_label, check_subnet_prefix,
+    compare_devices, compare_devices_by_staleness, match_inventories, parse_staleness_buckets, stream_report
+)
 import uvicorn
 import os
 from dotenv import load_dotenv
-from typing import List
+from typing import List, Optional
+import json
 import shutil
+import tempfile
 from pathlib import Path
 import io
 import pandas as pd
@@ -78,6 +85,37 @@ templates = Jinja2Templates(directory="templates")
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# Worker processes used for device matching in the device comparator (1 = serial)
+DEVICE_COMPARATOR_WORKERS = int(os.getenv("DEVICE_COMPARATOR_WORKERS", "1"))
+
+# SQLite snapshot of the last device comparison, so unchanged devices are not fuzzy matched again (unset = off)
+DEVICE_COMPARATOR_SNAPSHOT = os.getenv("DEVICE_COMPARATOR_SNAPSHOT")
+device_snapshot = DeviceSnapshot(DEVICE_COMPARATOR_SNAPSHOT) if DEVICE_COMPARATOR_SNAPSHOT else None
+
+# Batched hostname scoring for the device comparator and InsightVM processor
+# ("rapidfuzz"; unset or the pairwise "fuzzywuzzy" reference = pruned pair by pair search)
+similarity_backend = get_similarity_backend(os.getenv("SIMILARITY_BACKEND"))
+
+# Worker processes matching InsightVM files at the same time (1 = one file after another)
+INSIGHTVM_WORKERS = int(os.getenv("INSIGHTVM_WORKERS", "1"))
+
+# Directory where InsightVM hostname matches are kept per inventory file content (unset = reused within one upload only)
+INSIGHTVM_MATCH_CACHE_DIR = os.getenv("INSIGHTVM_MATCH_CACHE_DIR")
+
+# Matched device tables kept for re-querying with other hour windows
+device_sessions = ComparisonSessionStore(
+    max_sessions=int(os.getenv("DEVICE_COMPARATOR_MAX_SESSIONS", "8")),
+    ttl_seconds=int(os.getenv("DEVICE_COMPARATOR_SESSION_TTL", "3600"))
+)
+
+# Background device comparisons, so large runs do not hold a request open until a proxy times out
+device_jobs = ComparisonJobStore(
+    max_workers=int(os.getenv("DEVICE_COMPARATOR_JOB_WORKERS", "2")),
+    max_queued=int(os.getenv("DEVICE_COMPARATOR_JOB_QUEUE", "16")),
+    ttl_seconds=int(os.getenv("DEVICE_COMPARATOR_JOB_TTL", "3600")),
+    max_finished=int(os.getenv("DEVICE_COMPARATOR_MAX_FINISHED_JOBS", "8"))
+)
+
 query_converter = QueryConverter()
 
 @app.get("/", response_class=HTMLResponse)
@@ -236,10 +274,14 @@ async def insightvm_processor_upload(
             insightvm_paths.append(str(file_path))
         
         # Process the files
+        match_cache = MatchCache.for_inventory(str(inventory_path), INSIGHTVM_MATCH_CACHE_DIR)
         output_file = process_insightvm_files(
             insightvm_paths,
             str(inventory_path),
-            str(session_dir)
+            str(session_dir),
+            backend=similarity_backend,
+            cache=match_cache,
+            workers=INSIGHTVM_WORKERS
         )
         
         # Verify the output file exists and is readable
@@ -261,7 +303,10 @@ async def insightvm_processor_upload(
             headers={
                 'Content-Disposition': 'attachment; filename="consolidated_results.xlsx"',
                 'Content-Type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                'Content-Length': str(len(file_content))
+                'Content-Length': str(len(file_content)),
+                'X-Match-Cache-Lookups': str(match_cache.lookups),
+                'X-Match-Cache-Hits': str(match_cache.hits),
+                'X-Match-Cache-Hit-Rate': f"{match_cache.hit_rate:.4f}"
             }
         )
         
@@ -301,6 +346,51 @@ async def device_comparator_form(request: Request):
         }
     )
 
+def save_device_comparator_uploads(jc_file: UploadFile, sentinels_file: UploadFile, agents_file: UploadFile,
+                                   mapping_file: UploadFile, ns_file: Optional[UploadFile]):
+    """
+    Save the uploaded inventories to a new temporary directory.
+
+    Returns the directory, which the caller removes, and the paths of the saved
+    files by name (jc, sentinels, agents, mapping and ns when it was uploaded).
+    """
+    temp_dir = Path(tempfile.mkdtemp(prefix="device_comparator_"))
+    uploads = {"jc": jc_file, "sentinels": sentinels_file, "agents": agents_file, "mapping": mapping_file, "ns": ns_file}
+    paths = {}
+    try:
+        for name, upload in uploads.items():
+            if upload is None:
+                continue
+            # Keep the extension so Excel uploads are read as Excel
+            path = temp_dir / f"{name}{Path(upload.filename or '').suffix or '.csv'}"
+            with open(path, "wb") as f:
+                shutil.copyfileobj(upload.file, f)
+            paths[name] = str(path)
+    except Exception as e:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise HTTPException(status_code=500, detail=f"Error saving uploaded files: {str(e)}")
+    return temp_dir, paths
+
+def check_output_format(output_format: str):
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported output format: {output_format}")
+
+def report_response(report: pd.DataFrame, output_format: str, filename_prefix: str = ""):
+    """Stream the report as a download in chunks, so it starts without building the whole file in memory."""
+    check_output_format(output_format)
+    try:
+        chunks = stream_report(report, output_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    media_type, filename = OUTPUT_FORMATS[output_format]
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename_prefix}{filename}"'
+        }
+    )
+
 @app.post("/device-comparator")
 async def process_device_comparison(
     jc_file: UploadFile = File(...),
@@ -309,173 +399,317 @@ async def process_device_comparison(
     mapping_file: UploadFile = File(...),
     ns_file: UploadFile = None,
     min_hours: int = Form(24),
-    max_hours: int = Form(100)
+    max_hours: int = Form(100),
+    ip_subnet_prefix: Optional[str] = Form(None),
+    reconcile: bool = Form(False),
+    output_format: str = Form("csv")
 ):
     print("\n=== Starting Device Comparison Process ===")
     print(f"Received files: JC={jc_file.filename}, Sentinels={sentinels_file.filename}, Agents={agents_file.filename}, Mapping={mapping_file.filename}")
     print(f"Time range: {min_hours}-{max_hours} hours")
-    
-    temp_dir = None
+    subnet_prefix = subnet_prefix_param(ip_subnet_prefix)
+    if subnet_prefix is not None:
+        print(f"IP subnet matching: /{subnet_prefix}")
+    check_output_format(output_format)
+
+    temp_dir, paths = save_device_comparator_uploads(jc_file, sentinels_file, agents_file, mapping_file, ns_file)
     try:
-        # Create temporary directory for files
-        temp_dir = Path("temp")
-        print(f"\nCreating temporary directory at: {temp_dir.absolute()}")
-        
-        if temp_dir.exists():
-            print("Removing existing temp directory...")
-            shutil.rmtree(temp_dir)
-        
-        temp_dir.mkdir(exist_ok=True)
-        print("Temporary directory created successfully")
-        
-        # Save uploaded files
-        jc_path = temp_dir / "jc_devices.csv"
-        sentinels_path = temp_dir / "sentinels.csv"
-        agents_path = temp_dir / "agents.csv"
-        mapping_path = temp_dir / "mapping.csv"
-        ns_path = temp_dir / "ns_users.csv" if ns_file else None
-        
-        # Save required files with proper encoding
-        try:
-            print("\nSaving JumpCloud file...")
-            content = await jc_file.read()
-            print(f"Read {len(content)} bytes from JumpCloud file")
-            with open(jc_path, "wb") as f:
-                f.write(content)
-            print(f"Successfully saved JumpCloud file to: {jc_path}")
-        except Exception as e:
-            print(f"ERROR saving JumpCloud file: {str(e)}")
-            print(f"Error type: {type(e)}")
-            import traceback
-            print(f"Traceback: {traceback.format_exc()}")
-            raise HTTPException(status_code=500, detail=f"Error saving JumpCloud file: {str(e)}")
-
-        try:
-            print("\nSaving Sentinels file...")
-            content = await sentinels_file.read()
-            print(f"Read {len(content)} bytes from Sentinels file")
-            with open(sentinels_path, "wb") as f:
-                f.write(content)
-            print(f"Successfully saved Sentinels file to: {sentinels_path}")
-        except Exception as e:
-            print(f"ERROR saving Sentinels file: {str(e)}")
-            print(f"Error type: {type(e)}")
-            import traceback
-            print(f"Traceback: {traceback.format_exc()}")
-            raise HTTPException(status_code=500, detail=f"Error saving Sentinels file: {str(e)}")
-
-        try:
-            print("\nSaving Agents file...")
-            content = await agents_file.read()
-            print(f"Read {len(content)} bytes from Agents file")
-            with open(agents_path, "wb") as f:
-                f.write(content)
-            print(f"Successfully saved Agents file to: {agents_path}")
-        except Exception as e:
-            print(f"ERROR saving Agents file: {str(e)}")
-            print(f"Error type: {type(e)}")
-            import traceback
-            print(f"Traceback: {traceback.format_exc()}")
-            raise HTTPException(status_code=500, detail=f"Error saving Agents file: {str(e)}")
-
-        try:
-            print("\nSaving Mapping file...")
-            content = await mapping_file.read()
-            print(f"Read {len(content)} bytes from Mapping file")
-            with open(mapping_path, "wb") as f:
-                f.write(content)
-            print(f"Successfully saved Mapping file to: {mapping_path}")
-        except Exception as e:
-            print(f"ERROR saving Mapping file: {str(e)}")
-            print(f"Error type: {type(e)}")
-            import traceback
-            print(f"Traceback: {traceback.format_exc()}")
-            raise HTTPException(status_code=500, detail=f"Error saving Mapping file: {str(e)}")
-        
-        # Save optional NS file if provided
-        if ns_file:
-            try:
-                print("\nSaving NS file...")
-                content = await ns_file.read()
-                print(f"Read {len(content)} bytes from NS file")
-                with open(ns_path, "wb") as f:
-                    f.write(content)
-                print(f"Successfully saved NS file to: {ns_path}")
-            except Exception as e:
-                print(f"WARNING: Error saving NS file: {str(e)}")
-                print(f"Error type: {type(e)}")
-                import traceback
-                print(f"Traceback: {traceback.format_exc()}")
-        
-        # Process the files
-        try:
-            print("\nStarting device comparison...")
-            print(f"Using files: JC={jc_path}, Sentinels={sentinels_path}, Agents={agents_path}, Mapping={mapping_path}")
-            if ns_path:
-                print(f"Optional NS file: {ns_path}")
-            
-            result_df = compare_devices(
-                str(jc_path),
-                str(sentinels_path),
-                str(agents_path),
-                str(mapping_path),
-                str(ns_path) if ns_path else None,
-                min_hours,
-                max_hours
-            )
-            print("Device comparison completed successfully")
-            print(f"Result DataFrame shape: {result_df.shape}")
-        except Exception as e:
-            print(f"ERROR during device comparison: {str(e)}")
-            print(f"Error type: {type(e)}")
-            import traceback
-            print(f"Traceback: {traceback.format_exc()}")
-            raise HTTPException(status_code=500, detail=f"Error during device comparison: {str(e)}")
-        
-        # Create response
-        try:
-            print("\nCreating CSV output...")
-            output = io.StringIO()
-            result_df.to_csv(output, index=False, encoding='utf-8-sig')
-            print("CSV output created successfully")
-        except Exception as e:
-            print(f"ERROR creating CSV output: {str(e)}")
-            print(f"Error type: {type(e)}")
-            import traceback
-            print(f"Traceback: {traceback.format_exc()}")
-            raise HTTPException(status_code=500, detail=f"Error creating CSV output: {str(e)}")
-        
-        print("\n=== Device Comparison Process Completed Successfully ===")
-        # Return the CSV file
-        return StreamingResponse(
-            iter([output.getvalue()]),
-            media_type="text/csv",
-            headers={
-                "Content-Disposition": f'attachment; filename="device_comparison_results.csv"'
-            }
+        print("\nStarting device comparison...")
+        result_df = compare_devices(
+            paths["jc"],
+            paths["sentinels"],
+            paths["agents"],
+            paths["mapping"],
+            paths.get("ns"),
+            min_hours,
+            max_hours,
+            ip_subnet_prefix=subnet_prefix,
+            workers=DEVICE_COMPARATOR_WORKERS,
+            reconcile=reconcile,
+            snapshot=device_snapshot,
+            similarity_backend=similarity_backend
         )
-        
-    except HTTPException as he:
-        print(f"\nHTTP Exception: {str(he)}")
-        raise he
+        print(f"Device comparison completed successfully, {len(result_df)} rows")
     except Exception as e:
-        print(f"\nUNEXPECTED ERROR: {str(e)}")
-        print(f"Error type: {type(e)}")
+        print(f"ERROR during device comparison: {str(e)}")
         import traceback
         print(f"Traceback: {traceback.format_exc()}")
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error during device comparison: {str(e)}")
     finally:
-        # Clean up temporary files
-        if temp_dir and temp_dir.exists():
-            try:
-                print("\nCleaning up temporary files...")
-                shutil.rmtree(temp_dir)
-                print("Temporary files cleaned up successfully")
-            except Exception as e:
-                print(f"WARNING: Error cleaning up temporary directory: {str(e)}")
-                print(f"Error type: {type(e)}")
-                import traceback
-                print(f"Traceback: {traceback.format_exc()}")
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    print(f"\nStreaming {output_format} output...")
+    return report_response(result_df, output_format)
+
+def staleness_buckets_param(buckets: Optional[str]):
+    if not buckets:
+        return STALENESS_BUCKETS
+    try:
+        return parse_staleness_buckets(buckets)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def subnet_prefix_param(ip_subnet_prefix: Optional[str]) -> Optional[int]:
+    if not ip_subnet_prefix:
+        return None
+    try:
+        subnet_prefix = int(ip_subnet_prefix)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid IP subnet prefix '{ip_subnet_prefix}', expected a number")
+    try:
+        return check_subnet_prefix(subnet_prefix)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def histogram_response(counts: pd.DataFrame, members: pd.DataFrame, output_format: str):
+    """Counts and members as JSON, or the members table (with its Bucket column) as a download."""
+    if output_format == "json":
+        return {
+            "buckets": json.loads(counts.to_json(orient="records")),
+            "members": json.loads(members.to_json(orient="records"))
+        }
+    return report_response(members, output_format, "staleness_")
+
+@app.post("/device-comparator/histogram")
+async def process_device_staleness_histogram(
+    jc_file: UploadFile = File(...),
+    sentinels_file: UploadFile = File(...),
+    agents_file: UploadFile = File(...),
+    mapping_file: UploadFile = File(...),
+    ns_file: UploadFile = None,
+    buckets: Optional[str] = Form(None),
+    ip_subnet_prefix: Optional[str] = Form(None),
+    reconcile: bool = Form(False),
+    output_format: str = Form("json")
+):
+    """Report every staleness bucket (e.g. 24-48,48-100,100-720,720-) from one comparison."""
+    staleness_buckets = staleness_buckets_param(buckets)
+    subnet_prefix = subnet_prefix_param(ip_subnet_prefix)
+    print(f"Staleness buckets: {', '.join(bucket_label(*bucket) for bucket in staleness_buckets)}")
+
+    if output_format != "json":
+        check_output_format(output_format)
+
+    temp_dir, paths = save_device_comparator_uploads(jc_file, sentinels_file, agents_file, mapping_file, ns_file)
+    try:
+        counts, members = compare_devices_by_staleness(
+            paths["jc"],
+            paths["sentinels"],
+            paths["agents"],
+            paths["mapping"],
+            paths.get("ns"),
+            buckets=staleness_buckets,
+            ip_subnet_prefix=subnet_prefix,
+            workers=DEVICE_COMPARATOR_WORKERS,
+            reconcile=reconcile,
+            snapshot=device_snapshot,
+            similarity_backend=similarity_backend
+        )
+    except Exception as e:
+        print(f"ERROR during device comparison: {str(e)}")
+        import traceback
+        print(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Error during device comparison: {str(e)}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if counts.empty:
+        raise HTTPException(status_code=400, detail="Failed to load one or more required files")
+    return histogram_response(counts, members, output_format)
+
+@app.post("/device-comparator/sessions")
+async def create_device_comparison_session(
+    jc_file: UploadFile = File(...),
+    sentinels_file: UploadFile = File(...),
+    agents_file: UploadFile = File(...),
+    mapping_file: UploadFile = File(...),
+    ns_file: UploadFile = None,
+    ip_subnet_prefix: Optional[str] = Form(None),
+    reconcile: bool = Form(False)
+):
+    """Upload and match the inventories once, then query the session with any hour window."""
+    subnet_prefix = subnet_prefix_param(ip_subnet_prefix)
+    temp_dir, paths = save_device_comparator_uploads(jc_file, sentinels_file, agents_file, mapping_file, ns_file)
+    try:
+        devices_df = match_inventories(
+            paths["jc"],
+            paths["sentinels"],
+            paths["agents"],
+            paths["mapping"],
+            paths.get("ns"),
+            ip_subnet_prefix=subnet_prefix,
+            workers=DEVICE_COMPARATOR_WORKERS,
+            reconcile=reconcile,
+            snapshot=device_snapshot,
+            similarity_backend=similarity_backend
+        )
+        if devices_df is None:
+            raise HTTPException(status_code=400, detail="Failed to load one or more required files")
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"ERROR creating device comparison session: {str(e)}")
+        import traceback
+        print(f"Traceback: {traceback.format_exc()}")
+        raise HTTPException(status_code=500, detail=f"Error during device comparison: {str(e)}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    session = device_sessions.add(devices_df, reconcile=reconcile)
+    print(f"Created device comparison session {session.session_id} with {len(devices_df)} devices")
+    return {
+        "session_id": session.session_id,
+        "devices": len(devices_df),
+        "ttl_seconds": device_sessions.ttl_seconds
+    }
+
+@app.post("/device-comparator/sessions/jobs", status_code=202)
+async def submit_device_comparison_session_job(
+    jc_file: UploadFile = File(...),
+    sentinels_file: UploadFile = File(...),
+    agents_file: UploadFile = File(...),
+    mapping_file: UploadFile = File(...),
+    ns_file: UploadFile = None,
+    ip_subnet_prefix: Optional[str] = Form(None),
+    reconcile: bool = Form(False)
+):
+    """Match the inventories in a background job, whose status gives the session id once it is done."""
+    subnet_prefix = subnet_prefix_param(ip_subnet_prefix)
+    temp_dir, paths = save_device_comparator_uploads(jc_file, sentinels_file, agents_file, mapping_file, ns_file)
+
+    def run(timer):
+        return match_inventories(
+            paths["jc"],
+            paths["sentinels"],
+            paths["agents"],
+            paths["mapping"],
+            paths.get("ns"),
+            ip_subnet_prefix=subnet_prefix,
+            workers=DEVICE_COMPARATOR_WORKERS,
+            reconcile=reconcile,
+            timer=timer,
+            snapshot=device_snapshot,
+            similarity_backend=similarity_backend
+        )
+
+    try:
+        job = device_jobs.submit_session(run, device_sessions, reconcile=reconcile,
+                                         cleanup=lambda: shutil.rmtree(temp_dir, ignore_errors=True))
+    except RuntimeError as e:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise HTTPException(status_code=503, detail=str(e))
+    print(f"Queued device comparison session job {job.job_id}")
+    return {
+        "job_id": job.job_id,
+        "status_url": f"/device-comparator/jobs/{job.job_id}",
+        "ttl_seconds": device_jobs.ttl_seconds
+    }
+
+@app.get("/device-comparator/sessions/{session_id}/report")
+async def device_comparison_session_report(
+    session_id: str,
+    min_hours: int = 24,
+    max_hours: int = 100,
+    source: Optional[str] = None,
+    ns: Optional[str] = None,
+    output_format: str = "csv"
+):
+    session = device_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Comparison session not found or expired")
+    check_output_format(output_format)
+    return report_response(session.report(min_hours, max_hours, source=source, ns=ns), output_format)
+
+@app.get("/device-comparator/sessions/{session_id}/histogram")
+async def device_comparison_session_histogram(
+    session_id: str,
+    buckets: Optional[str] = None,
+    output_format: str = "json"
+):
+    session = device_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Comparison session not found or expired")
+    counts, members = session.histogram(staleness_buckets_param(buckets))
+    return histogram_response(counts, members, output_format)
+
+@app.delete("/device-comparator/sessions/{session_id}")
+async def delete_device_comparison_session(session_id: str):
+    if not device_sessions.remove(session_id):
+        raise HTTPException(status_code=404, detail="Comparison session not found or expired")
+    return {"deleted": session_id}
+
+@app.post("/device-comparator/jobs", status_code=202)
+async def submit_device_comparison_job(
+    jc_file: UploadFile = File(...),
+    sentinels_file: UploadFile = File(...),
+    agents_file: UploadFile = File(...),
+    mapping_file: UploadFile = File(...),
+    ns_file: UploadFile = None,
+    min_hours: int = Form(24),
+    max_hours: int = Form(100),
+    ip_subnet_prefix: Optional[str] = Form(None),
+    reconcile: bool = Form(False)
+):
+    """Start a comparison in the background, then poll the job and download its result."""
+    subnet_prefix = subnet_prefix_param(ip_subnet_prefix)
+    temp_dir, paths = save_device_comparator_uploads(jc_file, sentinels_file, agents_file, mapping_file, ns_file)
+
+    def run(timer):
+        return compare_devices(
+            paths["jc"],
+            paths["sentinels"],
+            paths["agents"],
+            paths["mapping"],
+            paths.get("ns"),
+            min_hours,
+            max_hours,
+            ip_subnet_prefix=subnet_prefix,
+            workers=DEVICE_COMPARATOR_WORKERS,
+            reconcile=reconcile,
+            timer=timer,
+            snapshot=device_snapshot,
+            similarity_backend=similarity_backend
+        )
+
+    try:
+        job = device_jobs.submit(run, cleanup=lambda: shutil.rmtree(temp_dir, ignore_errors=True))
+    except RuntimeError as e:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise HTTPException(status_code=503, detail=str(e))
+    print(f"Queued device comparison job {job.job_id}")
+    return {
+        "job_id": job.job_id,
+        "status_url": f"/device-comparator/jobs/{job.job_id}",
+        "result_url": f"/device-comparator/jobs/{job.job_id}/result",
+        "ttl_seconds": device_jobs.ttl_seconds
+    }
+
+def device_comparison_job(job_id: str):
+    job = device_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Comparison job not found or expired")
+    return job
+
+@app.get("/device-comparator/jobs/{job_id}")
+async def device_comparison_job_status(job_id: str):
+    return device_comparison_job(job_id).progress()
+
+@app.get("/device-comparator/jobs/{job_id}/result")
+async def device_comparison_job_result(job_id: str, output_format: str = "csv"):
+    job = device_comparison_job(job_id)
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=f"Error during device comparison: {job.error}")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Comparison job is {job.status}")
+    if job.session_id is not None:
+        raise HTTPException(status_code=409, detail=f"Comparison job has no report, query session {job.session_id}")
+    return report_response(job.result, output_format)
+
+@app.delete("/device-comparator/jobs/{job_id}")
+async def delete_device_comparison_job(job_id: str):
+    if not device_jobs.remove(job_id):
+        raise HTTPException(status_code=404, detail="Comparison job not found or expired")
+    return {"deleted": job_id}
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
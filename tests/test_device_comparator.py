@@ -0,0 +1,591 @@
+import gzip
+import io
+import os
+import random
+import string
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+from datetime import datetime, timedelta
+
+import pandas as pd
+from fuzzywuzzy import fuzz
+
+from tools import device_comparator
+from tools.device_comparator import (
+    AGENT_MATCH_METHODS,
+    DEVICE_COLUMNS,
+    REPORT_COLUMNS,
+    AgentIPIndex,
+    ComparisonJobStore,
+    ComparisonSessionStore,
+    DisjointSet,
+    SOURCE_SPECS,
+    HostnameCandidateIndex,
+    StageTimer,
+    build_staleness_histogram,
+    build_staleness_report,
+    compact_frame,
+    compare_devices,
+    build_first_match_index,
+    build_match_context,
+    detect_date_format,
+    extract_ip_table,
+    extract_ips,
+    fill_missing,
+    flatten_ranges,
+    ip_address_lists,
+    ip_table,
+    load_data,
+    match_devices,
+    match_inventories,
+    parse_date,
+    parse_date_column,
+    parse_staleness_buckets,
+    prepare_agents,
+    sniff_encoding,
+    stream_report,
+)
+
+
+def exhaustive_best_match(hostname, agent_hostnames, threshold=70):
+    matches = []
+    for position, agent_hostname in enumerate(agent_hostnames):
+        score = fuzz.ratio(hostname, agent_hostname.lower())
+        if score > threshold:
+            matches.append((position, score))
+    matches.sort(key=lambda x: x[1], reverse=True)
+    return matches[0] if matches else (None, 0)
+
+
+class TestHostnameCandidateIndex(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(42)
+        alphabet = string.ascii_lowercase + string.digits + '-'
+        self.agents = []
+        for _ in range(400):
+            owner = ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 8)))
+            self.agents.append(f"{owner}-{rng.choice(['mbp', 'laptop', 'pc'])}{rng.randint(1, 9)}")
+        self.queries = []
+        for agent in self.agents[:150]:
+            chars = list(agent)
+            for _ in range(rng.randint(0, 3)):
+                chars[rng.randrange(len(chars))] = rng.choice(alphabet)
+            self.queries.append(''.join(chars).upper())
+        self.queries += ['', 'n/a', 'unknown-host']
+
+    def test_best_match_equals_exhaustive_search(self):
+        index = HostnameCandidateIndex(self.agents)
+        for query in self.queries:
+            expected = exhaustive_best_match(query.lower(), self.agents)
+            self.assertEqual(index.best_match(query.lower()), expected, query)
+
+    def test_candidates_are_a_small_subset(self):
+        index = HostnameCandidateIndex(self.agents)
+        self.assertLess(len(index.candidates(self.agents[0])), len(self.agents) / 2)
+
+    def test_ties_go_to_first_agent(self):
+        index = HostnameCandidateIndex(['host-b', 'HOST-A', 'host-a'])
+        self.assertEqual(index.best_match('host-a'), (1, 100))
+
+
+class TestBuildFirstMatchIndex(unittest.TestCase):
+    def test_keeps_first_occurrence(self):
+        index = build_first_match_index(['a', 'b', 'a', 'N/A', 'N/A'])
+        self.assertEqual(index, {'a': 0, 'b': 1, 'N/A': 3})
+
+    def test_skips_missing_values(self):
+        index = build_first_match_index([float('nan'), 'host', None])
+        self.assertEqual(index, {'host': 1})
+
+
+class TestAgentIPIndex(unittest.TestCase):
+    def test_exact_match_returns_first_agent(self):
+        index = AgentIPIndex(['N/A', '10.0.0.5', '10.0.0.7', '10.0.0.5'])
+        self.assertEqual(index.match(['10.0.0.7', '10.0.0.5']), (1, 'IP Address'))
+        self.assertEqual(index.match(['10.0.0.9']), (None, None))
+
+    def test_subnet_match(self):
+        index = AgentIPIndex(['10.0.1.5', '10.0.0.5', '192.168.0.0/16', '2001:db8::1'], subnet_prefix=24)
+        self.assertEqual(index.match(['10.0.0.200']), (1, 'IP Subnet'))
+        self.assertEqual(index.match(['192.168.44.1']), (2, 'IP Subnet'))
+        self.assertEqual(index.match(['2001:db8::ffff']), (3, 'IP Subnet'))
+        self.assertEqual(index.match(['10.0.1.5', '10.0.0.1']), (0, 'IP Address'))
+        self.assertEqual(index.match(['172.16.0.1']), (None, None))
+
+    def test_subnet_prefix_out_of_range(self):
+        for prefix in (0, -8, 33):
+            with self.assertRaises(ValueError):
+                AgentIPIndex(['10.0.0.1', '192.168.1.5'], subnet_prefix=prefix)
+
+    def test_match_table_matches_each_device(self):
+        index = AgentIPIndex(['10.0.1.5', '10.0.0.5', '192.168.0.0/16'], subnet_prefix=24)
+        addresses = ip_table([0, 0, 1, 3, 3], ['10.0.0.5', '10.0.1.5', '172.16.0.1', '192.168.44.1', '10.0.0.9'])
+        positions, methods = index.match_table(addresses, 4)
+        self.assertEqual(positions.tolist(), [0, -1, -1, 1])
+        self.assertEqual([AGENT_MATCH_METHODS[method] for method in methods], ['IP Address', '', '', 'IP Subnet'])
+
+    def test_flatten_ranges_keeps_lowest_position(self):
+        starts, ends, positions = flatten_ranges([(0, 100, 2), (10, 20, 0), (15, 30, 1)])
+        self.assertEqual(list(zip(starts, ends, positions)), [(0, 9, 2), (10, 20, 0), (21, 30, 1), (31, 100, 2)])
+
+
+class TestExtractIPTable(unittest.TestCase):
+    def test_same_addresses_as_extract_ips(self):
+        values = pd.Series([
+            "['10.0.0.1', 'bad', '::1']", '10.0.0.2', ' 10.0.0.3 ', "['', '10.0.0.4'", '[]', 'N/A', float('nan'), 7,
+            "[\"10.0.0.5\", '300.1.1.1', 'a' '10.0.0.6']"
+        ], dtype=object)
+        table = extract_ip_table(values)
+        self.assertEqual(ip_address_lists(table, len(values)), [extract_ips(value) for value in values])
+        self.assertEqual(table['device'].tolist(), [0, 0, 1, 2])
+
+
+class TestLoadData(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.text = 'Hostname,Last Seen,Public IP Address,Unused\nJosé-MBP,2025-04-25 17:05:07,10.0.0.1,x\n00123,,N/A,y\n'
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, encoding):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding=encoding, newline='') as f:
+            f.write(self.text)
+        return path
+
+    def assert_loaded(self, df):
+        self.assertEqual(list(df.columns), ['Hostname', 'Last Seen', 'Public IP Address'])
+        self.assertEqual(df['Hostname'].tolist(), ['José-MBP', '00123'])
+        self.assertTrue(pd.isna(df['Last Seen'].iloc[1]))
+        self.assertTrue(pd.isna(df['Public IP Address'].iloc[1]))
+
+    def test_sniff_encoding(self):
+        self.assertEqual(sniff_encoding(self.write('a.csv', 'utf-8')), 'utf-8')
+        self.assertEqual(sniff_encoding(self.write('b.csv', 'utf-8-sig')), 'utf-8-sig')
+        self.assertEqual(sniff_encoding(self.write('c.csv', 'latin1')), 'latin1')
+        self.assertEqual(sniff_encoding(self.write('d.csv', 'utf-16')), 'utf-16')
+
+    def test_loads_only_declared_columns_as_strings(self):
+        for engine in ('c', device_comparator.CSV_ENGINE):
+            with unittest.mock.patch.object(device_comparator, 'CSV_ENGINE', engine):
+                for name, encoding in [('a.csv', 'utf-8'), ('b.csv', 'utf-8-sig'), ('c.csv', 'latin1'), ('d.csv', 'utf-16')]:
+                    self.assert_loaded(load_data(self.write(name, encoding), SOURCE_SPECS['agents']))
+
+    def test_non_utf8_byte_after_sniffed_sample_retries_latin1(self):
+        path = os.path.join(self.tmp.name, 'late.csv')
+        rows = ''.join(f"pc-{i},2025-04-25 17:05:07,10.0.0.1,x\n" for i in range(5000))
+        with open(path, 'w', encoding='latin1', newline='') as f:
+            f.write(self.text.split('\n')[0] + '\n' + rows + 'José-MBP,,,y\n')
+        self.assertEqual(sniff_encoding(path), 'utf-8')
+        for engine in ('c', device_comparator.CSV_ENGINE):
+            with unittest.mock.patch.object(device_comparator, 'CSV_ENGINE', engine):
+                df = load_data(path, SOURCE_SPECS['agents'])
+                self.assertEqual(df.shape, (5001, 3))
+                self.assertEqual(df['Hostname'].iloc[-1], 'José-MBP')
+
+    def test_keeps_date_text_unchanged(self):
+        path = os.path.join(self.tmp.name, 'dates.csv')
+        pd.DataFrame({'Hostname': ['a', 'b'], 'Last Seen': ['2025-04-25T17:05:07.123Z'] * 2}).to_csv(path, index=False)
+        df = load_data(path, SOURCE_SPECS['agents'])
+        self.assertEqual(df['Last Seen'].tolist(), ['2025-04-25T17:05:07.123Z'] * 2)
+
+    def test_jc_spec_keeps_ip_like_columns(self):
+        self.assertTrue(SOURCE_SPECS['jc'].wants('lastContact'))
+        self.assertTrue(SOURCE_SPECS['jc'].wants('Primary IP'))
+        self.assertFalse(SOURCE_SPECS['jc'].wants('os'))
+
+    def test_excel_streaming_read_matches_read_excel_and_is_cached(self):
+        path = os.path.join(self.tmp.name, 'agents.xlsx')
+        pd.DataFrame({
+            'Hostname': ['José-MBP', None, 'pc-3'], 'Last Seen': [datetime(2025, 4, 25, 17, 5, 7), None, '4/25/2025'],
+            'Public IP Address': ['10.0.0.1', None, 7.0], 'Unused': [1, 2, 3]
+        }).to_excel(path, index=False)
+        expected = pd.read_excel(path, usecols=SOURCE_SPECS['agents'].wants, dtype=str)
+
+        cache_dir = os.path.join(self.tmp.name, 'cache')
+        with unittest.mock.patch.object(device_comparator, 'EXCEL_CACHE_DIR', cache_dir):
+            pd.testing.assert_frame_equal(load_data(path, SOURCE_SPECS['agents']), expected)
+            self.assertEqual(os.stat(cache_dir).st_mode & 0o777, 0o700)
+            with unittest.mock.patch.object(device_comparator, 'read_excel_columns', side_effect=AssertionError):
+                pd.testing.assert_frame_equal(load_data(path, SOURCE_SPECS['agents']), expected)
+
+            # Expired columns are dropped and the workbook is read again
+            cached, = os.listdir(cache_dir)
+            os.utime(os.path.join(cache_dir, cached), (0, 0))
+            pd.testing.assert_frame_equal(load_data(path, SOURCE_SPECS['agents']), expected)
+            self.assertGreater(os.stat(os.path.join(cache_dir, cached)).st_mtime, 0)
+
+            # A directory other users can write to is not trusted
+            os.chmod(cache_dir, 0o777)
+            with unittest.mock.patch.object(pd, 'read_parquet', side_effect=AssertionError):
+                pd.testing.assert_frame_equal(load_data(path, SOURCE_SPECS['agents']), expected)
+
+
+class TestCompareDevices(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        now = datetime.now()
+        stale = (now - timedelta(hours=50)).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        fresh = (now - timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        rng = random.Random(7)
+        jc, sentinels, agents, mapping = [], [], [], []
+        for i in range(40):
+            host = f"user{i}-mbp"
+            jc.append({'hostname': host, 'serialNumber': f"SN{i:04d}", 'lastContact': rng.choice([stale, fresh]),
+                       'remoteIP': f"['10.0.0.{i}']"})
+            sentinels.append({'Serial Number': f"SN{i:04d}", 'Last Active': rng.choice([stale, fresh])})
+            agents.append({'Hostname': host.upper() if i % 3 else f"zz{i}", 'Last Seen': rng.choice([stale, fresh]),
+                           'Public IP Address': f"10.0.0.{i}"})
+            mapping.append({'HostName': host.upper(), 'displayname': f"User {i}", 'email': f"user{i}@example.com"})
+        sentinels.append({'Serial Number': 'SN9999', 'Endpoint Name': 'ghost-pc', 'Last Active': stale})
+        self.paths = []
+        for name, rows in [('jc', jc), ('sentinels', sentinels), ('agents', agents), ('mapping', mapping)]:
+            path = os.path.join(self.tmp.name, f"{name}.csv")
+            pd.DataFrame(rows).to_csv(path, index=False)
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_reports_stale_devices(self):
+        report = compare_devices(*self.paths, None, 24, 100)
+        self.assertEqual(list(report.columns), REPORT_COLUMNS)
+        self.assertGreater(len(report), 0)
+        self.assertTrue(report['Status'].str.len().gt(0).all())
+
+    def test_parallel_matches_serial_output(self):
+        with unittest.mock.patch.object(device_comparator, 'datetime') as mock_datetime:
+            mock_datetime.now.return_value = datetime(2099, 1, 1)
+            mock_datetime.strptime = datetime.strptime
+            serial = compare_devices(*self.paths, None, 24, 10 ** 7)
+            parallel = compare_devices(*self.paths, None, 24, 10 ** 7, workers=2)
+        self.assertEqual(serial.to_csv(index=False), parallel.to_csv(index=False))
+
+    def test_reconcile_reports_devices_missing_from_jumpcloud(self):
+        report = compare_devices(*self.paths, None, 24, 100, reconcile=True)
+        self.assertEqual(list(report.columns), REPORT_COLUMNS + ['Sources'])
+        ghost = report[report['DisplayName'] == 'ghost-pc']
+        self.assertEqual(ghost['Sources'].tolist(), ['Sentinel'])
+        self.assertTrue(report['Sources'].str.startswith('JumpCloud, Sentinel').any())
+
+    def test_session_report_matches_compare_devices(self):
+        now = datetime.now() + timedelta(hours=5)
+        session = ComparisonSessionStore().add(match_inventories(*self.paths))
+        with unittest.mock.patch.object(device_comparator, 'datetime') as mock_datetime:
+            mock_datetime.now.return_value = now
+            mock_datetime.strptime = datetime.strptime
+            expected = compare_devices(*self.paths, None, 24, 100)
+        pd.testing.assert_frame_equal(session.report(24, 100, current_time=now), expected)
+        agent_only = session.report(24, 100, source='Agent', current_time=now)
+        self.assertTrue(agent_only['Status'].str.contains('Agent').all())
+
+    def test_stage_timer_records_every_stage(self):
+        started = []
+        timer = StageTimer(callback=started.append)
+        compare_devices(*self.paths, None, 24, 100, timer=timer)
+        self.assertEqual(started, ['load', 'parse', 'match', 'output'])
+        self.assertEqual(list(timer.timings), started)
+        self.assertEqual(list(timer.memory), started)
+        self.assertEqual(timer.tables_mb, {})
+
+        timer = StageTimer(table_memory=True)
+        compare_devices(*self.paths, None, 24, 100, timer=timer)
+        self.assertEqual(list(timer.tables_mb), ['parse'])
+        self.assertIn('tables', timer.summary())
+
+
+class TestMatchDevices(unittest.TestCase):
+    def test_builds_device_table_from_matched_positions(self):
+        seen = pd.Timestamp('2025-04-25 10:00:00')
+        jc_df = pd.DataFrame({
+            'DeviceName': ['Alice-MBP', 'bob-pc', 'carol-ws'],
+            'SerialNumber': ['S1', 'S2', 'S3'],
+            'JC_LastContact': [seen] * 3
+        })
+        addresses = ip_table([1], ['203.0.113.9'])
+        sentinels_df = pd.DataFrame({'SerialNumber': ['S9', 'S1'], 'Sentinel_LastActive': [seen, seen]})
+        agents_df = pd.DataFrame({
+            'Hostname': ['ALICE-MBP.local', 'desktop-1'],
+            'Agent_LastSeen': [seen, seen],
+            'PublicIP': ['198.51.100.1', '203.0.113.9']
+        })
+        mapping_df = pd.DataFrame({
+            'HostName_lower': ['alice-mbp'], 'displayname': ['Alice'], 'email': ['Alice@example.com']
+        })
+        ns_df = pd.DataFrame({'User': ['alice@example.com']})
+        context = build_match_context(sentinels_df, agents_df, mapping_df, ns_df)
+
+        devices = match_devices(jc_df, addresses, context)
+        self.assertEqual(list(devices.columns), DEVICE_COLUMNS)
+        self.assertEqual(devices['DisplayName'].tolist(), ['Alice', 'bob-pc', 'carol-ws'])
+        self.assertEqual(devices['Sentinel_SerialNumber'].tolist(), ['S1', 'Not Found', 'Not Found'])
+        self.assertEqual(devices['Agent_Hostname'].tolist(), ['ALICE-MBP.local', 'desktop-1', 'Not Found'])
+        self.assertEqual(devices['Match_Method'].tolist(), [
+            ['Serial Number', f"Hostname Fuzzy ({fuzz.ratio('alice-mbp', 'alice-mbp.local')}%)"],
+            ['IP Address'],
+            []
+        ])
+        self.assertTrue(pd.isna(devices['Sentinel_LastActive'].iloc[1]))
+        self.assertEqual(devices['NS'].tolist(), ['PRESENT', 'Unknown', 'Unknown'])
+
+
+class TestCompactFrame(unittest.TestCase):
+    def test_repetitive_text_becomes_categorical(self):
+        df = compact_frame(pd.DataFrame({
+            'OS': ['Windows', 'macOS', None, 'Windows'],
+            'Hostname': ['a', 'b', 'c', 'd'],
+            'IPAddresses': [[], ['10.0.0.1'], [], []]
+        }))
+        self.assertEqual(df['OS'].dtype, 'category')
+        self.assertTrue(pd.isna(df['OS'].iloc[2]))
+        self.assertEqual(df['Hostname'].dtype, object)
+        self.assertEqual(df['IPAddresses'].dtype, object)
+        self.assertEqual(fill_missing(df['OS']).tolist(), ['Windows', 'macOS', 'N/A', 'Windows'])
+
+    def test_prepared_agents_keep_missing_cells_missing(self):
+        agents_df = pd.DataFrame({
+            'Hostname': ['pc-1', None, 'pc-3'], 'Last Seen': ['2025-04-25 10:00:00', None, None],
+            'Public IP Address': ['10.0.0.1', '10.0.0.1', None]
+        })
+        prepared = prepare_agents(agents_df)
+        self.assertNotIn('Last Seen', prepared.columns)
+        self.assertIn('Last Seen', agents_df.columns)
+        self.assertEqual(prepared['Agent_LastSeen'].dtype, 'datetime64[ns]')
+        self.assertEqual(prepared['PublicIP'].dtype, 'category')
+        self.assertTrue(prepared['Hostname'].isna().iloc[1])
+
+
+class TestComparisonSessionStore(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.store = ComparisonSessionStore(max_sessions=2, ttl_seconds=60, clock=lambda: self.now)
+        self.devices = pd.DataFrame(columns=DEVICE_COLUMNS)
+
+    def test_sessions_expire_after_ttl_since_last_use(self):
+        session = self.store.add(self.devices)
+        self.now = 50
+        self.assertIs(self.store.get(session.session_id), session)
+        self.now = 100
+        self.assertIs(self.store.get(session.session_id), session)
+        self.now = 161
+        self.assertIsNone(self.store.get(session.session_id))
+
+    def test_least_recently_used_session_is_evicted(self):
+        first = self.store.add(self.devices)
+        second = self.store.add(self.devices)
+        self.store.get(first.session_id)
+        third = self.store.add(self.devices)
+        self.assertIsNone(self.store.get(second.session_id))
+        self.assertIsNotNone(self.store.get(first.session_id))
+        self.assertIsNotNone(self.store.get(third.session_id))
+
+
+class TestComparisonJobStore(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.store = ComparisonJobStore(max_workers=1, max_queued=1, ttl_seconds=60, clock=lambda: self.now)
+
+    def tearDown(self):
+        self.store.shutdown()
+
+    def test_job_reports_stages_and_expires_after_ttl(self):
+        cleaned = threading.Event()
+
+        def run(timer):
+            for stage in ['load', 'parse', 'match']:
+                with timer.stage(stage):
+                    pass
+            return pd.DataFrame({'DisplayName': ['a', 'b']})
+
+        job = self.store.submit(run, cleanup=cleaned.set)
+        job.future.result(timeout=10)
+        progress = job.progress()
+        self.assertEqual(progress['status'], 'done')
+        self.assertEqual(progress['rows'], 2)
+        self.assertEqual([(stage['name'], stage['state']) for stage in progress['stages']],
+                         [('load', 'done'), ('parse', 'done'), ('match', 'done'), ('output', 'pending')])
+        self.assertTrue(cleaned.is_set())
+
+        self.now = 61
+        self.assertIsNone(self.store.get(job.job_id))
+
+    def test_only_most_recent_finished_jobs_are_kept(self):
+        store = ComparisonJobStore(max_workers=1, max_finished=2, clock=lambda: self.now)
+        self.addCleanup(store.shutdown)
+        jobs = []
+        for number in range(3):
+            self.now = number
+            jobs.append(store.submit(lambda timer: pd.DataFrame({'DisplayName': ['a']})))
+            jobs[-1].future.result(timeout=10)
+        self.assertIsNone(store.get(jobs[0].job_id))
+        self.assertEqual([store.get(job.job_id) for job in jobs[1:]], jobs[1:])
+        self.assertEqual(len(store), 2)
+
+    def test_session_job_keeps_devices_as_session(self):
+        sessions = ComparisonSessionStore()
+
+        def run(timer):
+            with timer.stage('match'):
+                return pd.DataFrame({'DisplayName': ['a', 'b']})
+
+        job = self.store.submit_session(run, sessions)
+        job.future.result(timeout=10)
+        progress = job.progress()
+        self.assertEqual(progress['status'], 'done')
+        self.assertIsNone(progress['rows'])
+        self.assertEqual([stage['name'] for stage in progress['stages']], ['match', 'load', 'parse'])
+        self.assertEqual(len(sessions.get(progress['session_id']).devices), 2)
+
+        failed = self.store.submit_session(lambda timer: None, sessions)
+        failed.future.result(timeout=10)
+        self.assertEqual(failed.status, 'failed')
+        self.assertIsNone(failed.session_id)
+
+    def test_failed_job_and_full_queue(self):
+        release = threading.Event()
+
+        def blocked(timer):
+            release.wait(10)
+            raise ValueError('bad export')
+
+        running = self.store.submit(blocked)
+        while running.status == 'queued':
+            time.sleep(0.01)
+        queued = self.store.submit(blocked)
+        with self.assertRaises(RuntimeError):
+            self.store.submit(blocked)
+
+        self.assertTrue(self.store.remove(queued.job_id))
+        self.assertTrue(queued.future.cancelled())
+        release.set()
+        running.future.result(timeout=10)
+        self.assertEqual(running.progress()['status'], 'failed')
+        self.assertEqual(running.error, 'bad export')
+
+
+class TestDisjointSet(unittest.TestCase):
+    def test_union_and_find(self):
+        records = DisjointSet(5)
+        self.assertTrue(records.union(0, 1))
+        self.assertTrue(records.union(3, 4))
+        self.assertTrue(records.union(1, 4))
+        self.assertFalse(records.union(0, 3))
+        self.assertEqual(len({records.find(i) for i in range(5)}), 2)
+        self.assertNotEqual(records.find(2), records.find(0))
+
+
+class TestParseDateColumn(unittest.TestCase):
+    def assert_matches_parse_date(self, values):
+        series = pd.Series(values)
+        expected = pd.to_datetime(series.apply(lambda x: parse_date(x) if not pd.isna(x) else None))
+        pd.testing.assert_series_equal(parse_date_column(series), expected, check_names=False)
+
+    def test_detects_majority_format(self):
+        values = pd.Series(['04/25/2025 17:05', '04/26/2025 08:00', '2025-04-25 17:05:07'])
+        self.assertEqual(detect_date_format(values), '%m/%d/%Y %H:%M')
+
+    def test_uniform_iso_column(self):
+        self.assert_matches_parse_date(['2025-04-25T17:05:07.123Z', '2025-04-26T08:00:00.000Z', None, 'N/A'])
+
+    def test_offsets_keep_wall_clock_time(self):
+        self.assert_matches_parse_date(['2025-04-25T17:05:07+05:30', '2025-04-25T17:05:07-0800', '2025-04-25T17:05:07'])
+
+    def test_mixed_formats_fall_back_per_cell(self):
+        self.assert_matches_parse_date([
+            'Apr 25, 2025 05:05:07 PM', 'Apr 26, 2025 11:00:00 AM', '4/5/2025', '2025-04-25 17:05:07', 'garbage'
+        ])
+
+    def test_dates_out_of_pandas_range_become_nat(self):
+        # 0001-01-01 is the zero time agents report for devices that never checked in
+        parsed = parse_date_column(pd.Series(['2025-04-25T17:05:07Z', '0001-01-01T00:00:00Z', '2300-01-01T00:00:00Z']))
+        self.assertEqual(parsed[0], pd.Timestamp('2025-04-25 17:05:07'))
+        self.assertTrue(parsed[1:].isna().all())
+
+
+class TestBuildStalenessReport(unittest.TestCase):
+    def setUp(self):
+        self.now = datetime(2025, 4, 25, 12, 0, 0)
+
+    def device(self, name, jc_hours=None, sentinel_hours=None, agent_hours=None):
+        def ago(hours):
+            return None if hours is None else self.now - timedelta(hours=hours)
+        return {
+            'DeviceName': name, 'DisplayName': name, 'JC_SerialNumber': 'SN', 'JC_LastContact': ago(jc_hours),
+            'Sentinel_SerialNumber': 'SN', 'Sentinel_LastActive': ago(sentinel_hours), 'Agent_Hostname': name,
+            'Agent_LastSeen': ago(agent_hours), 'Match_Method': [], 'Email': 'Not Found', 'NS': 'Unknown'
+        }
+
+    def test_filters_and_formats_in_range_devices(self):
+        devices = pd.DataFrame([
+            self.device('b-host', jc_hours=30, sentinel_hours=2, agent_hours=50),
+            self.device('a-host', jc_hours=200, sentinel_hours=None, agent_hours=24),
+            self.device('c-host', jc_hours=1, sentinel_hours=2, agent_hours=3),
+        ], columns=DEVICE_COLUMNS)
+        report = build_staleness_report(devices, self.now, 24, 100)
+        self.assertEqual(list(report.columns), REPORT_COLUMNS)
+        self.assertEqual(report['DisplayName'].tolist(), ['a-host', 'b-host'])
+        self.assertEqual(report['Status'].tolist(), ['Agent', 'JumpCloud, Agent'])
+        self.assertEqual(report['Sentinel_LastActive'].tolist(), ['Unknown', '2025-04-25 10:00:00'])
+        self.assertEqual(
+            report['Not_Reported_Summary'].tolist()[0],
+            'JumpCloud: 200.0h, Sentinel: Unknown, Agent: 24.0h'
+        )
+
+    def test_no_devices_in_range_returns_empty_report(self):
+        devices = pd.DataFrame([self.device('c-host', jc_hours=1)], columns=DEVICE_COLUMNS)
+        report = build_staleness_report(devices, self.now, 24, 100)
+        self.assertTrue(report.empty)
+        self.assertEqual(list(report.columns), REPORT_COLUMNS)
+
+    def test_histogram_buckets_match_single_window_reports(self):
+        devices = pd.DataFrame([
+            self.device('b-host', jc_hours=30, sentinel_hours=2, agent_hours=50),
+            self.device('a-host', jc_hours=2000, sentinel_hours=None, agent_hours=24),
+            self.device('c-host', jc_hours=1, sentinel_hours=150, agent_hours=3),
+        ], columns=DEVICE_COLUMNS)
+        counts, members = build_staleness_histogram(devices, self.now, [(24, 48), (48, 100), (100, 720), (720, None)])
+        self.assertEqual(counts['Bucket'].tolist(), ['24-48h', '48-100h', '100-720h', '>720h'])
+        self.assertEqual(counts['Devices'].tolist(), [2, 1, 1, 1])
+        self.assertEqual(counts['Agent'].tolist(), [1, 1, 0, 0])
+        for hours_min, hours_max, label in [(24, 48, '24-48h'), (48, 100, '48-100h'), (100, 720, '100-720h')]:
+            expected = build_staleness_report(devices, self.now, hours_min, hours_max).reset_index(drop=True)
+            bucket = members[members['Bucket'] == label].drop(columns='Bucket').reset_index(drop=True)
+            pd.testing.assert_frame_equal(bucket, expected)
+        self.assertEqual(members[members['Bucket'] == '>720h']['Status'].tolist(), ['JumpCloud'])
+
+    def test_parse_staleness_buckets(self):
+        self.assertEqual(parse_staleness_buckets('24-48, 48-100,720-'), [(24, 48), (48, 100), (720, None)])
+        with self.assertRaises(ValueError):
+            parse_staleness_buckets('100-24')
+
+
+class TestStreamReport(unittest.TestCase):
+    def setUp(self):
+        self.report = pd.DataFrame({
+            'DisplayName': [f"host-{i:03d}" for i in range(25)],
+            'Status': ['JumpCloud'] * 25,
+            'NS': [None] * 24 + ['Enabled']
+        })
+
+    def test_csv_chunks_match_single_write(self):
+        chunks = list(stream_report(self.report, 'csv', chunk_rows=10))
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(b''.join(chunks).decode('utf-8'), self.report.to_csv(index=False))
+
+    def test_gzip_and_parquet_round_trip(self):
+        csv_bytes = b''.join(stream_report(self.report, 'csv', chunk_rows=10))
+        self.assertEqual(gzip.decompress(b''.join(stream_report(self.report, 'csv.gz', chunk_rows=10))), csv_bytes)
+        parquet = pd.read_parquet(io.BytesIO(b''.join(stream_report(self.report, 'parquet', chunk_rows=10))))
+        pd.testing.assert_frame_equal(parquet, self.report)
+
+    def test_unknown_format_is_rejected_before_streaming(self):
+        with self.assertRaises(ValueError):
+            stream_report(self.report, 'xml')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import random
+import string
+import tempfile
+import unittest
+
+import pandas as pd
+
+from tools.device_comparator import HostnameCandidateIndex, match_inventories
+from tools.device_snapshot import DeviceSnapshot, SnapshotHostnameMatcher
+
+
+def random_hostnames(rng, count):
+    return [
+        ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 8))) + rng.choice(['-mbp', '-pc', ''])
+        for _ in range(count)
+    ]
+
+
+class TestSnapshotHostnameMatcher(unittest.TestCase):
+    def test_reused_matches_equal_full_matching(self):
+        rng = random.Random(11)
+        agents = random_hostnames(rng, 300)
+        devices = [name if rng.random() < 0.5 else name[:-1] + 'x' for name in rng.sample(agents, 150)]
+
+        first = SnapshotHostnameMatcher(HostnameCandidateIndex(agents), {}, set())
+        first.resolve(devices)
+
+        # Next day: some agents are gone, some are new and some are near copies of existing ones
+        next_agents = agents[20:] + [name + 'z' for name in agents[:30]] + random_hostnames(rng, 20)
+        rng.shuffle(next_agents)
+        index = HostnameCandidateIndex(next_agents)
+        matcher = SnapshotHostnameMatcher(index, first.resolved, set(first.first_position))
+        for hostname in devices:
+            self.assertEqual(matcher.best_match(hostname), index.best_match(hostname), hostname)
+        self.assertGreater(matcher.reused, 0)
+        self.assertGreater(matcher.rematched, 0)
+
+
+class TestDeviceSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        rng = random.Random(5)
+        hosts = random_hostnames(rng, 60)
+        self.frames = {
+            'jc': pd.DataFrame({
+                'hostname': hosts, 'serialNumber': [f"SN{i}" for i in range(60)],
+                'lastContact': ['2025-04-24T10:00:00.000Z'] * 60, 'remoteIP': [f"10.1.0.{i}" for i in range(60)]
+            }),
+            'sentinels': pd.DataFrame({'Serial Number': [f"SN{i}" for i in range(0, 60, 2)],
+                                       'Last Active': ['Apr 24, 2025 10:00:00 AM'] * 30}),
+            'agents': pd.DataFrame({'Hostname': [host.upper() + 'a' for host in hosts[:50]],
+                                    'Last Seen': ['2025-04-24 10:00:00'] * 50,
+                                    'Public IP Address': [f"10.1.0.{i}" for i in range(50)]}),
+            'mapping': pd.DataFrame({'HostName': hosts, 'displayname': hosts, 'email': [f"{h}@example.com" for h in hosts]})
+        }
+        self.snapshot = DeviceSnapshot(os.path.join(self.tmp.name, 'snapshot.db'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self):
+        paths = []
+        for name in ['jc', 'sentinels', 'agents', 'mapping']:
+            path = os.path.join(self.tmp.name, f"{name}.csv")
+            self.frames[name].to_csv(path, index=False)
+            paths.append(path)
+        return paths
+
+    def test_incremental_run_matches_full_run(self):
+        match_inventories(*self.write(), snapshot=self.snapshot)
+        self.assertEqual(self.snapshot.stats['jumpcloud']['added'], 60)
+
+        self.frames['jc'].loc[3, 'hostname'] = 'renamed-host'
+        self.frames['agents'] = self.frames['agents'].drop(index=[7, 8])
+        paths = self.write()
+        incremental = match_inventories(*paths, snapshot=self.snapshot)
+        full = match_inventories(*paths)
+
+        pd.testing.assert_frame_equal(incremental, full)
+        self.assertEqual(self.snapshot.stats['jumpcloud']['changed'], 1)
+        self.assertEqual(self.snapshot.stats['agents']['removed'], 2)
+        self.assertGreater(self.snapshot.stats['hostnames']['reused'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import random
+import string
+import unittest
+
+from fuzzywuzzy import fuzz
+
+from tools.hostname_normalization import canonical_hostname, hostname_forms, token_set_ratio, token_sort_ratio
+
+
+class TestHostnameForms(unittest.TestCase):
+    def test_forms(self):
+        forms = hostname_forms(' JSmiths-MBP.corp.example.com ')
+        self.assertEqual(forms.canonical, 'jsmiths-mbp.corp.example.com')
+        self.assertEqual(forms.domainless, 'jsmiths-mbp')
+        self.assertEqual(forms.owner, 'jsmiths')
+        self.assertEqual(forms.owner_alt, 'jsmiths')
+        self.assertEqual(hostname_forms('workstation').owner, '')
+        self.assertIs(hostname_forms('Host-A'), hostname_forms('Host-A'))
+        self.assertEqual(canonical_hostname(float('nan')), 'nan')
+
+    def test_token_ratios_equal_fuzzywuzzy(self):
+        rng = random.Random(7)
+        alphabet = string.ascii_letters + string.digits + ' -._'
+        hostnames = [''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 16))) for _ in range(200)]
+        hostnames += ['', ' ', '---', 'a b a', 'b a']
+        for a, b in zip(hostnames, reversed(hostnames)):
+            forms_a, forms_b = hostname_forms(a), hostname_forms(b)
+            self.assertEqual(token_set_ratio(forms_a, forms_b), fuzz.token_set_ratio(forms_a.canonical, forms_b.canonical))
+            self.assertEqual(token_sort_ratio(forms_a, forms_b), fuzz.token_sort_ratio(forms_a.canonical, forms_b.canonical))
+
+
+if __name__ == '__main__':
+    unittest.main()
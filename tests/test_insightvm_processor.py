@@ -0,0 +1,178 @@
+import os
+import random
+import string
+import tempfile
+import unittest
+import unittest.mock
+
+import pandas as pd
+
+from tools.hostname_normalization import hostname_forms
+from tools import insightvm_processor
+from tools.insightvm_processor import (
+    EnrichmentIndex,
+    MatchCache,
+    combined_hostname_score,
+    improved_fuzzy_match_hostname,
+    match_hostnames,
+    match_hostnames_batch,
+    owner_prefix,
+    process_insightvm_files,
+)
+from tools.similarity import RapidfuzzBackend, SimilarityBackend
+
+
+def random_hostname(rng):
+    owner = ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(0, 8)))
+    return rng.choice(['', '-', 'S-']) + owner + rng.choice(['s-mbp', '-PC', '-laptop.corp.local', '', ' ws 01'])
+
+
+class TestHostnameMatching(unittest.TestCase):
+    def test_batch_matches_equal_pairwise_matches(self):
+        rng = random.Random(3)
+        enrichment_data = {random_hostname(rng): {} for _ in range(150)}
+        hostnames = [random_hostname(rng) for _ in range(80)]
+        expected = [improved_fuzzy_match_hostname(hostname, enrichment_data) for hostname in hostnames]
+        self.assertEqual(match_hostnames_batch(hostnames, list(enrichment_data), backend=RapidfuzzBackend()), expected)
+        self.assertTrue(any(match for match, _ in expected))
+
+    def test_pairwise_backend_uses_pruned_search(self):
+        rng = random.Random(5)
+        enrichment_data = {random_hostname(rng): {} for _ in range(150)}
+        hostnames = [random_hostname(rng) for _ in range(40)]
+        expected = [improved_fuzzy_match_hostname(hostname, enrichment_data) for hostname in hostnames]
+        backend = SimilarityBackend()
+        with unittest.mock.patch.object(backend, 'score_matrix') as score_matrix:
+            self.assertEqual(match_hostnames_batch(hostnames, list(enrichment_data), backend=backend), expected)
+        score_matrix.assert_not_called()
+
+    def test_enrichment_index_holds_normalized_forms(self):
+        index = EnrichmentIndex({'JSmiths-MBP.corp.local': {}, 'workstation': {}})
+        self.assertEqual(index.names, ['jsmiths-mbp.corp.local', 'workstation'])
+        self.assertEqual(index.owners, ['jsmiths', ''])
+        self.assertEqual(index.owner_alts, ['jsmiths', ''])
+        self.assertEqual(index.has_owner.tolist(), [True, False])
+        self.assertEqual(improved_fuzzy_match_hostname('jsmith-mbp', {}, index=index),
+                         improved_fuzzy_match_hostname('jsmith-mbp', {'JSmiths-MBP.corp.local': {}, 'workstation': {}}))
+
+    def test_pruned_matches_equal_scoring_every_hostname(self):
+        rng = random.Random(5)
+        inventory = [random_hostname(rng) for _ in range(200)]
+        # Exact hits, including ones that tie with an earlier hostname of the same owner
+        inventory += ['jdoe-mbp.', 'jdoe-mbp', 'workstation', 'workstation-2']
+        index = EnrichmentIndex(inventory)
+        hostnames = [random_hostname(rng) for _ in range(60)] + rng.sample(inventory, 20)
+        hostnames += ['JDOE-MBP', 'workstation']
+        for hostname in hostnames:
+            query = hostname_forms(hostname)
+            scores = [combined_hostname_score(query, owner_prefix(query), forms) for forms in index.forms]
+            self.assertTrue((index.score_bounds(query, owner_prefix(query)) >= scores).all(), hostname)
+
+            best = max(scores)
+            expected = (inventory[scores.index(best)], best) if best >= 65 else (None, 0)
+            self.assertEqual(index.best_match(hostname), expected, hostname)
+        self.assertEqual(index.best_match('jdoe-mbp')[0], 'jdoe-mbp.')
+        self.assertEqual(index.best_match('workstation')[0], 'workstation-2')
+
+
+class TestMatchCache(unittest.TestCase):
+    def test_cached_matches_equal_fresh_matches(self):
+        rng = random.Random(9)
+        enrichment_data = {random_hostname(rng): {} for _ in range(100)}
+        index = EnrichmentIndex(enrichment_data)
+        hostnames = [random_hostname(rng) for _ in range(40)]
+        expected = [index.best_match(hostname) for hostname in hostnames]
+
+        cache = MatchCache(max_entries=1000)
+        self.assertEqual(match_hostnames(hostnames, index, cache=cache), expected)
+        # A second file with the same hosts, differently cased, is answered from the cache
+        second = [hostname.upper() + ' ' for hostname in hostnames]
+        self.assertEqual(match_hostnames(second, index, backend=RapidfuzzBackend(), cache=cache), expected)
+        self.assertEqual(cache.lookups, 80)
+        self.assertEqual(cache.misses, len({hostname_forms(hostname).canonical for hostname in hostnames}))
+
+        small = MatchCache(max_entries=5)
+        self.assertEqual(match_hostnames(hostnames, index, cache=small), expected)
+        self.assertEqual(len(small), 5)
+
+    def test_hits_survive_eviction_by_new_matches(self):
+        index = EnrichmentIndex({'host-a': {}, 'host-b': {}})
+        tiny = MatchCache(max_entries=1)
+        match_hostnames(['host-a'], index, cache=tiny)
+        # host-a is a hit, then host-b's match evicts it before the results are returned
+        self.assertEqual(match_hostnames(['host-a', 'host-b', 'HOST-A'], index, cache=tiny),
+                         [('host-a', 100.0), ('host-b', 100.0), ('host-a', 100.0)])
+        self.assertEqual(tiny.hits, 2)
+
+    def test_persisted_per_inventory_content(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            inventory = os.path.join(tmp, 'inventory.csv')
+            with open(inventory, 'w') as file:
+                file.write('Hostname\nhost-a\n')
+            index = EnrichmentIndex({'host-a': {}})
+
+            cache = MatchCache.for_inventory(inventory, os.path.join(tmp, 'cache'))
+            match_hostnames(['host-a', 'other'], index, cache=cache)
+            cache.save()
+
+            reloaded = MatchCache.for_inventory(inventory, os.path.join(tmp, 'cache'))
+            self.assertEqual(match_hostnames(['HOST-A', 'other'], index, cache=reloaded), [('host-a', 100.0), (None, 0)])
+            self.assertEqual(reloaded.hit_rate, 1.0)
+
+            with open(inventory, 'a') as file:
+                file.write('host-b\n')
+            self.assertEqual(len(MatchCache.for_inventory(inventory, os.path.join(tmp, 'cache'))), 0)
+            self.assertEqual(len(MatchCache.for_inventory(inventory)), 0)
+
+
+class TestProcessInsightVMFiles(unittest.TestCase):
+    def test_parallel_workbook_equals_serial_workbook(self):
+        rng = random.Random(13)
+        inventory = [random_hostname(rng) for _ in range(120)]
+        with tempfile.TemporaryDirectory() as tmp:
+            inventory_csv = os.path.join(tmp, 'inventory.csv')
+            pd.DataFrame({'hostname': inventory, 'displayName': [name.upper() for name in inventory],
+                          'serialNumber': [f"SN{i}" for i in range(len(inventory))]}).to_csv(inventory_csv, index=False)
+            files = []
+            for number in range(4):
+                path = os.path.join(tmp, f"scan{number}.csv")
+                hostnames = rng.sample(inventory, 20) + [random_hostname(rng) for _ in range(20)]
+                pd.DataFrame({'Asset Name': hostnames}).to_csv(path, index=False)
+                files.append(path)
+            files.append(os.path.join(tmp, 'missing.csv'))
+
+            serial_cache, parallel_cache = MatchCache(), MatchCache()
+            serial = pd.read_excel(process_insightvm_files(files, inventory_csv, os.path.join(tmp, 'serial'),
+                                                           cache=serial_cache), sheet_name=None)
+            parallel = pd.read_excel(process_insightvm_files(files, inventory_csv, os.path.join(tmp, 'parallel'),
+                                                             cache=parallel_cache, workers=2), sheet_name=None)
+
+        self.assertEqual(list(parallel), ['scan0', 'scan1', 'scan2', 'scan3', 'Unmatched_Assets'])
+        self.assertEqual(list(parallel), list(serial))
+        for name in serial:
+            pd.testing.assert_frame_equal(parallel[name], serial[name])
+        self.assertEqual(parallel_cache.lookups, serial_cache.lookups)
+        self.assertEqual(dict(parallel_cache.items()), dict(serial_cache.items()))
+
+    def test_worker_spools_rows_in_chunks(self):
+        enrichment_data = {'host-a': {'displayName': 'A', 'serialNumber': 'SN1'}}
+        with tempfile.TemporaryDirectory() as tmp:
+            scan = os.path.join(tmp, 'scan.csv')
+            pd.DataFrame({'Asset Name': ['host-a', 'other', 'HOST-A', 'elsewhere', 'host-a']}).to_csv(scan, index=False)
+            insightvm_processor._init_file_worker(enrichment_data, EnrichmentIndex(enrichment_data), None, [], 10)
+            spool_prefix = os.path.join(tmp, '0')
+            lookups, misses, matches = insightvm_processor._process_file_in_worker(scan, spool_prefix)
+            # Only counts and matches come back, the rows are in the spool files
+            self.assertEqual((lookups, misses), (5, 3))
+            self.assertEqual(len(matches), 3)
+
+            chunks = list(insightvm_processor.iter_spooled_file(spool_prefix, chunk_rows=2))
+            self.assertEqual([asset["Hostname"] for matched, _ in chunks for asset in matched],
+                             ['host-a', 'HOST-A', 'host-a'])
+            self.assertEqual([hostname for _, unmatched in chunks for hostname in unmatched], ['other', 'elsewhere'])
+            self.assertTrue(all(len(matched) <= 2 and len(unmatched) <= 2 for matched, unmatched in chunks))
+            self.assertEqual(os.listdir(tmp), ['scan.csv'])
+
+
+if __name__ == '__main__':
+    unittest.main()
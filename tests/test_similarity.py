@@ -0,0 +1,40 @@
+import random
+import unittest
+
+import numpy as np
+
+from tools.similarity import SCORERS, RapidfuzzBackend, SimilarityBackend, get_similarity_backend
+
+
+def random_hostnames(rng, count):
+    tokens = ['jsmith', 'mbp', 'pc', 'laptop', 'ws', '01', 'corp', 'local', 'smiths', 'x1', '']
+    return [
+        rng.choice(['', ' ', 'J']) + '-'.join(rng.choice(tokens) + rng.choice(['', 'x', '.c']) for _ in range(rng.randint(0, 4)))
+        for _ in range(count)
+    ]
+
+
+class TestSimilarityBackends(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(3)
+        self.queries = random_hostnames(rng, 40)
+        self.candidates = random_hostnames(rng, 60)
+
+    def test_rapidfuzz_scores_equal_fuzzywuzzy(self):
+        reference, batched = SimilarityBackend(), RapidfuzzBackend()
+        for scorer in SCORERS:
+            expected = reference.score_matrix(self.queries, self.candidates, scorer)
+            scores = batched.score_matrix(self.queries, self.candidates, scorer)
+            if scorer in batched.exact_scorers:
+                np.testing.assert_array_equal(scores, expected, err_msg=scorer)
+            else:
+                self.assertTrue((scores >= expected).all(), scorer)
+
+    def test_unknown_backend(self):
+        self.assertIsNone(get_similarity_backend(None))
+        with self.assertRaises(ValueError):
+            get_similarity_backend('levenshtein')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from tools.streaming_workbook import StreamingWorkbook
+
+
+class TestStreamingWorkbook(unittest.TestCase):
+    def test_sheets_split_past_max_rows(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'report.xlsx')
+            with StreamingWorkbook(path, max_rows=4) as workbook:
+                sheet = workbook.sheet('scan', ['Hostname', 'Serial Number'])
+                sheet.extend({'Hostname': f"host-{i}", 'Serial Number': '0012'} for i in range(7))
+                workbook.sheet('SCAN', ['Hostname']).append({'Hostname': '=1+1'})
+                workbook.sheet('empty', ['Hostname'])
+            sheets = pd.read_excel(path, sheet_name=None, dtype=str)
+
+        self.assertEqual(list(sheets), ['scan', 'scan_2', 'scan_3', 'SCAN_4', 'empty'])
+        self.assertEqual(sheet.sheet_names, ['scan', 'scan_2', 'scan_3'])
+        self.assertEqual(sheet.rows, 7)
+        self.assertEqual(pd.concat([sheets['scan'], sheets['scan_2'], sheets['scan_3']])['Hostname'].tolist(),
+                         [f"host-{i}" for i in range(7)])
+        self.assertEqual(sheets['scan']['Serial Number'].tolist(), ['0012'] * 3)
+        # Text that looks like a formula stays text
+        self.assertEqual(sheets['SCAN_4']['Hostname'].tolist(), ['=1+1'])
+        self.assertTrue(sheets['empty'].empty)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,9 +2,24 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import ipaddress
+import codecs
+import multiprocessing
+import hashlib
+import os
 import re
 import sys
-from typing import Dict, List, Optional, Union
+import threading
+import time
+import uuid
+import zlib
+from bisect import bisect_right
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+from heapq import heappop, heappush
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
 from pathlib import Path
 
 # Check for fuzzywuzzy or python-Levenshtein
@@ -22,9 +37,62 @@ except ImportError:
         print("Please install manually with: pip install fuzzywuzzy python-Levenshtein")
         sys.exit(1)
 
+from tools.hostname_normalization import canonical_hostname, hostname_forms, normalize_hostnames
+from tools.similarity import SimilarityBackend
+
+# Use the multithreaded pyarrow CSV parser when it is installed
+try:
+    import pyarrow
+    from pyarrow import csv as pyarrow_csv
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+CSV_ENGINE = 'pyarrow' if HAS_PYARROW else 'c'
+# pyarrow reports bytes that do not decode as ArrowInvalid instead of UnicodeDecodeError
+CSV_DECODE_ERRORS = (UnicodeDecodeError, pyarrow.ArrowInvalid) if HAS_PYARROW else (UnicodeDecodeError,)
+
+# Stream .xlsx sheets with openpyxl's read-only reader when it is installed
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# Peak resident memory for the stage memory report, not available on Windows
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Cells read as missing, the same defaults pandas.read_csv uses
+NA_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'
+]
+
+# Placeholder shown, and matched on, for cells a source left empty
+MISSING_VALUE = 'N/A'
+
+# Text columns with at most this share of distinct values are stored as categoricals
+CATEGORY_MAX_DISTINCT_RATIO = 0.5
+
+# Formats tried in order by parse_date
+DATE_FORMATS = [
+    "%Y-%m-%dT%H:%M:%S%z",     # ISO format with timezone
+    "%Y-%m-%dT%H:%M:%S.%f%z",   # ISO format with milliseconds and timezone
+    "%Y-%m-%dT%H:%M:%S.%fZ",    # ISO format with Z
+    "%Y-%m-%dT%H:%M:%S.%f",     # ISO format with milliseconds
+    "%Y-%m-%dT%H:%M:%S",        # ISO format
+    "%m/%d/%Y %H:%M",           # MM/DD/YYYY HH:MM
+    "%Y-%m-%d %H:%M:%S",        # YYYY-MM-DD HH:MM:SS
+    "%b %d, %Y %I:%M:%S %p"     # Apr 25, 2025 05:05:07 PM
+]
+
+# Trailing UTC offset as accepted by strptime's %z
+UTC_OFFSET_PATTERN = r'(?:Z|[+-]\d{2}:?\d{2}(?::?\d{2}(?:\.\d{1,6})?)?)$'
+
 def parse_date(date_str, format_str=None):
     """Parse date string to datetime object with various formats."""
-    if pd.isna(date_str) or date_str == "N/A":
+    if pd.isna(date_str) or date_str == MISSING_VALUE:
         return None
     
     # Convert to string if not already (handles potential numeric timestamps)
@@ -39,18 +107,7 @@ def parse_date(date_str, format_str=None):
             pass
     
     # Try various formats
-    formats = [
-        "%Y-%m-%dT%H:%M:%S%z",     # ISO format with timezone
-        "%Y-%m-%dT%H:%M:%S.%f%z",   # ISO format with milliseconds and timezone
-        "%Y-%m-%dT%H:%M:%S.%fZ",    # ISO format with Z
-        "%Y-%m-%dT%H:%M:%S.%f",     # ISO format with milliseconds
-        "%Y-%m-%dT%H:%M:%S",        # ISO format
-        "%m/%d/%Y %H:%M",           # MM/DD/YYYY HH:MM
-        "%Y-%m-%d %H:%M:%S",        # YYYY-MM-DD HH:MM:SS
-        "%b %d, %Y %I:%M:%S %p"     # Apr 25, 2025 05:05:07 PM
-    ]
-    
-    for fmt in formats:
+    for fmt in DATE_FORMATS:
         try:
             dt = datetime.strptime(date_str, fmt)
             # If the datetime has a timezone, convert to naive by replacing with local time
@@ -77,11 +134,100 @@ def parse_date(date_str, format_str=None):
     print(f"Warning: Could not parse date: {date_str}")
     return None
 
+def match_date_format(date_str: str) -> Optional[str]:
+    """Return the first entry of DATE_FORMATS that parses the string, or None."""
+    for fmt in DATE_FORMATS:
+        try:
+            datetime.strptime(date_str, fmt)
+            return fmt
+        except (ValueError, TypeError):
+            continue
+    return None
+
+def detect_date_format(values: pd.Series, sample_size: int = 100) -> Optional[str]:
+    """
+    Detect the date format used by a column from a sample of its values.
+
+    Returns the format that parse_date picks for most of the sampled values,
+    or None if none of them parse with a known format.
+    """
+    counts = {}
+    for value in values.head(sample_size):
+        fmt = match_date_format(value)
+        if fmt is not None:
+            counts[fmt] = counts.get(fmt, 0) + 1
+    if not counts:
+        return None
+    # Ties go to the format parse_date would try first
+    return max(DATE_FORMATS, key=lambda fmt: counts.get(fmt, 0))
+
+def parse_date_column(series: pd.Series, sample_size: int = 100) -> pd.Series:
+    """
+    Parse a whole column of dates with a single vectorized conversion.
+
+    The format is detected once from a sample and applied to every cell. Only
+    cells that do not fit it are passed to parse_date one by one. Missing and
+    'N/A' cells become NaT, and timezones are dropped the same way parse_date does.
+    """
+    result = pd.Series(pd.NaT, index=series.index, dtype='datetime64[ns]')
+    present = series.notna() & (series != MISSING_VALUE)
+    if not present.any():
+        return result
+
+    strings = series[present].astype(str)
+    fmt = detect_date_format(strings, sample_size)
+    if fmt is not None:
+        if '%z' in fmt:
+            # parse_date keeps the wall-clock time, so drop the offset and parse the rest
+            with_offset = strings[strings.str.contains(UTC_OFFSET_PATTERN)]
+            naive = with_offset.str.replace(UTC_OFFSET_PATTERN, '', regex=True)
+            parsed = pd.to_datetime(naive, format=fmt.replace('%z', ''), errors='coerce')
+        else:
+            parsed = pd.to_datetime(strings, format=fmt, errors='coerce')
+        result.loc[parsed.index] = parsed
+
+    # Anything the detected format missed goes through the slow per-cell parser
+    leftover = present & result.isna()
+    if leftover.any():
+        # Dates pandas cannot hold, like the 0001-01-01 zero time, become NaT
+        result.loc[leftover] = pd.to_datetime(series[leftover].apply(parse_date), errors='coerce')
+
+    return result
+
+def fill_missing(series: pd.Series) -> pd.Series:
+    """Values of a prepared column as objects, with MISSING_VALUE in the empty cells."""
+    return series.astype(object).where(series.notna(), MISSING_VALUE)
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Store the repetitive text columns of a prepared table as categoricals.
+
+    Empty cells stay missing instead of holding a placeholder string, and
+    columns of lists or of mostly distinct values are left as they are.
+    """
+    for column in df.columns:
+        values = df[column]
+        if values.dtype != object or len(values) == 0:
+            continue
+        if pd.api.types.infer_dtype(values, skipna=True) != 'string':
+            continue
+        if values.nunique() <= CATEGORY_MAX_DISTINCT_RATIO * len(values):
+            df[column] = values.astype('category')
+    return df
+
+def frame_memory_mb(*frames: pd.DataFrame) -> float:
+    """Memory held by the frames in MB, strings included."""
+    return sum(frame.memory_usage(deep=True).sum() for frame in frames) / (1024 * 1024)
+
 def is_ip_address(ip_str):
     """Check if the string is a valid IP address."""
     if pd.isna(ip_str) or not isinstance(ip_str, str):
         return False
-    
+    return is_valid_ip(ip_str)
+
+@lru_cache(maxsize=65536)
+def is_valid_ip(ip_str: str) -> bool:
+    """is_ip_address for a string, memoized because exports repeat the same addresses on many rows."""
     # Remove any surrounding quotes or spaces
     ip_str = ip_str.strip().strip("'").strip('"')
     
@@ -118,69 +264,1177 @@ def extract_ips(ip_str):
     
     return []
 
-def format_datetime(dt):
-    """Safely format datetime objects, handling NaT values."""
-    if pd.isna(dt) or dt is None:
-        return 'Unknown'
+# First quoted text of each comma separated item of a list cell, the item extract_ips keeps
+QUOTED_LIST_ITEM = r"(?:^|,)[^,']*'([^',]*)'"
+# Addresses in a JumpCloud networkInterfaces cell
+NETWORK_INTERFACE_ADDRESS = r"address:([^,}]+)"
+
+def ip_table(devices, ips) -> pd.DataFrame:
+    """Flat (device, ip) table, device being the row position of the device."""
+    return pd.DataFrame({
+        'device': np.asarray(devices, dtype=np.int64),
+        'ip': pd.Series(ips, dtype=object).to_numpy()
+    })
+
+def extracted_ip_table(matches: pd.DataFrame) -> pd.DataFrame:
+    """The (device, ip) table of a str.extractall result on a positionally indexed series."""
+    # extractall reports empty captures as NaN, an empty string is no address anyway
+    matches = matches[matches[0].notna()]
+    return ip_table(matches.index.get_level_values(0), matches[0].to_numpy())
+
+def extract_ip_table(values: pd.Series) -> pd.DataFrame:
+    """
+    Extract IP addresses from a column of address cells into a flat (device, ip)
+    table, ordered by device and then by position in the cell.
+
+    Vectorized extract_ips: list cells like "['10.0.0.1', '10.0.0.2']" are split
+    with one str.extractall, other cells are taken whole, and each distinct
+    candidate is validated once.
+    """
+    if values.dtype != object:
+        return ip_table([], [])
+    text = pd.Series(values.to_numpy(), dtype=object)
+    is_list = (text.str.startswith('[') & text.str.endswith(']')).eq(True)
+    is_text = text.str.len().notna()
+
+    items = text[is_list].str.strip('[]').str.extractall(QUOTED_LIST_ITEM)
+    single = text[is_text & ~is_list]
+    table = pd.concat([extracted_ip_table(items), ip_table(single.index, single.to_numpy())], ignore_index=True)
+
+    candidates = table['ip'].unique()
+    valid = dict(zip(candidates, map(is_valid_ip, candidates)))
+    table = table[table['ip'].map(valid).to_numpy(dtype=bool)]
+    return table.sort_values('device', kind='stable', ignore_index=True)
+
+def extract_interface_ip_table(values: pd.Series) -> pd.DataFrame:
+    """Addresses of networkInterfaces cells as a flat (device, ip) table, taken as written like before."""
+    text = pd.Series(values.to_numpy(), dtype=object)
+    text = text[text.notna()].astype(str)
+    return extracted_ip_table(text.str.extractall(NETWORK_INTERFACE_ADDRESS))
+
+def ip_address_lists(table: pd.DataFrame, device_count: int) -> List[List[str]]:
+    """Per device lists of the addresses of a (device, ip) table."""
+    lists = [[] for _ in range(device_count)]
+    for device, ip in zip(table['device'].tolist(), table['ip'].tolist()):
+        lists[device].append(ip)
+    return lists
+
+@dataclass
+class SourceSpec:
+    """Columns a source needs from its export. Everything else is never loaded."""
+    columns: List[str]
+    include_ip_columns: bool = False  # Also keep any column that looks like an IP/address column
+
+    def wants(self, column) -> bool:
+        column = str(column)
+        if column in self.columns:
+            return True
+        return self.include_ip_columns and ('ip' in column.lower() or 'address' in column.lower())
+
+SOURCE_SPECS = {
+    'jc': SourceSpec(
+        ['hostname', 'displayName', 'serialNumber', 'lastContact', 'remoteIP', 'networkInterfaces'],
+        include_ip_columns=True
+    ),
+    'sentinels': SourceSpec(['Serial Number', 'Last Active', 'Endpoint Name']),
+    'agents': SourceSpec(['Hostname', 'Last Seen', 'Public IP Address', 'IP Address (Primary)']),
+    'mapping': SourceSpec(['HostName', 'displayname', 'email']),
+    'ns': SourceSpec(['User'])
+}
+
+def sniff_encoding(filename, sample_size: int = 65536) -> str:
+    """Guess a text file's encoding from its byte order mark and first bytes."""
+    with open(filename, 'rb') as file:
+        sample = file.read(sample_size)
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
     try:
-        return dt.strftime('%Y-%m-%d %H:%M:%S')
-    except (ValueError, AttributeError):
-        return 'Unknown'
+        # Incremental decode so a character cut off at the end of the sample is not an error
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'latin1'
+
+def read_csv_columns(filename, spec: SourceSpec, encoding: str) -> pd.DataFrame:
+    """Read only the columns the source needs, as strings, in a single pass."""
+    header = pd.read_csv(filename, nrows=0, encoding=encoding).columns
+    usecols = [column for column in header if spec.wants(column)]
+    if CSV_ENGINE == 'pyarrow':
+        # Force string columns so pyarrow does not infer and reformat timestamps
+        table = pyarrow_csv.read_csv(
+            filename,
+            read_options=pyarrow_csv.ReadOptions(encoding=encoding),
+            parse_options=pyarrow_csv.ParseOptions(newlines_in_values=True),
+            convert_options=pyarrow_csv.ConvertOptions(
+                include_columns=usecols,
+                column_types={column: pyarrow.string() for column in usecols},
+                null_values=NA_VALUES,
+                strings_can_be_null=True
+            )
+        )
+        df = table.to_pandas()
+        return df.where(df.notna(), np.nan)
+    return pd.read_csv(filename, usecols=usecols, dtype=str, encoding=encoding)
+
+# Converted Excel sources, keyed by file content hash, so a re-uploaded workbook is not parsed again.
+# The directory holds uploaded inventory data, so it lives with the app's uploads and is private to its user.
+EXCEL_CACHE_DIR = os.getenv("DEVICE_COMPARATOR_EXCEL_CACHE", os.path.join("uploads", "excel_cache"))
+EXCEL_CACHE_MAX_FILES = 32
+# Cached columns are dropped this long after they were written
+EXCEL_CACHE_MAX_AGE_SECONDS = int(os.getenv("DEVICE_COMPARATOR_EXCEL_CACHE_TTL", str(24 * 3600)))
+
+def excel_cell_text(value):
+    """Cell value as the text pd.read_excel(dtype=str) would give, NaN for empty cells."""
+    if value is None:
+        return np.nan
+    if isinstance(value, float) and value.is_integer():
+        # Excel stores all numbers as floats, whole numbers are read as integers
+        return str(int(value))
+    return str(value)
 
-def load_data(filename):
-    """Load data from either CSV or Excel file."""
+def read_excel_columns(filename, spec: SourceSpec) -> pd.DataFrame:
+    """
+    Read only the columns the source needs from the first sheet, as strings.
+
+    Rows are streamed with openpyxl's read-only reader instead of loading the
+    whole workbook, and only the wanted cells are converted.
+    """
+    workbook = openpyxl.load_workbook(filename, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, ())
+        wanted = [(index, str(name)) for index, name in enumerate(header) if name is not None and spec.wants(name)]
+        columns = {name: [] for _, name in wanted}
+        for row in rows:
+            # Read-only sheets can report trailing empty rows
+            if not any(cell is not None for cell in row):
+                continue
+            for index, name in wanted:
+                columns[name].append(excel_cell_text(row[index]) if index < len(row) else np.nan)
+    finally:
+        workbook.close()
+    return pd.DataFrame(columns, dtype=object)
+
+def excel_cache_path(filename, spec: SourceSpec) -> str:
+    """Cache file for a workbook and spec, named by the hash of the file content and the spec."""
+    digest = hashlib.sha256(repr((spec.columns, spec.include_ip_columns)).encode('utf-8'))
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return os.path.join(EXCEL_CACHE_DIR, f"{digest.hexdigest()}.parquet")
+
+def private_excel_cache_dir() -> Optional[str]:
+    """
+    Create the cache directory readable only by this user and return it, or
+    None when it is owned by someone else or open to other users.
+    """
+    try:
+        os.makedirs(EXCEL_CACHE_DIR, mode=0o700, exist_ok=True)
+        status = os.stat(EXCEL_CACHE_DIR)
+    except OSError as e:
+        print(f"Not caching Excel columns, cannot create {EXCEL_CACHE_DIR}: {e}")
+        return None
+    if hasattr(os, 'getuid') and (status.st_uid != os.getuid() or status.st_mode & 0o077):
+        print(f"Not caching Excel columns, {EXCEL_CACHE_DIR} is not private to this user")
+        return None
+    return EXCEL_CACHE_DIR
+
+def prune_excel_cache(max_files: int = EXCEL_CACHE_MAX_FILES, max_age_seconds: float = EXCEL_CACHE_MAX_AGE_SECONDS):
+    """Drop cache files older than max_age_seconds and keep only the max_files newest ones."""
+    entries = sorted(Path(EXCEL_CACHE_DIR).glob('*.*'), key=lambda path: path.stat().st_mtime, reverse=True)
+    oldest = time.time() - max_age_seconds
+    for position, path in enumerate(entries):
+        if position >= max_files or path.stat().st_mtime < oldest:
+            path.unlink(missing_ok=True)
+
+def load_excel_columns(filename, spec: SourceSpec) -> pd.DataFrame:
+    """
+    Read the columns a source needs from a workbook, through the converted-column cache.
+
+    The cache is stored as Parquet, so without pyarrow, or without a private
+    cache directory, the workbook is read every time.
+    """
+    if not HAS_PYARROW or private_excel_cache_dir() is None:
+        return read_excel_columns(filename, spec)
+
+    prune_excel_cache()
+    cache_path = excel_cache_path(filename, spec)
+    if os.path.exists(cache_path):
+        print(f"Using cached columns for {filename}")
+        df = pd.read_parquet(cache_path)
+        return df.where(df.notna(), np.nan).astype(object)
+
+    df = read_excel_columns(filename, spec)
+    # Write next to the cache file and rename, so a concurrent reader never sees half a file
+    temp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+    df.to_parquet(temp_path, index=False)
+    os.replace(temp_path, cache_path)
+    prune_excel_cache()
+    return df
+
+def load_data(filename, spec: Optional[SourceSpec] = None):
+    """
+    Load data from either CSV or Excel file.
+
+    With a spec, only the columns it declares are read and they are kept as
+    strings; the CSV encoding is sniffed from the file instead of retried.
+    """
     try:
         if filename.endswith('.csv'):
-            return pd.read_csv(filename)
+            if spec is None:
+                return pd.read_csv(filename)
+            encoding = sniff_encoding(filename)
+            try:
+                return read_csv_columns(filename, spec, encoding)
+            except CSV_DECODE_ERRORS:
+                if encoding == 'latin1':
+                    # Every byte decodes as latin1, so this is not an encoding problem
+                    raise
+                # The sample looked like UTF-8 but later bytes are not
+                print(f"Encoding {encoding} failed for {filename}, retrying with latin1")
+                return read_csv_columns(filename, spec, 'latin1')
         elif filename.endswith(('.xlsx', '.xls')):
-            return pd.read_excel(filename)
+            if spec is None:
+                return pd.read_excel(filename)
+            if filename.endswith('.xlsx') and openpyxl is not None:
+                return load_excel_columns(filename, spec)
+            return pd.read_excel(filename, usecols=spec.wants, dtype=str)
         else:
             print(f"Unsupported file format for {filename}. Please use CSV or Excel files.")
             return None
     except Exception as e:
         print(f"Error loading {filename}: {e}")
+        return None
+
+def build_first_match_index(values) -> Dict:
+    """
+    Map each value to the position of its first occurrence.
+
+    Lookups against the returned dictionary give the same row as filtering
+    a column for the value and taking iloc[0], without scanning the column.
+    """
+    index = {}
+    for position, value in enumerate(values):
+        if pd.isna(value):
+            continue
+        index.setdefault(value, position)
+    return index
+
+# Agent hostnames must score above this fuzz.ratio to count as a match
+FUZZY_HOSTNAME_THRESHOLD = 70
+
+class HostnameCandidateIndex:
+    """
+    Candidate index over agent hostnames, built once per comparison run.
+
+    Hostnames are sorted by length and profiled by character counts. A query is
+    only scored against hostnames whose length and shared characters can still
+    push fuzz.ratio above the threshold, so the best match is the same one an
+    exhaustive scan over every agent would return.
+
+    With a batched similarity backend, resolve scores whole blocks of queries
+    against every agent in one call instead, which gives the same matches.
+    """
+
+    def __init__(self, hostnames, threshold: int = FUZZY_HOSTNAME_THRESHOLD,
+                 backend: Optional[SimilarityBackend] = None):
+        self.threshold = threshold
+        self.backend = backend
+        self.hostnames = [forms.canonical for forms in normalize_hostnames(hostnames)]
+        self._resolved = {}
+
+        # Smallest ratio that can still round to a score above the threshold
+        self._min_ratio = (threshold + 0.5) / 100.0
+
+        lengths = np.fromiter((len(name) for name in self.hostnames), dtype=np.int64, count=len(self.hostnames))
+        self._order = np.argsort(lengths, kind='stable')
+        self._sorted_lengths = lengths[self._order]
+
+        alphabet = sorted(set(''.join(self.hostnames)))
+        self._char_columns = {char: column for column, char in enumerate(alphabet)}
+        self._profiles = np.zeros((len(self.hostnames), len(alphabet)), dtype=np.uint16)
+        for row, position in enumerate(self._order):
+            for char in self.hostnames[position]:
+                self._profiles[row, self._char_columns[char]] += 1
+
+    def candidates(self, hostname: str) -> np.ndarray:
+        """Return positions of the agents that could score above the threshold, in input order."""
+        length = len(hostname)
+        ratio = self._min_ratio
+
+        # fuzz.ratio is at most 2 * min(len) / (len_a + len_b), which bounds the usable lengths
+        lo = np.searchsorted(self._sorted_lengths, np.ceil(length * ratio / (2 - ratio) - 1e-9), side='left')
+        hi = np.searchsorted(self._sorted_lengths, np.floor(length * (2 - ratio) / ratio + 1e-9), side='right')
+        if lo >= hi:
+            return np.empty(0, dtype=np.int64)
+
+        # Matching characters can never exceed the shared character counts
+        query = np.zeros(len(self._char_columns), dtype=np.uint16)
+        for char in hostname:
+            column = self._char_columns.get(char)
+            if column is not None:
+                query[column] += 1
+        common = np.minimum(self._profiles[lo:hi], query).sum(axis=1, dtype=np.int64)
+        totals = length + self._sorted_lengths[lo:hi]
+        keep = 2 * common >= ratio * totals - 1e-9
+
+        return np.sort(self._order[lo:hi][keep])
+
+    def resolve(self, hostnames: List[str]):
+        """Find the best matches of many hostnames up front, in batches when the similarity backend is batched."""
+        pending = [hostname for hostname in dict.fromkeys(hostnames) if hostname not in self._resolved]
+        if self.backend is None or not self.backend.batched or not self.hostnames:
+            for hostname in pending:
+                self._resolved[hostname] = self._best_matches(hostname)
+            return
+
+        for start, scores in self.backend.blocks(pending, self.hostnames, 'ratio'):
+            best_scores = scores.max(axis=1)
+            for hostname, row, best_score in zip(pending[start:start + len(scores)], scores, best_scores.tolist()):
+                if best_score <= self.threshold:
+                    self._resolved[hostname] = ([], 0)
+                else:
+                    self._resolved[hostname] = (np.flatnonzero(row == best_score).tolist(), best_score)
+
+    def best_matches(self, hostname: str) -> Tuple[List[int], int]:
+        """
+        Find every agent sharing the highest fuzz.ratio above the threshold.
+
+        Returns (positions in input order, score), or ([], 0) when nothing scores above the threshold.
+        """
+        if hostname not in self._resolved:
+            self.resolve([hostname])
+        return self._resolved[hostname]
+
+    def _best_matches(self, hostname: str) -> Tuple[List[int], int]:
+        best_positions = []
+        best_score = 0
+        for position in self.candidates(hostname):
+            score = fuzz.ratio(hostname, self.hostnames[position])
+            if score <= self.threshold or score < best_score:
+                continue
+            if score > best_score:
+                best_positions = []
+                best_score = score
+            best_positions.append(int(position))
+        return best_positions, best_score
+
+    def best_match(self, hostname: str) -> Tuple[Optional[int], int]:
+        """
+        Find the agent hostname with the highest fuzz.ratio above the threshold.
+
+        Ties go to the agent that appears first, matching a stable sort over all agents.
+        Returns (position, score), or (None, 0) when nothing scores above the threshold.
+        """
+        positions, score = self.best_matches(hostname)
+        return (positions[0], score) if positions else (None, 0)
+
+def flatten_ranges(ranges: List[Tuple[int, int, int]]) -> Tuple[List[int], List[int], List[int]]:
+    """
+    Split possibly overlapping (start, end, position) ranges into sorted,
+    disjoint ranges where each address keeps the lowest covering position.
+
+    Returns parallel lists of starts, ends and positions for binary search.
+    """
+    ranges = sorted(ranges)
+    boundaries = sorted({start for start, _, _ in ranges} | {end + 1 for _, end, _ in ranges})
+    starts, ends, positions = [], [], []
+    active = []
+    next_range = 0
+    for i, boundary in enumerate(boundaries[:-1]):
+        while next_range < len(ranges) and ranges[next_range][0] <= boundary:
+            start, end, position = ranges[next_range]
+            heappush(active, (position, end))
+            next_range += 1
+        while active and active[0][1] < boundary:
+            heappop(active)
+        if not active:
+            continue
+        position = active[0][0]
+        if positions and positions[-1] == position and ends[-1] + 1 == boundary:
+            ends[-1] = boundaries[i + 1] - 1
+        else:
+            starts.append(boundary)
+            ends.append(boundaries[i + 1] - 1)
+            positions.append(position)
+    return starts, ends, positions
+
+def check_subnet_prefix(subnet_prefix: int) -> int:
+    """Return an IPv4 subnet prefix length, raising ValueError outside 1-32."""
+    if not 1 <= subnet_prefix <= 32:
+        raise ValueError(f"Invalid IP subnet prefix /{subnet_prefix}, expected 1 to 32")
+    return subnet_prefix
+
+class AgentIPIndex:
+    """
+    Reverse index from agent public IP addresses to agent positions, built once per run.
+
+    Exact addresses are looked up in a dictionary. With subnet_prefix set, each
+    agent address (or CIDR entry) is also widened to that IPv4 prefix, or /64 for
+    IPv6, and stored as sorted integer ranges so a device IP that only shares the
+    agent's subnet is found by binary search.
+    """
+
+    IPV6_SUBNET_PREFIX = 64
+
+    def __init__(self, public_ips, subnet_prefix: Optional[int] = None):
+        if subnet_prefix is not None:
+            check_subnet_prefix(subnet_prefix)
+        self.subnet_prefix = subnet_prefix
+        self.by_address = build_first_match_index(public_ips)
+        self._ranges = {}
+
+        if subnet_prefix is None:
+            return
+
+        ranges = {4: [], 6: []}
+        for position, value in enumerate(public_ips):
+            if pd.isna(value):
+                continue
+            try:
+                network = ipaddress.ip_network(str(value).strip(), strict=False)
+            except ValueError:
+                continue
+            prefix = subnet_prefix if network.version == 4 else self.IPV6_SUBNET_PREFIX
+            if network.prefixlen > prefix:
+                network = network.supernet(new_prefix=prefix)
+            ranges[network.version].append(
+                (int(network.network_address), int(network.broadcast_address), position)
+            )
+        self._ranges = {version: flatten_ranges(version_ranges) for version, version_ranges in ranges.items()}
+
+    def subnet_match(self, address: str) -> Optional[int]:
+        """Return the first agent whose subnet contains the address, or None."""
         try:
-            # Try with different encoding if standard fails
-            if filename.endswith('.csv'):
-                return pd.read_csv(filename, encoding='latin1')
-            else:
-                return pd.read_excel(filename, encoding='latin1')
-        except Exception as e2:
-            print(f"Failed to load {filename} with alternative encoding: {e2}")
+            ip = ipaddress.ip_address(address)
+        except ValueError:
             return None
+        starts, ends, positions = self._ranges.get(ip.version, ([], [], []))
+        value = int(ip)
+        i = bisect_right(starts, value) - 1
+        if i >= 0 and value <= ends[i]:
+            return positions[i]
+        return None
+
+    def match(self, addresses: List[str]) -> Tuple[Optional[int], Optional[str]]:
+        """
+        Find the first agent whose public IP matches one of the device addresses.
+
+        Exact matches win over subnet matches. Returns (position, match method),
+        or (None, None) when no agent matches.
+        """
+        positions = [self.by_address[address] for address in addresses if address in self.by_address]
+        if positions:
+            return min(positions), 'IP Address'
+
+        if self._ranges:
+            positions = [self.subnet_match(address) for address in addresses]
+            positions = [position for position in positions if position is not None]
+            if positions:
+                return min(positions), 'IP Subnet'
+
+        return None, None
+
+    def match_table(self, addresses: pd.DataFrame, device_count: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        AgentIPIndex.match for every device of a (device, ip) table at once.
+
+        Returns the agent position of each device, -1 when none matches, and the
+        index of its match method in AGENT_MATCH_METHODS.
+        """
+        positions = np.full(device_count, -1, dtype=np.int64)
+        methods = np.zeros(device_count, dtype=np.int8)
+
+        exact = addresses['ip'].map(self.by_address)
+        found = exact.notna().to_numpy()
+        first = exact[found].groupby(addresses['device'].to_numpy()[found]).min()
+        positions[first.index.to_numpy()] = first.to_numpy(dtype=np.int64)
+        methods[first.index.to_numpy()] = AGENT_MATCH_METHODS.index('IP Address')
+
+        if self._ranges:
+            remaining = addresses[positions[addresses['device'].to_numpy()] < 0]
+            candidates = remaining['ip'].unique()
+            subnet = remaining['ip'].map(dict(zip(candidates, map(self.subnet_match, candidates))))
+            found = subnet.notna().to_numpy()
+            first = subnet[found].groupby(remaining['device'].to_numpy()[found]).min()
+            positions[first.index.to_numpy()] = first.to_numpy(dtype=np.int64)
+            methods[first.index.to_numpy()] = AGENT_MATCH_METHODS.index('IP Subnet')
+        return positions, methods
+
+# Columns of the matched device table built by compare_devices
+DEVICE_COLUMNS = [
+    'DeviceName', 'DisplayName', 'JC_SerialNumber', 'JC_LastContact',
+    'Sentinel_SerialNumber', 'Sentinel_LastActive', 'Agent_Hostname',
+    'Agent_LastSeen', 'Match_Method', 'Email', 'NS'
+]
+
+# Contact timestamp column for each source, in the order sources are reported
+CONTACT_COLUMNS = {
+    'JumpCloud': 'JC_LastContact',
+    'Sentinel': 'Sentinel_LastActive',
+    'Agent': 'Agent_LastSeen'
+}
+
+# Columns returned by compare_devices
+REPORT_COLUMNS = [
+    'DisplayName',
+    'Status',
+    'JC_LastContact',
+    'Sentinel_LastActive',
+    'Agent_LastSeen',
+    'Not_Reported_Summary',
+    'NS'
+]
+
+def as_datetime(values: pd.Series) -> pd.Series:
+    """values as datetime64, skipping pd.to_datetime (which still scans the column) when already converted."""
+    return values if pd.api.types.is_datetime64_dtype(values) else pd.to_datetime(values)
 
-def compare_devices(jc_file, sentinels_file, agents_file, mapping_file, ns_file=None, hours_min=24, hours_max=100):
+def hours_since_contact(contact_times: pd.Series, current_time: datetime) -> pd.Series:
+    """Hours between each contact time and current_time, NaN where the time is unknown."""
+    elapsed = (pd.Timestamp(current_time) - as_datetime(contact_times)).astype('timedelta64[us]')
+    return elapsed.dt.total_seconds() / 3600
+
+def join_labels(labels: Dict[str, pd.Series], separator: str = ', ') -> pd.Series:
+    """Join per-row labels column by column, skipping empty strings, without a per-row apply."""
+    joined = None
+    for label in labels.values():
+        if joined is None:
+            joined = label
+            continue
+        separators = np.where((joined != '') & (label != ''), separator, '')
+        joined = joined + separators + label
+    return joined
+
+def contact_windows(contact_times: Dict[str, pd.Series], current_time: datetime, hours_min=24,
+                    hours_max: Optional[float] = 100) -> pd.DataFrame:
     """
-    Compare devices across different inventory systems and identify those 
-    that haven't reported in the specified time range.
+    One boolean column per source, True where the source was last seen between
+    hours_min and hours_max hours ago (inclusive). hours_max=None has no upper bound.
     """
-    # Current time as reference point - make sure it's timezone-naive
-    current_time = datetime.now().replace(tzinfo=None)
-    min_time_threshold = current_time - timedelta(hours=hours_max)
     max_time_threshold = current_time - timedelta(hours=hours_min)
-    
-    # Read files
-    jc_df = load_data(jc_file)
-    sentinels_df = load_data(sentinels_file)
-    agents_df = load_data(agents_file)
-    mapping_df = load_data(mapping_file)
-    
-    # Load NS_List file if provided
-    ns_df = None
-    if ns_file:
-        ns_df = load_data(ns_file)
-        if ns_df is None:
-            print(f"Warning: Could not load NS List file {ns_file}. NS status will be marked as 'Unknown'.")
-    
-    # Check if any required file failed to load
-    if jc_df is None or sentinels_df is None or agents_df is None or mapping_df is None:
-        print("Failed to load one or more required files. Exiting.")
-        return pd.DataFrame()
-    
-    # Clean up dataframes
-    
-    # Process JumpCloud data
-    jc_df = jc_df.fillna('N/A')
+    if hours_max is None:
+        return pd.DataFrame({source: times <= max_time_threshold for source, times in contact_times.items()})
+    min_time_threshold = current_time - timedelta(hours=hours_max)
+    return pd.DataFrame({
+        source: times.between(min_time_threshold, max_time_threshold)
+        for source, times in contact_times.items()
+    })
+
+def status_labels(in_range: pd.DataFrame) -> pd.Series:
+    """Comma separated sources that are in range, per device."""
+    return join_labels({
+        source: pd.Series(np.where(in_range[source], source, ''), index=in_range.index)
+        for source in CONTACT_COLUMNS
+    })
+
+def format_contact_columns(report: pd.DataFrame, contact_times: Dict[str, pd.Series], current_time: datetime):
+    """Replace the contact columns of report with readable timestamps and add Not_Reported_Summary."""
+    summaries = {}
+    for source, column in CONTACT_COLUMNS.items():
+        times = contact_times[source].loc[report.index]
+        hours = hours_since_contact(times, current_time)
+        formatted = np.char.mod('%.1fh', hours.fillna(0).to_numpy())
+        summaries[source] = source + ': ' + pd.Series(np.where(times.isna(), 'Unknown', formatted), index=report.index)
+
+        # Format the output for better readability
+        report[column] = times.dt.strftime('%Y-%m-%d %H:%M:%S').fillna('Unknown')
+
+    report['Not_Reported_Summary'] = join_labels(summaries)
+
+def build_staleness_report(devices: pd.DataFrame, current_time: datetime, hours_min=24, hours_max=100,
+                           columns: List[str] = REPORT_COLUMNS) -> pd.DataFrame:
+    """
+    Keep the devices with at least one source last seen within the hour window
+    and format the report columns.
+
+    All staleness checks and string formatting are done on whole columns.
+    """
+    contact_times = {source: as_datetime(devices[column]) for source, column in CONTACT_COLUMNS.items()}
+    in_range = contact_windows(contact_times, current_time, hours_min, hours_max)
+
+    report = devices[in_range.any(axis=1)].copy()
+    if report.empty:
+        # Return an empty DataFrame with the expected columns
+        return pd.DataFrame(columns=columns)
+
+    report['Status'] = status_labels(in_range.loc[report.index])
+    format_contact_columns(report, contact_times, current_time)
+
+    # Sort by display name
+    report = report.sort_values('DisplayName')
+    return report[columns]
+
+# Staleness buckets of the weekly hygiene report, as (min_hours, max_hours), None is open-ended
+STALENESS_BUCKETS = [(24, 48), (48, 100), (100, 720), (720, None)]
+
+def bucket_label(hours_min, hours_max) -> str:
+    return f">{hours_min}h" if hours_max is None else f"{hours_min}-{hours_max}h"
+
+def parse_staleness_buckets(text: str) -> List[Tuple[float, Optional[float]]]:
+    """
+    Parse buckets written as '24-48,48-100,100-720,720-' into (min_hours, max_hours)
+    pairs. A bucket without an upper bound has max_hours None.
+    """
+    buckets = []
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        low, separator, high = part.partition('-')
+        if not separator:
+            raise ValueError(f"Invalid staleness bucket '{part}', expected min-max or min-")
+        hours_min = float(low)
+        hours_max = float(high) if high.strip() else None
+        if hours_max is not None and hours_max < hours_min:
+            raise ValueError(f"Invalid staleness bucket '{part}', max is below min")
+        buckets.append((int(hours_min) if hours_min.is_integer() else hours_min,
+                        None if hours_max is None else int(hours_max) if hours_max.is_integer() else hours_max))
+    if not buckets:
+        raise ValueError("No staleness buckets given")
+    return buckets
+
+def build_staleness_histogram(devices: pd.DataFrame, current_time: datetime, buckets=STALENESS_BUCKETS,
+                              columns: List[str] = REPORT_COLUMNS) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Put every device into each staleness bucket one of its sources falls in.
+
+    Returns (counts, members). counts has one row per bucket with the number of
+    devices and of devices per source in it. members has a Bucket column followed
+    by the report columns, and for each bucket holds the same rows as
+    build_staleness_report over that bucket's hour window. Contact times are
+    parsed and formatted once for all buckets.
+    """
+    contact_times = {source: as_datetime(devices[column]) for source, column in CONTACT_COLUMNS.items()}
+    formatted = devices.copy()
+    format_contact_columns(formatted, contact_times, current_time)
+
+    counts, members = [], []
+    for hours_min, hours_max in buckets:
+        label = bucket_label(hours_min, hours_max)
+        in_range = contact_windows(contact_times, current_time, hours_min, hours_max)
+        selected = in_range.any(axis=1).to_numpy()
+        counts.append({'Bucket': label, 'Devices': int(selected.sum()),
+                       **{source: int(in_range[source].sum()) for source in CONTACT_COLUMNS}})
+
+        bucket = formatted[selected].copy()
+        bucket['Status'] = status_labels(in_range[selected])
+        bucket.insert(0, 'Bucket', label)
+        members.append(bucket.sort_values('DisplayName')[['Bucket'] + columns])
+
+    counts = pd.DataFrame(counts, columns=['Bucket', 'Devices'] + list(CONTACT_COLUMNS))
+    members = pd.concat(members, ignore_index=True) if members else pd.DataFrame(columns=['Bucket'] + columns)
+    return counts, members
+
+# Rows serialized per chunk when a report is streamed
+STREAM_CHUNK_ROWS = 5000
+
+# Media type and download file name for each report format
+OUTPUT_FORMATS = {
+    'csv': ('text/csv', 'device_comparison_results.csv'),
+    'csv.gz': ('application/gzip', 'device_comparison_results.csv.gz'),
+    'parquet': ('application/vnd.apache.parquet', 'device_comparison_results.parquet')
+}
+
+def iter_report_csv(report: pd.DataFrame, chunk_rows: int = STREAM_CHUNK_ROWS) -> Iterator[bytes]:
+    """Yield the report as UTF-8 CSV, chunk_rows rows at a time."""
+    yield report.iloc[:0].to_csv(index=False).encode('utf-8')
+    for start in range(0, len(report), chunk_rows):
+        yield report.iloc[start:start + chunk_rows].to_csv(index=False, header=False).encode('utf-8')
+
+def iter_report_csv_gzip(report: pd.DataFrame, chunk_rows: int = STREAM_CHUNK_ROWS) -> Iterator[bytes]:
+    """Yield the report as gzip-compressed CSV, compressing each chunk as it is written."""
+    # wbits=31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in iter_report_csv(report, chunk_rows):
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+class _ChunkSink:
+    """Write-only file object that hands back what was written since the last drain."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def iter_report_parquet(report: pd.DataFrame, chunk_rows: int = STREAM_CHUNK_ROWS) -> Iterator[bytes]:
+    """Yield the report as Parquet, one row group of chunk_rows rows at a time."""
+    from pyarrow import parquet as pyarrow_parquet
+
+    # Infer the schema from the whole report so a chunk of empty cells keeps the column type
+    schema = pyarrow.Schema.from_pandas(report, preserve_index=False)
+    sink = _ChunkSink()
+    with pyarrow_parquet.ParquetWriter(sink, schema) as writer:
+        for start in range(0, len(report), chunk_rows):
+            chunk = report.iloc[start:start + chunk_rows]
+            writer.write_table(pyarrow.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()
+
+REPORT_WRITERS = {
+    'csv': iter_report_csv,
+    'csv.gz': iter_report_csv_gzip,
+    'parquet': iter_report_parquet
+}
+
+def stream_report(report: pd.DataFrame, output_format: str = 'csv',
+                  chunk_rows: int = STREAM_CHUNK_ROWS) -> Iterator[bytes]:
+    """
+    Serialize the report in output_format ('csv', 'csv.gz' or 'parquet') as an
+    iterator of byte chunks, so only one chunk is encoded at a time.
+
+    The format is checked here rather than on the first chunk so callers can
+    reject it before a response has started.
+    """
+    if output_format not in REPORT_WRITERS:
+        raise ValueError(f"Unsupported output format '{output_format}'. Choose one of: {', '.join(REPORT_WRITERS)}")
+    if output_format == 'parquet' and not HAS_PYARROW:
+        raise ValueError("Parquet output requires pyarrow. Install it with: pip install pyarrow")
+    return REPORT_WRITERS[output_format](report, chunk_rows)
+
+@dataclass
+class MatchContext:
+    """Read-only lookup tables used to match JumpCloud devices against the other sources."""
+    sentinels_df: pd.DataFrame
+    agents_df: pd.DataFrame
+    mapping_df: pd.DataFrame
+    sentinel_by_serial: Dict
+    mapping_by_hostname: Dict
+    ns_users: Optional[set]
+    hostname_index: Optional[HostnameCandidateIndex]
+    ip_index: AgentIPIndex
+    # Key columns with missing cells filled, converted from the compact tables once per run
+    sentinel_serials: np.ndarray
+    agent_hostnames: Optional[np.ndarray]
+    mapping_display_names: np.ndarray
+    mapping_emails: Optional[np.ndarray]
+
+def build_match_context(sentinels_df, agents_df, mapping_df, ns_df=None, ip_subnet_prefix=None,
+                        similarity_backend: Optional[SimilarityBackend] = None) -> MatchContext:
+    """Build the lookup tables and agent indexes once per comparison run."""
+    ns_users = None
+    if ns_df is not None and 'User' in ns_df.columns:
+        ns_users = {user.lower() for user in ns_df['User'] if isinstance(user, str)}
+
+    sentinel_serials = fill_missing(sentinels_df['SerialNumber']).to_numpy()
+    agent_hostnames = fill_missing(agents_df['Hostname']).to_numpy() if 'Hostname' in agents_df.columns else None
+    return MatchContext(
+        sentinels_df=sentinels_df,
+        agents_df=agents_df,
+        mapping_df=mapping_df,
+        sentinel_by_serial=build_first_match_index(sentinel_serials),
+        mapping_by_hostname=build_first_match_index(mapping_df['HostName_lower']),
+        ns_users=ns_users,
+        hostname_index=(HostnameCandidateIndex(agent_hostnames, backend=similarity_backend)
+                        if agent_hostnames is not None else None),
+        ip_index=AgentIPIndex(agents_df['PublicIP'], ip_subnet_prefix),
+        sentinel_serials=sentinel_serials,
+        agent_hostnames=agent_hostnames,
+        mapping_display_names=fill_missing(mapping_df['displayname']).to_numpy(),
+        mapping_emails=fill_missing(mapping_df['email']).to_numpy() if 'email' in mapping_df.columns else None
+    )
+
+# Agent match methods by the code stored in DeviceMatches.agent_method, 0 is no match
+AGENT_MATCH_METHODS = ('', 'Hostname Fuzzy', 'IP Address', 'IP Subnet')
+
+class DeviceMatches:
+    """
+    Positions of the Sentinel, mapping and agent records matched to each
+    JumpCloud device, stored as one array per field with -1 where nothing matched.
+    """
+    __slots__ = ('sentinel', 'mapping', 'agent', 'agent_score', 'agent_method')
+
+    def __init__(self, size: int):
+        self.sentinel = np.full(size, -1, dtype=np.int64)
+        self.mapping = np.full(size, -1, dtype=np.int64)
+        self.agent = np.full(size, -1, dtype=np.int64)
+        self.agent_score = np.zeros(size, dtype=np.int16)
+        self.agent_method = np.zeros(size, dtype=np.int8)
+
+    def __len__(self) -> int:
+        return len(self.agent)
+
+    @classmethod
+    def concat(cls, parts: List['DeviceMatches']) -> 'DeviceMatches':
+        matches = cls(0)
+        for slot in cls.__slots__:
+            setattr(matches, slot, np.concatenate([getattr(part, slot) for part in parts]))
+        return matches
+
+def lookup_positions(values, index: Dict) -> np.ndarray:
+    """Position of each value in a first-match index, -1 when it is not there."""
+    return np.fromiter((index.get(value, -1) for value in values), dtype=np.int64, count=len(values))
+
+def match_device_positions(serials: List, hostnames: List[str], addresses: pd.DataFrame,
+                           context: MatchContext) -> DeviceMatches:
+    """
+    Match JumpCloud devices, given as parallel lists of serial numbers and lowercase
+    hostnames plus a (device, ip) address table, to their Sentinel, mapping and
+    agent records.
+
+    Sentinels match on serial number and mappings on hostname. Agents match on the
+    best fuzzy hostname, or on public IP when no hostname scores above the threshold.
+    """
+    matches = DeviceMatches(len(hostnames))
+    matches.sentinel[:] = lookup_positions(serials, context.sentinel_by_serial)
+    matches.mapping[:] = lookup_positions(hostnames, context.mapping_by_hostname)
+
+    agent, agent_score, agent_method = matches.agent, matches.agent_score, matches.agent_method
+    # IP matches are looked up for all devices in one join, hostname matches take precedence
+    agent[:], agent_method[:] = context.ip_index.match_table(addresses, len(hostnames))
+    if context.hostname_index is not None:
+        context.hostname_index.resolve(hostnames)
+        for i, hostname in enumerate(hostnames):
+            position, score = context.hostname_index.best_match(hostname)
+            if position is not None:
+                agent[i] = position
+                agent_score[i] = score
+                agent_method[i] = 1
+    return matches
+
+def take_matched(column, positions: np.ndarray, default=None) -> np.ndarray:
+    """Values of column (a Series or an array) at positions, default where the position is -1."""
+    values = np.asarray(column)
+    found = positions >= 0
+    if default is None and values.dtype.kind == 'M':
+        result = np.full(len(positions), np.datetime64('NaT'), dtype=values.dtype)
+    else:
+        result = np.full(len(positions), default, dtype=object)
+    result[found] = values[positions[found]]
+    return result
+
+def build_device_table(jc_df: pd.DataFrame, matches: DeviceMatches, context: MatchContext,
+                       key_columns: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> pd.DataFrame:
+    """
+    Build the DEVICE_COLUMNS table from the JumpCloud columns and the matched positions.
+
+    key_columns are the jumpcloud_key_columns of jc_df when they were already computed.
+    """
+    serials, device_names = key_columns if key_columns is not None else jumpcloud_key_columns(jc_df)
+    mapped = matches.mapping >= 0
+
+    # Default to DeviceName if no mapping found
+    display_names = device_names.copy()
+    display_names[mapped] = context.mapping_display_names[matches.mapping[mapped]]
+    emails = np.full(len(jc_df), 'Not Found', dtype=object)
+    if context.mapping_emails is not None:
+        emails[mapped] = context.mapping_emails[matches.mapping[mapped]]
+
+    agents_df = context.agents_df
+    if context.agent_hostnames is not None:
+        agent_hostnames = take_matched(context.agent_hostnames, matches.agent, 'Not Found')
+    else:
+        agent_hostnames = np.where(matches.agent >= 0, 'Unknown', 'Not Found').astype(object)
+
+    # Match methods are short lists, built from the codes once per device
+    serial_matched = matches.sentinel >= 0
+    match_methods = []
+    for has_serial, method, score in zip(serial_matched.tolist(), matches.agent_method.tolist(),
+                                         matches.agent_score.tolist()):
+        methods = ['Serial Number'] if has_serial else []
+        if method == 1:
+            methods.append(f'Hostname Fuzzy ({score}%)')
+        elif method:
+            methods.append(AGENT_MATCH_METHODS[method])
+        match_methods.append(methods)
+
+    ns_status = np.full(len(jc_df), 'Unknown', dtype=object)
+    if context.ns_users is not None:
+        has_email = emails != 'Not Found'
+        present = np.fromiter((str(email).lower() in context.ns_users for email in emails),
+                              dtype=bool, count=len(emails))
+        ns_status[has_email] = np.where(present[has_email], 'PRESENT', 'ABSENT')
+
+    return pd.DataFrame({
+        'DeviceName': device_names,
+        'DisplayName': display_names,
+        'JC_SerialNumber': serials,
+        'JC_LastContact': jc_df['JC_LastContact'].to_numpy(),
+        'Sentinel_SerialNumber': take_matched(context.sentinel_serials, matches.sentinel, 'Not Found'),
+        'Sentinel_LastActive': take_matched(context.sentinels_df['Sentinel_LastActive'], matches.sentinel),
+        'Agent_Hostname': agent_hostnames,
+        'Agent_LastSeen': take_matched(agents_df['Agent_LastSeen'], matches.agent),
+        'Match_Method': match_methods,
+        'Email': emails,
+        'NS': ns_status
+    }, columns=DEVICE_COLUMNS)
+
+def jumpcloud_key_columns(jc_df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """Serial numbers and device names of the JumpCloud devices with missing cells filled."""
+    return fill_missing(jc_df['SerialNumber']).to_numpy(), fill_missing(jc_df['DeviceName']).to_numpy()
+
+def jumpcloud_match_keys(jc_df: pd.DataFrame, addresses: pd.DataFrame,
+                         key_columns: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Tuple[List, List[str], pd.DataFrame]:
+    """
+    Serial numbers and lowercase hostnames of the JumpCloud devices as plain lists, with their (device, ip) table.
+
+    key_columns are the jumpcloud_key_columns of jc_df when they were already computed.
+    """
+    serials, device_names = key_columns if key_columns is not None else jumpcloud_key_columns(jc_df)
+    return serials.tolist(), [forms.canonical for forms in normalize_hostnames(device_names)], addresses
+
+def match_devices(jc_df: pd.DataFrame, addresses: pd.DataFrame, context: MatchContext,
+                  key_columns: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> pd.DataFrame:
+    """
+    Match each JumpCloud device to its mapping, Sentinel and agent records.
+
+    addresses is the (device, ip) table prepare_jumpcloud returns with jc_df.
+    """
+    key_columns = key_columns if key_columns is not None else jumpcloud_key_columns(jc_df)
+    matches = match_device_positions(*jumpcloud_match_keys(jc_df, addresses, key_columns), context)
+    return build_device_table(jc_df, matches, context, key_columns)
+
+class DisjointSet:
+    """Union-find over record ids 0..size-1 with path halving and union by size."""
+
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+        self.size = [1] * size
+
+    def find(self, record_id: int) -> int:
+        parent = self.parent
+        while parent[record_id] != record_id:
+            parent[record_id] = parent[parent[record_id]]
+            record_id = parent[record_id]
+        return record_id
+
+    def union(self, a: int, b: int) -> bool:
+        """Merge the sets holding a and b. Returns False if they were already together."""
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return False
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return True
+
+# Placeholder values that must never link two records together
+MISSING_KEYS = {'', 'n/a', 'unknown', 'not found', 'none', 'nan'}
+
+def normalize_serial(value) -> Optional[str]:
+    """Serial number as a link key, or None when it is missing."""
+    if pd.isna(value):
+        return None
+    serial = str(value).strip().upper()
+    return None if serial.lower() in MISSING_KEYS else serial
+
+def normalize_hostname(value) -> Optional[str]:
+    """Lowercase hostname without its domain as a link key, or None when it is missing."""
+    if pd.isna(value):
+        return None
+    hostname = hostname_forms(str(value)).domainless
+    return None if hostname in MISSING_KEYS else hostname
+
+def reconcile_devices(jc_df: pd.DataFrame, jc_addresses: pd.DataFrame, sentinels_df: pd.DataFrame,
+                      agents_df: pd.DataFrame, context: MatchContext) -> pd.DataFrame:
+    """
+    Group JumpCloud, Sentinel and agent records into devices in one pass.
+
+    Records are linked when they share a serial number, a normalized hostname or
+    an IP address, and linked records are merged into clusters with a disjoint-set.
+    An IP only links records when no other record of the same source has it, so
+    devices behind a shared NAT address are not merged. Each cluster becomes one
+    row with the same columns as match_devices, plus the sources it was seen in.
+    Devices that only exist in Sentinel or the agent export are included.
+    jc_addresses is the (device, ip) table prepare_jumpcloud returns.
+    """
+    jc_count, sentinel_count = len(jc_df), len(sentinels_df)
+    sentinel_offset = jc_count
+    agent_offset = jc_count + sentinel_count
+    records = DisjointSet(agent_offset + len(agents_df))
+    links = []
+
+    def link(record_ids, keys, kind):
+        first_by_key = {}
+        for record_id, key in zip(record_ids, keys):
+            if key is None:
+                continue
+            first_id = first_by_key.setdefault(key, record_id)
+            if first_id != record_id and records.union(first_id, record_id):
+                links.append((record_id, kind))
+
+    jc_ids = range(jc_count)
+    sentinel_ids = range(sentinel_offset, agent_offset)
+    agent_ids = range(agent_offset, agent_offset + len(agents_df))
+
+    # Serial numbers
+    link(
+        list(jc_ids) + list(sentinel_ids),
+        [normalize_serial(v) for v in jc_df['SerialNumber']] + [normalize_serial(v) for v in sentinels_df['SerialNumber']],
+        'Serial Number'
+    )
+
+    # Hostnames
+    agent_hostnames = (context.agent_hostnames if context.agent_hostnames is not None
+                       else [None] * len(agents_df))
+    link(
+        list(jc_ids) + list(sentinel_ids) + list(agent_ids),
+        [normalize_hostname(v) for v in jc_df['DeviceName']]
+        + [normalize_hostname(v) for v in sentinels_df['EndpointName']]
+        + [normalize_hostname(v) for v in agent_hostnames],
+        'Hostname'
+    )
+
+    # IP addresses that are unique within each source
+    jc_addresses = jc_addresses.drop_duplicates()
+    jc_ip_pairs = list(zip(jc_addresses['device'].tolist(), jc_addresses['ip'].tolist()))
+    agent_ip_pairs = [(record_id, ip) for record_id, ip in zip(agent_ids, agents_df['PublicIP']) if is_ip_address(ip)]
+    jc_ip_counts = pd.Series([ip for _, ip in jc_ip_pairs], dtype=object).value_counts()
+    agent_ip_counts = pd.Series([ip for _, ip in agent_ip_pairs], dtype=object).value_counts()
+    ip_pairs = [
+        (record_id, ip) for record_id, ip in jc_ip_pairs + agent_ip_pairs
+        if jc_ip_counts.get(ip, 0) <= 1 and agent_ip_counts.get(ip, 0) <= 1
+    ]
+    link([record_id for record_id, _ in ip_pairs], [ip for _, ip in ip_pairs], 'IP Address')
+
+    roots = np.fromiter((records.find(record_id) for record_id in range(len(records.parent))), dtype=np.int64)
+    link_kinds = {}
+    for record_id, kind in links:
+        link_kinds.setdefault(records.find(record_id), set()).add(kind)
+
+    # Evaluate each source once per cluster: first identifiers, most recent contact
+    jc = pd.DataFrame({
+        'Cluster': roots[:jc_count],
+        'JC_DeviceName': fill_missing(jc_df['DeviceName']).to_numpy(),
+        'JC_SerialNumber': fill_missing(jc_df['SerialNumber']).to_numpy(),
+        'JC_LastContact': pd.to_datetime(jc_df['JC_LastContact']).to_numpy()
+    }).groupby('Cluster', sort=False).agg({
+        'JC_DeviceName': 'first', 'JC_SerialNumber': 'first', 'JC_LastContact': 'max'
+    })
+    sentinels = pd.DataFrame({
+        'Cluster': roots[sentinel_offset:agent_offset],
+        'EndpointName': fill_missing(sentinels_df['EndpointName']).to_numpy(),
+        'Sentinel_SerialNumber': context.sentinel_serials,
+        'Sentinel_LastActive': pd.to_datetime(sentinels_df['Sentinel_LastActive']).to_numpy()
+    }).groupby('Cluster', sort=False).agg({
+        'EndpointName': 'first', 'Sentinel_SerialNumber': 'first', 'Sentinel_LastActive': 'max'
+    })
+    agents = pd.DataFrame({
+        'Cluster': roots[agent_offset:],
+        'Agent_Hostname': pd.Series(agent_hostnames, dtype=object).to_numpy(),
+        'Agent_LastSeen': pd.to_datetime(agents_df['Agent_LastSeen']).to_numpy()
+    }).groupby('Cluster', sort=False).agg({'Agent_Hostname': 'first', 'Agent_LastSeen': 'max'})
+
+    clusters = pd.DataFrame(index=pd.Index(pd.unique(roots), name='Cluster'))
+    clusters = clusters.join(jc).join(sentinels).join(agents)
+
+    in_jc = clusters.index.isin(jc.index)
+    in_sentinel = clusters.index.isin(sentinels.index)
+    in_agent = clusters.index.isin(agents.index)
+    clusters['Sources'] = join_labels({
+        'JumpCloud': pd.Series(np.where(in_jc, 'JumpCloud', ''), index=clusters.index),
+        'Sentinel': pd.Series(np.where(in_sentinel, 'Sentinel', ''), index=clusters.index),
+        'Agent': pd.Series(np.where(in_agent, 'Agent', ''), index=clusters.index)
+    })
+
+    clusters['DeviceName'] = clusters['JC_DeviceName'].fillna(clusters['EndpointName']).fillna(clusters['Agent_Hostname'])
+    clusters['JC_SerialNumber'] = clusters['JC_SerialNumber'].fillna('Not Found')
+    clusters['Sentinel_SerialNumber'] = clusters['Sentinel_SerialNumber'].fillna('Not Found')
+    clusters['Agent_Hostname'] = clusters['Agent_Hostname'].fillna('Not Found')
+    clusters['Match_Method'] = [sorted(link_kinds.get(cluster, ())) for cluster in clusters.index]
+
+    # Mapping and NS lookups, same rules as match_devices
+    positions = pd.Series(
+        [context.mapping_by_hostname.get(canonical_hostname(name)) for name in clusters['DeviceName']],
+        index=clusters.index, dtype=float
+    )
+    mapped = positions.notna()
+    mapped_rows = positions[mapped].astype(int).to_numpy()
+    clusters['DisplayName'] = clusters['DeviceName']
+    clusters.loc[mapped, 'DisplayName'] = context.mapping_display_names[mapped_rows]
+    clusters['Email'] = 'Not Found'
+    if context.mapping_emails is not None:
+        clusters.loc[mapped, 'Email'] = context.mapping_emails[mapped_rows]
+    clusters['NS'] = 'Unknown'
+    if context.ns_users is not None:
+        has_email = clusters['Email'] != 'Not Found'
+        present = clusters['Email'].map(lambda email: str(email).lower() in context.ns_users)
+        clusters.loc[has_email, 'NS'] = np.where(present[has_email], 'PRESENT', 'ABSENT')
+
+    return clusters.reset_index(drop=True)[DEVICE_COLUMNS + ['Sources']]
+
+# Shards per worker, so one slow shard does not leave the other workers idle
+SHARDS_PER_WORKER = 4
+
+# Match context of the current pool worker, set once by _init_match_worker
+_worker_context = None
+
+def _init_match_worker(context: MatchContext):
+    global _worker_context
+    _worker_context = context
+
+def _match_shard(keys: Tuple[List, List[str], pd.DataFrame]) -> DeviceMatches:
+    return match_device_positions(*keys, _worker_context)
+
+# Pools are started from job and request threads, and forking a multi-threaded process
+# can copy locks other threads hold. Workers are started from a fork server instead.
+POOL_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+)
+
+def match_devices_parallel(jc_df: pd.DataFrame, addresses: pd.DataFrame, context: MatchContext, workers: int,
+                           key_columns: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> pd.DataFrame:
+    """
+    Match devices in a process pool.
+
+    The JumpCloud match keys are split into contiguous shards, each worker receives
+    the match context once, and the matched positions are concatenated in input
+    order, so the result is the same as match_devices on the whole frame.
+    """
+    key_columns = key_columns if key_columns is not None else jumpcloud_key_columns(jc_df)
+    serials, hostnames, addresses = jumpcloud_match_keys(jc_df, addresses, key_columns)
+    shard_count = min(len(jc_df), workers * SHARDS_PER_WORKER)
+    bounds = np.linspace(0, len(jc_df), shard_count + 1).astype(int)
+    # Address rows are ordered by device, so each shard takes a contiguous slice renumbered from 0
+    address_bounds = np.searchsorted(addresses['device'].to_numpy(), bounds, side='left')
+    shards = [
+        (serials[start:end], hostnames[start:end],
+         ip_table(addresses['device'].to_numpy()[lo:hi] - start, addresses['ip'].to_numpy()[lo:hi]))
+        for start, end, lo, hi in zip(bounds[:-1], bounds[1:], address_bounds[:-1], address_bounds[1:])
+    ]
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT, initializer=_init_match_worker,
+                             initargs=(context,)) as executor:
+        matches = DeviceMatches.concat(list(executor.map(_match_shard, shards)))
+    return build_device_table(jc_df, matches, context, key_columns)
+
+def prepare_jumpcloud(jc_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Add the DeviceName, SerialNumber and JC_LastContact columns to a JumpCloud export.
+
+    Returns the frame and the flat (device, ip) table of its IP addresses, which
+    matching and reconciliation join on directly.
+    """
+    # Shallow copy, columns are added and replaced without touching the caller's frame
+    jc_df = jc_df.copy(deep=False)
+
     # Extract hostname from JC data (it's in different columns depending on the file)
     if 'hostname' in jc_df.columns:
         jc_df['DeviceName'] = jc_df['hostname']
@@ -189,68 +1443,67 @@ def compare_devices(jc_file, sentinels_file, agents_file, mapping_file, ns_file=
     else:
         print("Warning: Couldn't find hostname column in JumpCloud data")
         jc_df['DeviceName'] = 'Unknown'
-    
+
     # Ensure serial number column exists
     if 'serialNumber' in jc_df.columns:
         jc_df['SerialNumber'] = jc_df['serialNumber']
     else:
         print("Warning: No serial number column found in JumpCloud data")
         jc_df['SerialNumber'] = 'Unknown'
-    
-    # Process lastContact date
-    jc_df['JC_LastContact'] = jc_df['lastContact'].apply(lambda x: parse_date(x) if not pd.isna(x) else None)
-    
+
+    # Process lastContact date, the parsed timestamps replace the text
+    jc_df['JC_LastContact'] = parse_date_column(jc_df.pop('lastContact'))
+
     # Extract IP addresses
     jc_ip_cols = [col for col in jc_df.columns if 'ip' in col.lower() or 'address' in col.lower()]
     if 'remoteIP' in jc_df.columns:
-        jc_df['IPAddresses'] = jc_df['remoteIP'].apply(extract_ips)
+        addresses = extract_ip_table(jc_df['remoteIP'])
     elif len(jc_ip_cols) > 0:
         # Use the first IP column found
-        jc_df['IPAddresses'] = jc_df[jc_ip_cols[0]].apply(extract_ips)
-    else:
+        addresses = extract_ip_table(jc_df[jc_ip_cols[0]])
+    elif 'networkInterfaces' in jc_df.columns:
         # Try to extract IPs from networkInterfaces
-        if 'networkInterfaces' in jc_df.columns:
-            jc_df['IPAddresses'] = jc_df['networkInterfaces'].apply(
-                lambda x: re.findall(r'address:([^,}]+)', str(x)) if not pd.isna(x) else []
-            )
-        else:
-            jc_df['IPAddresses'] = [[]] * len(jc_df)
-    
-    # Process Sentinels data
-    sentinels_df = sentinels_df.fillna('N/A')
-    
+        addresses = extract_interface_ip_table(jc_df['networkInterfaces'])
+    else:
+        addresses = ip_table([], [])
+    return compact_frame(jc_df), addresses
+
+def prepare_sentinels(sentinels_df: pd.DataFrame) -> pd.DataFrame:
+    """Add the SerialNumber, Sentinel_LastActive and EndpointName columns to a SentinelOne export."""
+    sentinels_df = sentinels_df.copy(deep=False)
+
     # Ensure consistent column naming
     if 'Serial Number' in sentinels_df.columns:
         sentinels_df['SerialNumber'] = sentinels_df['Serial Number']
     else:
         print("Warning: No Serial Number column found in Sentinels data")
         sentinels_df['SerialNumber'] = 'Unknown'
-    
+
     # Process Last Active date
     if 'Last Active' in sentinels_df.columns:
-        sentinels_df['Sentinel_LastActive'] = sentinels_df['Last Active'].apply(
-            lambda x: parse_date(x) if not pd.isna(x) and x != 'N/A' else None
-        )
+        sentinels_df['Sentinel_LastActive'] = parse_date_column(sentinels_df.pop('Last Active'))
     else:
         print("Warning: No Last Active column found in Sentinels data")
         sentinels_df['Sentinel_LastActive'] = None
-    
+
     # Extract endpoint name
     if 'Endpoint Name' in sentinels_df.columns:
         sentinels_df['EndpointName'] = sentinels_df['Endpoint Name']
     else:
         sentinels_df['EndpointName'] = 'Unknown'
-    
-    # Process agents data
-    agents_df = agents_df.fillna('N/A')
-    
+    return compact_frame(sentinels_df)
+
+def prepare_agents(agents_df: pd.DataFrame) -> pd.DataFrame:
+    """Add the Agent_LastSeen and PublicIP columns to a Rapid7 agents export."""
+    agents_df = agents_df.copy(deep=False)
+
     # Process Last Seen date
     if 'Last Seen' in agents_df.columns:
-        agents_df['Agent_LastSeen'] = agents_df['Last Seen'].apply(lambda x: parse_date(x) if not pd.isna(x) and x != 'N/A' else None)
+        agents_df['Agent_LastSeen'] = parse_date_column(agents_df.pop('Last Seen'))
     else:
         print("Warning: No Last Seen column found in Agents data")
         agents_df['Agent_LastSeen'] = None
-    
+
     # Get IP addresses from agents
     if 'Public IP Address' in agents_df.columns:
         agents_df['PublicIP'] = agents_df['Public IP Address']
@@ -259,186 +1512,478 @@ def compare_devices(jc_file, sentinels_file, agents_file, mapping_file, ns_file=
     else:
         print("Warning: No IP address column found in Agents data")
         agents_df['PublicIP'] = 'Unknown'
-    
-    # Process mapping data
-    mapping_df = mapping_df.fillna('N/A')
+    return compact_frame(agents_df)
+
+def prepare_mapping(mapping_df: pd.DataFrame) -> pd.DataFrame:
+    """Add the HostName_lower column to the hostname mapping file."""
+    mapping_df = mapping_df.copy(deep=False)
+
     # Convert hostname to lowercase for case-insensitive matching
     if 'HostName' in mapping_df.columns:
-        mapping_df['HostName_lower'] = mapping_df['HostName'].str.lower()
+        mapping_df['HostName_lower'] = [forms.canonical
+                                        for forms in normalize_hostnames(fill_missing(mapping_df['HostName']))]
     else:
         print("Warning: No HostName column found in mapping file")
         mapping_df['HostName_lower'] = 'Unknown'
+    return compact_frame(mapping_df)
+
+def memory_usage_mb() -> Tuple[Optional[float], Optional[float]]:
+    """Current and peak resident set size of this process in MB, None where the platform does not report it."""
+    rss = None
+    try:
+        with open('/proc/self/statm') as statm:
+            rss = int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        pass
+
+    peak = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS reports bytes
+        peak = peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    return rss, peak
+
+class StageTimer:
+    """
+    Records how long each stage of a comparison run takes, and the resident
+    memory of the process when it ends together with the peak reached so far.
+
+    The peak is process wide, so with several comparisons running at once it
+    includes theirs. An optional callback is called with the stage name when a
+    stage starts. With table_memory set, the memory held by the prepared tables
+    is recorded too, which takes a deep scan of their strings.
+    """
+
+    def __init__(self, callback: Optional[Callable[[str], None]] = None, table_memory: bool = False):
+        self.timings = {}
+        self.memory = {}
+        self.tables_mb = {}
+        self.callback = callback
+        self.table_memory = table_memory
+
+    @contextmanager
+    def stage(self, name: str):
+        if self.callback is not None:
+            self.callback(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+            rss, peak = memory_usage_mb()
+            self.memory[name] = {'rss_mb': rss, 'peak_rss_mb': peak}
+
+    def record_tables(self, name: str, *frames: pd.DataFrame):
+        """Record the memory the frames hold at the end of stage name, when table_memory is set."""
+        if self.table_memory:
+            self.tables_mb[name] = frame_memory_mb(*frames)
+
+    def summary(self) -> str:
+        """One line with the seconds and memory of each stage, for logs."""
+        parts = []
+        for name, seconds in self.timings.items():
+            memory = self.memory.get(name, {})
+            part = f"{name} {seconds:.2f}s"
+            if memory.get('rss_mb') is not None:
+                part += f" rss {memory['rss_mb']:.0f}MB"
+            if memory.get('peak_rss_mb') is not None:
+                part += f" peak {memory['peak_rss_mb']:.0f}MB"
+            if name in self.tables_mb:
+                part += f" tables {self.tables_mb[name]:.1f}MB"
+            parts.append(part)
+        return ', '.join(parts)
+
+def match_inventories(jc_file, sentinels_file, agents_file, mapping_file, ns_file=None, ip_subnet_prefix=None,
+                      workers=1, reconcile=False, timer=None, snapshot=None,
+                      similarity_backend=None) -> Optional[pd.DataFrame]:
+    """
+    Load, normalize and match the inventory files into one device table with
+    DEVICE_COLUMNS (plus Sources when reconcile is set).
+
+    Runs the load, parse and match stages of compare_devices, and updates the
+    snapshot when one is given. Returns None when one of the required files
+    cannot be loaded.
+    """
+    timer = timer or StageTimer()
+
+    # Read files
+    with timer.stage('load'):
+        jc_df = load_data(jc_file, SOURCE_SPECS['jc'])
+        sentinels_df = load_data(sentinels_file, SOURCE_SPECS['sentinels'])
+        agents_df = load_data(agents_file, SOURCE_SPECS['agents'])
+        mapping_df = load_data(mapping_file, SOURCE_SPECS['mapping'])
+
+        # Load NS_List file if provided
+        ns_df = None
+        if ns_file:
+            ns_df = load_data(ns_file, SOURCE_SPECS['ns'])
+            if ns_df is None:
+                print(f"Warning: Could not load NS List file {ns_file}. NS status will be marked as 'Unknown'.")
     
-    # Create result dataframe
-    result = []
+    # Check if any required file failed to load
+    if jc_df is None or sentinels_df is None or agents_df is None or mapping_df is None:
+        print("Failed to load one or more required files. Exiting.")
+        return None
     
-    # Match JumpCloud to Sentinels based on Serial Number
-    for index, jc_row in jc_df.iterrows():
-        # Convert row to dictionary to avoid pandas Series issues in boolean contexts
-        jc_dict = jc_row.to_dict()
-        
-        # Find matching sentinel record
-        sentinel_match = sentinels_df[sentinels_df['SerialNumber'] == jc_dict['SerialNumber']]
-        
-        # Initialize with JumpCloud data
-        device_data = {
-            'DeviceName': jc_dict['DeviceName'],
-            'DisplayName': jc_dict['DeviceName'],  # Default to DeviceName if no mapping found
-            'JC_SerialNumber': jc_dict['SerialNumber'],
-            'JC_LastContact': jc_dict['JC_LastContact'],
-            'Sentinel_SerialNumber': 'Not Found',
-            'Sentinel_LastActive': None,
-            'Agent_Hostname': 'Not Found',
-            'Agent_LastSeen': None,
-            'Match_Method': [],
-            'Not_Reported_Hours': {},
-            'Email': 'Not Found',  # Added for NS lookup
-            'NS': 'Unknown'        # Added for NS status
-        }
-        
-        # Look for mapping based on hostname (case insensitive)
-        device_hostname = jc_dict['DeviceName'].lower()
-        mapping_match = mapping_df[mapping_df['HostName_lower'] == device_hostname]
-        
-        if not mapping_match.empty:
-            device_data['DisplayName'] = mapping_match.iloc[0]['displayname']
-            
-            # Extract email from mapping if available
-            if 'email' in mapping_match.columns:
-                device_data['Email'] = mapping_match.iloc[0]['email']
-            
-        # Add Sentinel data if found
-        if not sentinel_match.empty:
-            sentinel_dict = sentinel_match.iloc[0].to_dict()
-            device_data['Sentinel_SerialNumber'] = sentinel_dict['SerialNumber']
-            device_data['Sentinel_LastActive'] = sentinel_dict['Sentinel_LastActive']
-            device_data['Match_Method'].append('Serial Number')
-        
-        # Find best match in agents using fuzzywuzzy on hostname
-        best_match = None
-        best_score = 0
-        
-        # Try to match by hostname first
-        if 'Hostname' in agents_df.columns:  
-            hostname_matches = []
-            for _, agent_row in agents_df.iterrows():
-                agent_dict = agent_row.to_dict()
-                score = fuzz.ratio(jc_dict['DeviceName'].lower(), agent_dict['Hostname'].lower())
-                if score > 70:  # Threshold for fuzzy matching
-                    hostname_matches.append((agent_dict, score))
-            
-            # Sort by score descending
-            hostname_matches.sort(key=lambda x: x[1], reverse=True)
-            
-            if hostname_matches:
-                best_match = hostname_matches[0][0]
-                best_score = hostname_matches[0][1]
-                device_data['Match_Method'].append(f'Hostname Fuzzy ({best_score}%)')
-        
-        # If no good hostname match, try IP matching
-        # Convert IPAddresses to list if needed
-        ip_addresses = jc_dict['IPAddresses']
-        if isinstance(ip_addresses, pd.Series):
-            ip_addresses = ip_addresses.tolist()
-            
-        # Ensure ip_addresses is a list and not None
-        if ip_addresses is None:
-            ip_addresses = []
-        
-        if best_match is None and ip_addresses:
-            for _, agent_row in agents_df.iterrows():
-                agent_dict = agent_row.to_dict()
-                public_ip = agent_dict.get('PublicIP', '')
-                
-                if public_ip and any(public_ip == ip for ip in ip_addresses):
-                    best_match = agent_dict
-                    device_data['Match_Method'].append('IP Address')
-                    break
-        
-        # Add agent data if found
-        if best_match is not None:
-            device_data['Agent_Hostname'] = best_match.get('Hostname', 'Unknown')
-            device_data['Agent_LastSeen'] = best_match.get('Agent_LastSeen')
-        
-        # Calculate hours since last contact for each system
-        contact_times = {
-            'JumpCloud': jc_dict['JC_LastContact'],
-            'Sentinel': device_data['Sentinel_LastActive'],
-            'Agent': device_data['Agent_LastSeen']
-        }
-        
-        not_reported_hours = {}
-        is_in_range = False
-        sources_in_range = []
-        
-        for source, contact_time in contact_times.items():
-            if contact_time is not None:
-                # Ensure both times are timezone-naive for comparison
-                if contact_time.tzinfo is not None:
-                    contact_time = contact_time.replace(tzinfo=None)
-                
-                hours_since = (current_time - contact_time).total_seconds() / 3600
-                not_reported_hours[source] = hours_since
-                # Check if hours fall within our range
-                if min_time_threshold <= contact_time <= max_time_threshold:
-                    is_in_range = True
-                    sources_in_range.append(source)
-            else:
-                not_reported_hours[source] = "Unknown"
-        
-        device_data['Not_Reported_Hours'] = not_reported_hours
-        device_data['Sources_Not_Reporting'] = sources_in_range
-        
-        # Check NS status if we have a mapping and NS file
-        if ns_df is not None and device_data['Email'] != 'Not Found':
-            # Look for the email in NS file
-            if 'User' in ns_df.columns:
-                ns_match = ns_df[ns_df['User'].str.lower() == device_data['Email'].lower()]
-                if not ns_match.empty:
-                    device_data['NS'] = 'PRESENT'
-                else:
-                    device_data['NS'] = 'ABSENT'
-        
-        # Only add to results if device has not reported in the specified time range
-        if is_in_range:
-            result.append(device_data)
+    # Clean up dataframes
+    with timer.stage('parse'):
+        jc_df, jc_addresses = prepare_jumpcloud(jc_df)
+        sentinels_df = prepare_sentinels(sentinels_df)
+        agents_df = prepare_agents(agents_df)
+        mapping_df = prepare_mapping(mapping_df)
+        timer.record_tables('parse', jc_df, sentinels_df, agents_df, mapping_df)
+
+    with timer.stage('match'):
+        # Build lookup tables once so each device is joined by hash instead of a full column scan
+        context = build_match_context(sentinels_df, agents_df, mapping_df, ns_df, ip_subnet_prefix,
+                                      similarity_backend)
+
+        key_columns = jumpcloud_key_columns(jc_df)
+
+        matcher = None
+        if snapshot is not None and not reconcile and context.hostname_index is not None:
+            # Reuse the hostname matches of the last run, resolved here so pool workers only look them up
+            matcher = snapshot.hostname_matcher(context.hostname_index)
+            matcher.resolve(jumpcloud_match_keys(jc_df, jc_addresses, key_columns)[1])
+            context.hostname_index = matcher
+
+        if reconcile:
+            devices_df = reconcile_devices(jc_df, jc_addresses, sentinels_df, agents_df, context)
+        elif workers and workers > 1 and len(jc_df) > 1:
+            # Match every JumpCloud device, spread over a process pool
+            devices_df = match_devices_parallel(jc_df, jc_addresses, context, workers, key_columns)
+        else:
+            devices_df = match_devices(jc_df, jc_addresses, context, key_columns)
+
+    if snapshot is not None:
+        with timer.stage('snapshot'):
+            snapshot.save(jc_df, sentinels_df, agents_df, matcher, jc_addresses)
+    return devices_df
+
+def report_columns(reconcile: bool = False) -> List[str]:
+    """Columns of the staleness report, with Sources for reconciled device tables."""
+    return REPORT_COLUMNS + ['Sources'] if reconcile else REPORT_COLUMNS
+
+def compare_devices(jc_file, sentinels_file, agents_file, mapping_file, ns_file=None, hours_min=24, hours_max=100,
+                    ip_subnet_prefix=None, workers=1, reconcile=False, timer=None, snapshot=None,
+                    similarity_backend=None):
+    """
+    Compare devices across different inventory systems and identify those 
+    that haven't reported in the specified time range.
+
+    When ip_subnet_prefix is set (e.g. 24), devices without a hostname match can
+    also match an agent whose public IP is in the same subnet. With workers > 1
+    the matching stage runs in a process pool of that size.
+
+    With reconcile=True, all three sources are clustered into devices instead of
+    matching from JumpCloud, so Sentinel-only and agent-only devices are reported
+    too, with a Sources column listing where each device was seen.
+
+    Pass a StageTimer to collect the time spent in the load, parse, match and
+    output stages.
+
+    Pass a tools.device_snapshot.DeviceSnapshot to only fuzzy match hostnames
+    that are new or whose candidate agents changed since the last run, and to
+    update the snapshot afterwards.
+
+    Pass a tools.similarity backend (e.g. RapidfuzzBackend) to score hostnames
+    against the agents in batches instead of one pair at a time.
+    """
+    # Current time as reference point - make sure it's timezone-naive
+    current_time = datetime.now().replace(tzinfo=None)
     
-    # Convert to DataFrame
-    if result:
-        result_df = pd.DataFrame(result)
-        
-        # Create columns for each source status
-        result_df['Status'] = result_df.apply(
-            lambda row: ', '.join([f"{source}" for source in row['Sources_Not_Reporting']]), axis=1
-        )
-        
-        # Format the output for better readability - using our safe format_datetime function
-        result_df['JC_LastContact'] = result_df['JC_LastContact'].apply(format_datetime)
-        result_df['Sentinel_LastActive'] = result_df['Sentinel_LastActive'].apply(format_datetime)
-        result_df['Agent_LastSeen'] = result_df['Agent_LastSeen'].apply(format_datetime)
-        
-        # Format hours since last contact
-        result_df['Not_Reported_Summary'] = result_df['Not_Reported_Hours'].apply(
-            lambda x: ', '.join([f"{k}: {v:.1f}h" if isinstance(v, (int, float)) else f"{k}: {v}" for k, v in x.items()])
-        )
-        
-        # Sort by display name
-        result_df = result_df.sort_values('DisplayName')
-        
-        # Select and reorder columns for display as requested
-        display_columns = [
-            'DisplayName', 
-            'Status',
-            'JC_LastContact', 
-            'Sentinel_LastActive', 
-            'Agent_LastSeen',
-            'Not_Reported_Summary',
-            'NS'  # Added NS status column
-        ]
-        
-        return result_df[display_columns]
-    else:
-        # Return an empty DataFrame with the expected columns
-        return pd.DataFrame(columns=['DisplayName', 'Status', 'JC_LastContact', 
-                                     'Sentinel_LastActive', 'Agent_LastSeen',
-                                     'Not_Reported_Summary', 'NS']) 
\ No newline at end of file
+    timer = timer or StageTimer()
+    devices_df = match_inventories(jc_file, sentinels_file, agents_file, mapping_file, ns_file,
+                                   ip_subnet_prefix=ip_subnet_prefix, workers=workers, reconcile=reconcile,
+                                   timer=timer, snapshot=snapshot, similarity_backend=similarity_backend)
+    if devices_df is None:
+        return pd.DataFrame()
+
+    # Staleness and output formatting run on whole columns once matching is done
+    with timer.stage('output'):
+        return build_staleness_report(devices_df, current_time, hours_min, hours_max,
+                                      columns=report_columns(reconcile))
+
+def compare_devices_by_staleness(jc_file, sentinels_file, agents_file, mapping_file, ns_file=None,
+                                 buckets=STALENESS_BUCKETS, ip_subnet_prefix=None, workers=1, reconcile=False,
+                                 timer=None, snapshot=None,
+                                 similarity_backend=None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Like compare_devices, but report every staleness bucket from one comparison.
+
+    Returns the (counts, members) tables of build_staleness_histogram.
+    """
+    current_time = datetime.now().replace(tzinfo=None)
+
+    timer = timer or StageTimer()
+    devices_df = match_inventories(jc_file, sentinels_file, agents_file, mapping_file, ns_file,
+                                   ip_subnet_prefix=ip_subnet_prefix, workers=workers, reconcile=reconcile,
+                                   timer=timer, snapshot=snapshot, similarity_backend=similarity_backend)
+    if devices_df is None:
+        return pd.DataFrame(), pd.DataFrame()
+
+    with timer.stage('output'):
+        return build_staleness_histogram(devices_df, current_time, buckets, columns=report_columns(reconcile))
+
+@dataclass
+class ComparisonSession:
+    """A matched device table kept in memory for repeated staleness queries."""
+    session_id: str
+    devices: pd.DataFrame
+    reconcile: bool
+    last_used: float
+
+    def report(self, hours_min=24, hours_max=100, source: Optional[str] = None, ns: Optional[str] = None,
+               current_time: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        Staleness report for another hour window, without loading or matching again.
+
+        source keeps devices whose Status includes that source (JumpCloud,
+        Sentinel or Agent) and ns keeps devices with that NS value.
+        """
+        current_time = current_time or datetime.now().replace(tzinfo=None)
+        report = build_staleness_report(self.devices, current_time, hours_min, hours_max,
+                                        columns=report_columns(self.reconcile))
+        if source:
+            report = report[report['Status'].str.contains(source, regex=False)]
+        if ns:
+            report = report[report['NS'] == ns]
+        return report
+
+    def histogram(self, buckets=STALENESS_BUCKETS,
+                  current_time: Optional[datetime] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Staleness bucket counts and members, see build_staleness_histogram."""
+        current_time = current_time or datetime.now().replace(tzinfo=None)
+        return build_staleness_histogram(self.devices, current_time, buckets, columns=report_columns(self.reconcile))
+
+class ComparisonSessionStore:
+    """
+    In-memory store of comparison sessions.
+
+    A session expires ttl_seconds after it was last used, and the least recently
+    used session is dropped when more than max_sessions are stored. Safe to use
+    from several request threads.
+    """
+
+    def __init__(self, max_sessions: int = 8, ttl_seconds: float = 3600, clock: Callable[[], float] = time.monotonic):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        expired = [session_id for session_id, session in self._sessions.items()
+                   if now - session.last_used > self.ttl_seconds]
+        for session_id in expired:
+            del self._sessions[session_id]
+
+    def add(self, devices: pd.DataFrame, reconcile: bool = False) -> ComparisonSession:
+        """Store a matched device table and return its new session."""
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            session = ComparisonSession(uuid.uuid4().hex, devices, reconcile, now)
+            self._sessions[session.session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return session
+
+    def get(self, session_id: str) -> Optional[ComparisonSession]:
+        """Return a live session and mark it as used, or None if it is unknown or expired."""
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = now
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def remove(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._expire(self.clock())
+            return len(self._sessions)
+
+# Stages a comparison job reports progress for, in the order they run
+JOB_STAGES = ('load', 'parse', 'match', 'output')
+# A session job stops after matching, its device table is kept as a session
+SESSION_JOB_STAGES = ('load', 'parse', 'match')
+
+@dataclass
+class ComparisonJob:
+    """
+    A comparison running in the background, polled for progress until its report
+    can be downloaded, or until its session can be queried for a session job.
+    """
+    job_id: str
+    submitted_at: float
+    status: str = 'queued'
+    stage: Optional[str] = None
+    stages: Tuple[str, ...] = JOB_STAGES
+    session_id: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    memory: Dict[str, Dict[str, Optional[float]]] = field(default_factory=dict)
+    result: Optional[pd.DataFrame] = None
+    error: Optional[str] = None
+    finished_at: Optional[float] = None
+    future: Optional[Future] = field(default=None, repr=False)
+    cleanup: Optional[Callable[[], None]] = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('done', 'failed')
+
+    def progress(self) -> Dict:
+        """
+        Status (queued, running, done or failed) of the job as a JSON friendly dict,
+        with the state, seconds spent and memory in MB at the end of each stage.
+        """
+        timings = dict(self.timings)
+        memory = dict(self.memory)
+        names = dict.fromkeys(list(timings) + [name for name in (self.stage,) + self.stages if name])
+        stages = []
+        for name in names:
+            if name == self.stage and self.status == 'running':
+                state = 'running'
+            else:
+                state = 'done' if name in timings else 'pending'
+            seconds = round(timings[name], 3) if name in timings else None
+            rss, peak = (memory.get(name, {}).get(key) for key in ('rss_mb', 'peak_rss_mb'))
+            stages.append({
+                'name': name, 'state': state, 'seconds': seconds,
+                'rss_mb': None if rss is None else round(rss, 1),
+                'peak_rss_mb': None if peak is None else round(peak, 1)
+            })
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'stage': self.stage,
+            'stages': stages,
+            'rows': None if self.result is None else len(self.result),
+            'session_id': self.session_id,
+            'error': self.error
+        }
+
+class ComparisonJobStore:
+    """
+    Runs comparison jobs on a bounded thread pool and keeps their reports.
+
+    At most max_workers jobs run at once and at most max_queued wait for a
+    worker, submit raises RuntimeError beyond that. A finished job expires
+    ttl_seconds after it finished, and the job that finished first is dropped
+    when more than max_finished finished jobs are kept. Safe to use from
+    several request threads.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queued: int = 16, ttl_seconds: float = 3600,
+                 max_finished: int = 8, clock: Callable[[], float] = time.monotonic):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.ttl_seconds = ttl_seconds
+        self.max_finished = max_finished
+        self.clock = clock
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='device-comparison')
+
+    def _expire(self, now: float):
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and now - job.finished_at > self.ttl_seconds]
+        for job_id in expired:
+            del self._jobs[job_id]
+        # Finished jobs hold their reports, so only the most recent ones are kept
+        finished = sorted((job for job in self._jobs.values() if job.finished), key=lambda job: job.finished_at)
+        for job in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self._jobs[job.job_id]
+
+    def _run(self, job: ComparisonJob, run: Callable[[ComparisonJob, StageTimer], Optional[pd.DataFrame]]):
+        def on_stage(name: str):
+            job.stage = name
+
+        timer = StageTimer(on_stage, table_memory=True)
+        job.timings = timer.timings
+        job.memory = timer.memory
+        job.status = 'running'
+        try:
+            result, error = run(job, timer), None
+        except Exception as e:
+            print(f"Comparison job {job.job_id} failed: {e}")
+            result, error = None, str(e)
+        finally:
+            if job.cleanup is not None:
+                job.cleanup()
+
+        with self._lock:
+            job.result, job.error = result, error
+            job.status = 'failed' if error is not None else 'done'
+            job.finished_at = self.clock()
+            self._expire(job.finished_at)
+        print(f"Comparison job {job.job_id} {job.status}: {timer.summary()}")
+
+    def _submit(self, run: Callable[[ComparisonJob, StageTimer], Optional[pd.DataFrame]],
+                cleanup: Optional[Callable[[], None]], stages: Tuple[str, ...]) -> ComparisonJob:
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+            if sum(job.status == 'queued' for job in self._jobs.values()) >= self.max_queued:
+                raise RuntimeError("Too many comparison jobs are waiting, try again later")
+            job = ComparisonJob(uuid.uuid4().hex, now, stages=stages, cleanup=cleanup)
+            self._jobs[job.job_id] = job
+            job.future = self._executor.submit(self._run, job, run)
+            return job
+
+    def submit(self, run: Callable[[StageTimer], pd.DataFrame],
+               cleanup: Optional[Callable[[], None]] = None) -> ComparisonJob:
+        """
+        Queue run(timer), which returns the report, and return its new job.
+
+        cleanup is called once the job has run, or when it is removed before it started.
+        """
+        return self._submit(lambda job, timer: run(timer), cleanup, JOB_STAGES)
+
+    def submit_session(self, run: Callable[[StageTimer], Optional[pd.DataFrame]], sessions: ComparisonSessionStore,
+                       reconcile: bool = False, cleanup: Optional[Callable[[], None]] = None) -> ComparisonJob:
+        """
+        Queue run(timer), which returns a matched device table like match_inventories,
+        and keep the table as a new session of sessions.
+
+        The job has no report, its session_id is set once it is done. It fails
+        when run returns None.
+        """
+        def run_session(job: ComparisonJob, timer: StageTimer) -> None:
+            devices_df = run(timer)
+            if devices_df is None:
+                raise ValueError("Failed to load one or more required files")
+            job.session_id = sessions.add(devices_df, reconcile=reconcile).session_id
+            print(f"Created device comparison session {job.session_id} with {len(devices_df)} devices")
+
+        return self._submit(run_session, cleanup, SESSION_JOB_STAGES)
+
+    def get(self, job_id: str) -> Optional[ComparisonJob]:
+        """Return a job, or None if it is unknown or expired."""
+        with self._lock:
+            self._expire(self.clock())
+            return self._jobs.get(job_id)
+
+    def remove(self, job_id: str) -> bool:
+        """Forget a job, cancelling it if it has not started. A running job finishes, but its report is dropped."""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is None:
+            return False
+        if job.future.cancel() and job.cleanup is not None:
+            job.cleanup()
+        return True
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._expire(self.clock())
+            return len(self._jobs)
@@ -0,0 +1,224 @@
+import json
+import os
+import sqlite3
+import uuid
+from contextlib import closing
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+import pandas as pd
+
+from tools.device_comparator import (
+    HostnameCandidateIndex, fill_missing, ip_address_lists, normalize_hostname, normalize_serial
+)
+
+# Columns that decide how a record is matched, per source. Contact times are not
+# part of a record's identity, they are read fresh from every export.
+MATCH_KEY_COLUMNS = {
+    'jumpcloud': ['DeviceName', 'SerialNumber', 'IPAddresses'],
+    'sentinels': ['SerialNumber', 'EndpointName'],
+    'agents': ['Hostname', 'PublicIP']
+}
+
+class SnapshotHostnameMatcher:
+    """
+    Best fuzzy hostname matches that reuse the matches of a previous run.
+
+    A fuzz.ratio score only depends on the two hostnames, so a previous best match
+    is still the best one unless one of its agent hostnames is gone or an agent
+    hostname that was not there before scores at least as high. Only those
+    hostnames, and hostnames not seen before, are matched against every agent
+    again, so results are the same as HostnameCandidateIndex.best_match.
+    """
+
+    def __init__(self, index: HostnameCandidateIndex, previous_matches: Dict[str, Tuple[int, Tuple[str, ...]]],
+                 previous_agent_hostnames: Set[str]):
+        self.index = index
+        self.threshold = index.threshold
+        self.previous_matches = previous_matches
+        self.first_position = {}
+        for position, hostname in enumerate(index.hostnames):
+            self.first_position.setdefault(hostname, position)
+        added = [hostname for hostname in self.first_position if hostname not in previous_agent_hostnames]
+        self.added_index = HostnameCandidateIndex(added, index.threshold, index.backend) if added else None
+        self.resolved = {}
+        self.reused = 0
+        self.rematched = 0
+
+    def _rematch(self, hostname: str) -> Tuple[int, Tuple[str, ...]]:
+        self.rematched += 1
+        positions, score = self.index.best_matches(hostname)
+        return score, tuple(sorted({self.index.hostnames[position] for position in positions}))
+
+    def _reusable(self, hostname: str) -> Optional[Tuple[int, Tuple[str, ...]]]:
+        """The previous match of hostname if it still holds, otherwise None."""
+        previous = self.previous_matches.get(hostname)
+        if previous is None:
+            return None
+
+        score, winners = previous
+        if any(winner not in self.first_position for winner in winners):
+            return None
+        if self.added_index is not None:
+            position, added_score = self.added_index.best_match(hostname)
+            if position is not None and added_score >= score:
+                return None
+        return previous
+
+    def resolve(self, hostnames: List[str]):
+        """Resolve the matches of hostnames up front, so worker processes only look them up."""
+        pending = [hostname for hostname in dict.fromkeys(hostnames) if hostname not in self.resolved]
+        if self.added_index is not None:
+            self.added_index.resolve([hostname for hostname in pending if hostname in self.previous_matches])
+        previous = {hostname: self._reusable(hostname) for hostname in pending}
+
+        # Hostnames that have to be matched again are scored together
+        self.index.resolve([hostname for hostname, match in previous.items() if match is None])
+        for hostname, match in previous.items():
+            if match is None:
+                self.resolved[hostname] = self._rematch(hostname)
+            else:
+                self.reused += 1
+                self.resolved[hostname] = match
+
+    def best_match(self, hostname: str) -> Tuple[Optional[int], int]:
+        if hostname not in self.resolved:
+            self.resolve([hostname])
+        score, winners = self.resolved[hostname]
+        if not winners:
+            return None, 0
+        # Every agent with a winning hostname has the same score, ties go to the first one
+        return min(self.first_position[winner] for winner in winners), score
+
+def record_keys(df: pd.DataFrame, source: str) -> pd.Series:
+    """Stable identity of each record: its serial number when it has one, otherwise its hostname."""
+    if source == 'agents':
+        hostnames = fill_missing(df['Hostname']) if 'Hostname' in df.columns else pd.Series('', index=df.index)
+        public_ips = fill_missing(df['PublicIP']).astype(str)
+        return 'host:' + hostnames.map(normalize_hostname).fillna('') + '|' + public_ips
+    hostnames = fill_missing(df['DeviceName'] if source == 'jumpcloud' else df['EndpointName'])
+    serials = fill_missing(df['SerialNumber']).map(normalize_serial)
+    return ('serial:' + serials).fillna('host:' + hostnames.map(normalize_hostname).fillna(''))
+
+def match_key_table(df: pd.DataFrame, source: str) -> pd.DataFrame:
+    """The match key columns of a normalized source table with a record key and a hash of the keys."""
+    columns = [column for column in MATCH_KEY_COLUMNS[source] if column in df.columns]
+    table = pd.DataFrame({
+        column: df[column].map(json.dumps) if column == 'IPAddresses' else fill_missing(df[column]).astype(str)
+        for column in columns
+    })
+    table.insert(0, 'record_key', record_keys(df, source).to_numpy())
+    table['row_hash'] = pd.util.hash_pandas_object(table[columns], index=False).astype(str).to_numpy()
+    return table.drop_duplicates('record_key')
+
+def diff_records(previous: Optional[pd.DataFrame], current: pd.DataFrame) -> Dict[str, int]:
+    """Count added, changed, removed and unchanged records between two match key tables."""
+    if previous is None:
+        return {'added': len(current), 'changed': 0, 'removed': 0, 'unchanged': 0}
+    merged = previous[['record_key', 'row_hash']].merge(
+        current[['record_key', 'row_hash']], on='record_key', how='outer', suffixes=('_previous', '_current'),
+        indicator=True
+    )
+    both = merged[merged['_merge'] == 'both']
+    unchanged = int((both['row_hash_previous'] == both['row_hash_current']).sum())
+    return {
+        'added': int((merged['_merge'] == 'right_only').sum()),
+        'changed': len(both) - unchanged,
+        'removed': int((merged['_merge'] == 'left_only').sum()),
+        'unchanged': unchanged
+    }
+
+class DeviceSnapshot:
+    """
+    SQLite snapshot of a comparison run: the match keys of each normalized source
+    and the resolved hostname matches, keyed by normalized JumpCloud hostname.
+
+    Pass it to compare_devices(snapshot=...) to only fuzzy match hostnames that
+    are new or whose agents changed since the last run. The snapshot can only
+    save work, results are the same with an empty or unrelated snapshot.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.stats = {}
+
+    def _connect(self, path: Optional[str] = None):
+        return closing(sqlite3.connect(path or self.path))
+
+    def _read_table(self, conn, table: str) -> Optional[pd.DataFrame]:
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+        return pd.read_sql(f"SELECT * FROM {table}", conn) if exists else None
+
+    def _read_meta(self, conn) -> Dict[str, str]:
+        meta = self._read_table(conn, 'meta')
+        return {} if meta is None else dict(zip(meta['key'], meta['value']))
+
+    def hostname_matcher(self, index: HostnameCandidateIndex) -> SnapshotHostnameMatcher:
+        """Wrap the agent hostname index of this run with the matches of the snapshot."""
+        previous_matches, previous_agents = {}, set()
+        if not os.path.exists(self.path):
+            return SnapshotHostnameMatcher(index, previous_matches, previous_agents)
+        with self._connect() as conn:
+            meta = self._read_meta(conn)
+            # Matches made with another threshold cannot be reused
+            if meta.get('threshold') == str(index.threshold):
+                matches = self._read_table(conn, 'hostname_matches')
+                agents = self._read_table(conn, 'agent_hostnames')
+                if matches is not None and agents is not None:
+                    previous_matches = {
+                        hostname: (int(score), tuple(json.loads(winners)))
+                        for hostname, score, winners in zip(matches['hostname'], matches['score'], matches['winners'])
+                    }
+                    previous_agents = set(agents['hostname'])
+        return SnapshotHostnameMatcher(index, previous_matches, previous_agents)
+
+    def save(self, jc_df: pd.DataFrame, sentinels_df: pd.DataFrame, agents_df: pd.DataFrame,
+             matcher: Optional[SnapshotHostnameMatcher] = None, jc_addresses: Optional[pd.DataFrame] = None):
+        """
+        Diff the normalized sources against the snapshot, then replace it with this run.
+
+        jc_addresses is the (device, ip) table of the JumpCloud devices; their
+        address lists are part of each device's match keys.
+
+        The new snapshot is written to a temporary file and moved into place, so a
+        concurrent run never reads matches and agent hostnames from different runs.
+        """
+        if jc_addresses is not None:
+            jc_df = jc_df.assign(IPAddresses=ip_address_lists(jc_addresses, len(jc_df)))
+        tables = {
+            'jumpcloud': match_key_table(jc_df, 'jumpcloud'),
+            'sentinels': match_key_table(sentinels_df, 'sentinels'),
+            'agents': match_key_table(agents_df, 'agents')
+        }
+        previous = {source: None for source in tables}
+        if os.path.exists(self.path):
+            with self._connect() as conn:
+                previous = {source: self._read_table(conn, f"{source}_records") for source in tables}
+        self.stats = {source: diff_records(previous[source], table) for source, table in tables.items()}
+
+        temp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        with self._connect(temp_path) as conn:
+            for source, table in tables.items():
+                table.to_sql(f"{source}_records", conn, if_exists='replace', index=False)
+
+            meta = {'created_at': datetime.now().isoformat(timespec='seconds')}
+            if matcher is not None:
+                self.stats['hostnames'] = {'reused': matcher.reused, 'rematched': matcher.rematched}
+                meta['threshold'] = str(matcher.threshold)
+                pd.DataFrame({
+                    'hostname': list(matcher.resolved),
+                    'score': [score for score, _ in matcher.resolved.values()],
+                    'winners': [json.dumps(list(winners)) for _, winners in matcher.resolved.values()]
+                }).to_sql('hostname_matches', conn, if_exists='replace', index=False)
+                pd.DataFrame({'hostname': list(matcher.first_position)}).to_sql(
+                    'agent_hostnames', conn, if_exists='replace', index=False
+                )
+            pd.DataFrame({'key': list(meta), 'value': list(meta.values())}).to_sql(
+                'meta', conn, if_exists='replace', index=False
+            )
+            conn.commit()
+        os.replace(temp_path, self.path)
+
+        print(f"Snapshot {self.path} updated: " + ', '.join(
+            f"{source} {counts}" for source, counts in self.stats.items()
+        ))
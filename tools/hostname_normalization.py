@@ -0,0 +1,65 @@
+import sys
+from functools import lru_cache
+from typing import FrozenSet, List, NamedTuple
+
+from fuzzywuzzy import fuzz, utils
+
+class HostnameForms(NamedTuple):
+    """
+    Normalized forms of one hostname, computed once and shared by every comparison.
+
+    For "JSmiths-MBP.corp.example.com" the canonical form is
+    "jsmiths-mbp.corp.example.com", the domainless form "jsmiths-mbp", the owner
+    "jsmiths" and the alternative owner "jsmiths" (up to the "s-" plus the "s").
+    """
+    canonical: str
+    domainless: str
+    owner: str
+    owner_alt: str
+    tokens: FrozenSet[str]
+    sorted_tokens: str
+
+@lru_cache(maxsize=262144)
+def hostname_forms(hostname: str) -> HostnameForms:
+    """
+    Normalized forms of a hostname string, interned so repeated hostnames share them.
+
+    The owner is the part before the first '-', empty without a '-'. The tokens
+    are the ones fuzzywuzzy's token ratios split the hostname into.
+    """
+    canonical = sys.intern(hostname.strip().lower())
+    tokens = utils.full_process(canonical, force_ascii=True).split()
+    return HostnameForms(
+        canonical=canonical,
+        domainless=sys.intern(canonical.split('.')[0]),
+        owner=sys.intern(canonical.split('-')[0]) if '-' in canonical else '',
+        owner_alt=sys.intern(canonical.split('s-')[0] + 's') if 's-' in canonical else '',
+        tokens=frozenset(tokens),
+        sorted_tokens=' '.join(sorted(tokens))
+    )
+
+def normalize_hostnames(values) -> List[HostnameForms]:
+    """Normalized forms of each value of a hostname column."""
+    return [hostname_forms(str(value)) for value in values]
+
+def canonical_hostname(value) -> str:
+    """Stripped, lowercase hostname used as a lookup and fuzzy matching key."""
+    return hostname_forms(str(value)).canonical
+
+def token_sort_ratio(a: HostnameForms, b: HostnameForms) -> int:
+    """fuzz.token_sort_ratio of two canonical hostnames, from their precomputed tokens."""
+    return fuzz.ratio(a.sorted_tokens, b.sorted_tokens)
+
+def token_set_ratio(a: HostnameForms, b: HostnameForms) -> int:
+    """fuzz.token_set_ratio of two canonical hostnames, from their precomputed tokens."""
+    if not a.tokens or not b.tokens:
+        return 0
+
+    sorted_sect = ' '.join(sorted(a.tokens & b.tokens))
+    combined_1to2 = (sorted_sect + ' ' + ' '.join(sorted(a.tokens - b.tokens))).strip()
+    combined_2to1 = (sorted_sect + ' ' + ' '.join(sorted(b.tokens - a.tokens))).strip()
+    return max(
+        fuzz.ratio(sorted_sect, combined_1to2),
+        fuzz.ratio(sorted_sect, combined_2to1),
+        fuzz.ratio(combined_1to2, combined_2to1)
+    )
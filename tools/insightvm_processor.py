@@ -1,10 +1,21 @@
 import csv
-import pandas as pd
+import hashlib
+import json
+import multiprocessing
+import tempfile
+import uuid
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import os
 from fuzzywuzzy import fuzz
 from typing import List, Dict, Tuple, Optional
 from pathlib import Path
 
+from tools.hostname_normalization import HostnameForms, hostname_forms, token_set_ratio, token_sort_ratio
+from tools.similarity import BLOCK_ROWS, SCORERS, SimilarityBackend
+from tools.streaming_workbook import StreamingWorkbook
+
 def sanitize_sheet_name(sheet_name: str) -> str:
     """
     Sanitizes sheet names to remove any invalid characters for Excel.
@@ -14,82 +25,626 @@ def sanitize_sheet_name(sheet_name: str) -> str:
         sheet_name = sheet_name.replace(char, '_')
     return sheet_name[:31]
 
-def improved_fuzzy_match_hostname(hostname: str, enrichment_data: Dict, threshold: int = 65) -> Tuple[Optional[str], float]:
+def owner_prefix(forms: HostnameForms) -> str:
+    """Owner name of an InsightVM hostname (assuming format like "owner-device.domain"), or the whole hostname."""
+    return forms.owner if '-' in forms.canonical else forms.canonical
+
+def weighted_hostname_score(token_set, partial_ratio, token_sort, owner_match_score):
+    """Weighted average of the four ratios, for single scores and for numpy arrays of them alike."""
+    # Use a weighted average of different ratios with higher weight for owner matching
+    return (token_set * 0.25 +           # Weight for word matching regardless of order
+            partial_ratio * 0.25 +       # Weight for partial string matching
+            token_sort * 0.15 +          # Weight for sorted word matching
+            owner_match_score * 0.35)    # Weight for owner name matching
+
+# Score of a hostname whose four ratios are all 100, nothing scores higher
+MAX_COMBINED_SCORE = weighted_hostname_score(100, 100, 100, 100)
+
+# fuzz.ratio only gives two different strings 100 when the shorter one has at least this many characters
+RATIO_EXACT_LENGTH = 100
+
+def combined_hostname_score(query: HostnameForms, hostname_parts: str, enrich: HostnameForms) -> float:
+    """Weighted score of an InsightVM hostname against one inventory hostname, see improved_fuzzy_match_hostname."""
+    # Calculate different types of fuzzy ratios
+    token_set = token_set_ratio(query, enrich)
+    partial_ratio = fuzz.partial_ratio(query.canonical, enrich.canonical)
+    token_sort = token_sort_ratio(query, enrich)
+    
+    # Calculate owner name similarity (higher weight for owner matching)
+    owner_match_score = 0
+    if hostname_parts and (enrich.owner or enrich.owner_alt):
+        owner_ratio1 = fuzz.ratio(hostname_parts, enrich.owner)
+        owner_ratio2 = fuzz.ratio(hostname_parts, enrich.owner_alt)
+        owner_match_score = max(owner_ratio1, owner_ratio2)
+    
+    return weighted_hostname_score(token_set, partial_ratio, token_sort, owner_match_score)
+
+def ratio_bound(matched: np.ndarray, total: np.ndarray) -> np.ndarray:
+    """
+    Upper bound of fuzz.ratio from the characters two strings have in common and
+    their total length.
+
+    Rounded up, fuzz.ratio rounds a ratio it computes as 1 - distance / total,
+    which can land just above a .5 this one lands on.
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio = 2 * matched / total
+    # Two empty strings are equal
+    return np.where(total == 0, 100, np.ceil(100 * ratio))
+
+def partial_ratio_bound(matched: np.ndarray, query_length: int, lengths: np.ndarray) -> np.ndarray:
+    """
+    Upper bound of fuzz.partial_ratio from the characters two strings have in common.
+
+    The best window of the longer string shares at most matched characters with
+    the shorter one, so its ratio is at most 2 * matched / (shorter + matched).
+    """
+    shorter = np.minimum(lengths, query_length)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio = 2 * matched / (shorter + matched)
+    # Rounded up like ratio_bound, which also covers the 100 partial_ratio gives above .995
+    bound = np.where(shorter == 0, 0, np.ceil(100 * ratio))
+    return np.where(lengths + query_length == 0, 100, bound)
+
+class CharacterProfiles:
+    """Character counts of a list of strings, to bound fuzz ratios against a query without scoring."""
+
+    def __init__(self, strings: List[str]):
+        self.lengths = np.fromiter(map(len, strings), dtype=np.int64, count=len(strings))
+        chars = np.array(list(''.join(strings)), dtype='U1')
+        alphabet, char_columns = np.unique(chars, return_inverse=True)
+        self.columns = {char: column for column, char in enumerate(alphabet.tolist())}
+        # One row per character, so a query only reads the rows of its own characters
+        self.counts = np.zeros((len(alphabet), len(strings)), dtype=np.uint16)
+        np.add.at(self.counts, (char_columns, np.repeat(np.arange(len(strings)), self.lengths)), 1)
+
+    def matched(self, query: str) -> np.ndarray:
+        """Characters each string has in common with the query, counted with multiplicity."""
+        matched = np.zeros(self.counts.shape[1], dtype=np.int64)
+        for char, count in Counter(query).items():
+            column = self.columns.get(char)
+            if column is not None:
+                matched += np.minimum(self.counts[column], count)
+        return matched
+
+class EnrichmentIndex:
+    """
+    Normalized forms of the inventory hostnames, built once per inventory.
+
+    Each entry holds the canonical hostname, its owner prefix, the "s-" alternate
+    prefix and its tokens (see HostnameForms), so matching an InsightVM hostname
+    only scores it against them, in inventory order.
+
+    best_match does not score every hostname. Hostnames are bucketed by owner
+    prefix and character profiles give an upper bound of each combined score,
+    so only hostnames whose bound reaches the threshold and the best score so
+    far are scored. The matches are the same as scoring every hostname.
+    """
+
+    def __init__(self, hostnames):
+        self.hostnames = list(hostnames)
+        self.forms = [hostname_forms(hostname) for hostname in self.hostnames]
+        # Columns of the forms, as the batched scorers take them
+        self.names = [forms.canonical for forms in self.forms]
+        self.owners = [forms.owner for forms in self.forms]
+        self.owner_alts = [forms.owner_alt for forms in self.forms]
+        self.has_owner = np.array([bool(forms.owner or forms.owner_alt) for forms in self.forms], dtype=bool)
+
+        # First position of each canonical hostname, and the positions of each owner prefix
+        self.position_by_name = {}
+        self.positions_by_owner = {}
+        for position, forms in enumerate(self.forms):
+            self.position_by_name.setdefault(forms.canonical, position)
+            for owner in {forms.owner, forms.owner_alt} - {''}:
+                self.positions_by_owner.setdefault(owner, []).append(position)
+
+        # Positions of the hostnames holding each token
+        self.token_positions = {}
+        for position, forms in enumerate(self.forms):
+            for token in forms.tokens:
+                self.token_positions.setdefault(token, []).append(position)
+        self.token_positions = {token: np.array(positions) for token, positions in self.token_positions.items()}
+        self.has_tokens = np.array([bool(forms.tokens) for forms in self.forms], dtype=bool)
+
+        self.name_profiles = CharacterProfiles(self.names)
+        self.token_profiles = CharacterProfiles([forms.sorted_tokens for forms in self.forms])
+        # token_set_ratio compares each distinct token once
+        self.token_set_profiles = CharacterProfiles([' '.join(sorted(forms.tokens)) for forms in self.forms])
+        # Owner ratios are bounded once per distinct owner prefix and spread to its hostnames
+        owner_buckets, self.owner_bucket = np.unique(np.array(self.owners, dtype=object), return_inverse=True)
+        alt_buckets, self.owner_alt_bucket = np.unique(np.array(self.owner_alts, dtype=object), return_inverse=True)
+        self.owner_profiles = CharacterProfiles(owner_buckets.tolist())
+        self.owner_alt_profiles = CharacterProfiles(alt_buckets.tolist())
+
+    def __len__(self) -> int:
+        return len(self.hostnames)
+
+    def score_bounds(self, query: HostnameForms, hostname_parts: str) -> np.ndarray:
+        """Upper bound of combined_hostname_score of the query against every hostname."""
+        token_sort = ratio_bound(self.token_profiles.matched(query.sorted_tokens),
+                                 len(query.sorted_tokens) + self.token_profiles.lengths)
+
+        # token_set_ratio is the best of ratio(shared, query tokens), ratio(shared, tokens) and
+        # ratio(query tokens, tokens). The first two are known from the length of the shared tokens.
+        query_token_set = ' '.join(sorted(query.tokens))
+        query_tokens = len(query_token_set)
+        tokens = self.token_set_profiles.lengths
+        shared_length = np.zeros(len(self), dtype=np.int64)
+        shared_count = np.zeros(len(self), dtype=np.int64)
+        for token in query.tokens:
+            positions = self.token_positions.get(token)
+            if positions is not None:
+                shared_length[positions] += len(token)
+                shared_count[positions] += 1
+        shared_length += np.maximum(shared_count - 1, 0)
+        token_set = np.maximum.reduce([
+            ratio_bound(shared_length, shared_length + query_tokens),
+            ratio_bound(shared_length, shared_length + tokens),
+            ratio_bound(self.token_set_profiles.matched(query_token_set), query_tokens + tokens)
+        ])
+        token_set = np.where(self.has_tokens & bool(query.tokens), token_set, 0)
+
+        partial = partial_ratio_bound(self.name_profiles.matched(query.canonical), len(query.canonical),
+                                      self.name_profiles.lengths)
+
+        owner_match = np.zeros(len(self))
+        if hostname_parts:
+            owner = ratio_bound(self.owner_profiles.matched(hostname_parts),
+                                len(hostname_parts) + self.owner_profiles.lengths)
+            owner_alt = ratio_bound(self.owner_alt_profiles.matched(hostname_parts),
+                                    len(hostname_parts) + self.owner_alt_profiles.lengths)
+            owner_match = np.where(self.has_owner,
+                                   np.maximum(owner[self.owner_bucket], owner_alt[self.owner_alt_bucket]), 0)
+
+        return weighted_hostname_score(token_set, partial, token_sort, owner_match)
+
+    def best_match(self, hostname: str, threshold: int = 65) -> Tuple[Optional[str], float]:
+        """Best scoring inventory hostname at or above the threshold, ties going to the first one."""
+        best_match = None
+        best_score = 0
+        best_position = None
+
+        query = hostname_forms(hostname)
+        hostname_parts = owner_prefix(query)
+
+        # An exact hit with the highest possible score is the match. Only a hostname with the same
+        # owner prefix can score as high, so the earlier hostnames of that bucket are the only ties.
+        position = self.position_by_name.get(query.canonical)
+        if position is not None and len(hostname_parts) < RATIO_EXACT_LENGTH:
+            score = combined_hostname_score(query, hostname_parts, self.forms[position])
+            if score == MAX_COMBINED_SCORE and score >= threshold:
+                for other in self.positions_by_owner.get(hostname_parts, []):
+                    if other >= position:
+                        break
+                    if combined_hostname_score(query, hostname_parts, self.forms[other]) == score:
+                        position = other
+                        break
+                return self.hostnames[position], score
+
+        bounds = self.score_bounds(query, hostname_parts)
+        candidates = np.flatnonzero((bounds > 0) & (bounds >= threshold))
+        # Highest bounds first, so the best score rises quickly and cuts the scan short
+        for position in candidates[np.argsort(-bounds[candidates], kind='stable')].tolist():
+            bound = bounds[position]
+            if bound < best_score:
+                break
+            if bound == best_score and position > best_position:
+                continue
+            combined_score = combined_hostname_score(query, hostname_parts, self.forms[position])
+            if combined_score < threshold or combined_score <= 0:
+                continue
+            # Ties go to the first inventory hostname, as when every hostname is scored in order
+            if combined_score > best_score or (combined_score == best_score and position < best_position):
+                best_match, best_score, best_position = self.hostnames[position], combined_score, position
+
+        return best_match, best_score
+
+    def best_matches(self, hostnames: List[str], threshold: int = 65,
+                     backend: Optional[SimilarityBackend] = None) -> List[Tuple[Optional[str], float]]:
+        """
+        best_match for many hostnames, scoring blocks of them against the whole
+        inventory with a batched similarity backend. Without one every hostname
+        goes through best_match, whose pruning scores far fewer pairs.
+
+        Scorers the backend does not compute exactly are upper bounds of fuzzywuzzy's,
+        so the combined scores are upper bounds too. Candidates are then rescored
+        exactly in order of their bound until no bound can reach the best exact score,
+        so the matches are the same as best_match's.
+        """
+        if backend is None or not backend.batched:
+            return [self.best_match(hostname, threshold) for hostname in hostnames]
+        exact = set(SCORERS) <= backend.exact_scorers
+        candidates = self.forms
+        results = []
+        for start in range(0, len(hostnames), BLOCK_ROWS):
+            queries = [hostname_forms(hostname) for hostname in hostnames[start:start + BLOCK_ROWS]]
+            if not candidates:
+                results.extend((None, 0) for _ in queries)
+                continue
+
+            scores = combined_score_matrix(queries, self, backend)
+            for query, row in zip(queries, scores):
+                best_match, best_score = None, 0
+                if exact:
+                    eligible = (row > 0) & (row >= threshold)
+                    if eligible.any():
+                        position = int(np.argmax(np.where(eligible, row, -np.inf)))
+                        best_match, best_score = self.hostnames[position], float(row[position])
+                    results.append((best_match, best_score))
+                    continue
+
+                hostname_parts = owner_prefix(query)
+                best_position = None
+                for position in np.argsort(-row, kind='stable').tolist():
+                    bound = row[position]
+                    if bound <= 0 or bound < threshold or bound < best_score:
+                        break
+                    score = combined_hostname_score(query, hostname_parts, candidates[position])
+                    if score < threshold or score <= 0:
+                        continue
+                    # Ties go to the first inventory hostname, as in the pairwise loop
+                    if score > best_score or (score == best_score and position < best_position):
+                        best_match, best_score, best_position = self.hostnames[position], score, position
+                results.append((best_match, best_score))
+        return results
+
+def improved_fuzzy_match_hostname(hostname: str, enrichment_data: Dict, threshold: int = 65,
+                                  backend: Optional[SimilarityBackend] = None,
+                                  index: Optional[EnrichmentIndex] = None) -> Tuple[Optional[str], float]:
     """
     Enhanced fuzzy matching that considers both token set ratio and partial ratio
     to better match hostnames with similar words, with priority for owner name matching.
+
+    Pass the EnrichmentIndex of enrichment_data when matching many hostnames, so
+    the inventory is normalized once. With a similarity backend the inventory is
+    scored in one batch, see match_hostnames_batch.
     """
-    best_match = None
-    best_score = 0
-    
-    # Clean and normalize the input hostname
-    hostname = hostname.lower().strip()
-    
-    # Extract owner name if possible (assuming format like "owner-device.domain")
-    hostname_parts = hostname.split('-')[0] if '-' in hostname else hostname
-    
-    for enrich_hostname in enrichment_data.keys():
-        # Clean and normalize the enrichment hostname
-        enrich_hostname_clean = enrich_hostname.lower().strip()
-        
-        # Extract owner name from enrichment hostname if possible
-        enrich_hostname_parts = enrich_hostname_clean.split('-')[0] if '-' in enrich_hostname_clean else ""
-        enrich_hostname_parts_alt = enrich_hostname_clean.split('s-')[0] + 's' if 's-' in enrich_hostname_clean else ""
-        
-        # Calculate different types of fuzzy ratios
-        token_set_ratio = fuzz.token_set_ratio(hostname, enrich_hostname_clean)
-        partial_ratio = fuzz.partial_ratio(hostname, enrich_hostname_clean)
-        token_sort_ratio = fuzz.token_sort_ratio(hostname, enrich_hostname_clean)
-        
-        # Calculate owner name similarity (higher weight for owner matching)
-        owner_match_score = 0
-        if hostname_parts and (enrich_hostname_parts or enrich_hostname_parts_alt):
-            owner_ratio1 = fuzz.ratio(hostname_parts, enrich_hostname_parts)
-            owner_ratio2 = fuzz.ratio(hostname_parts, enrich_hostname_parts_alt)
-            owner_match_score = max(owner_ratio1, owner_ratio2)
-        
-        # Use a weighted average of different ratios with higher weight for owner matching
-        combined_score = (token_set_ratio * 0.25 +     # Weight for word matching regardless of order
-                          partial_ratio * 0.25 +       # Weight for partial string matching
-                          token_sort_ratio * 0.15 +    # Weight for sorted word matching
-                          owner_match_score * 0.35)    # Weight for owner name matching
-        
-        # Update best match if this score is higher
-        if combined_score > best_score and combined_score >= threshold:
-            best_score = combined_score
-            best_match = enrich_hostname
-            
-    return best_match, best_score
+    index = index if index is not None else EnrichmentIndex(enrichment_data)
+    if backend is not None:
+        return index.best_matches([hostname], threshold, backend)[0]
+    return index.best_match(hostname, threshold)
+
+def combined_score_matrix(queries: List[HostnameForms], index: EnrichmentIndex,
+                          backend: SimilarityBackend) -> np.ndarray:
+    """combined_hostname_score of every query against every indexed hostname, scored by the backend."""
+    query_names = [forms.canonical for forms in queries]
+    candidate_names = index.names
+    query_owners = [owner_prefix(forms) for forms in queries]
+
+    owner_scores = np.maximum(
+        backend.score_matrix(query_owners, index.owners, 'ratio'),
+        backend.score_matrix(query_owners, index.owner_alts, 'ratio')
+    )
+    has_owners = np.array([bool(owner) for owner in query_owners])[:, None] & index.has_owner[None, :]
+    owner_scores = np.where(has_owners, owner_scores, 0)
 
-def process_insightvm_file(insightvm_csv: str, enrichment_data: Dict) -> Tuple[List[Dict], List[str]]:
+    # Same weights and order of additions as combined_hostname_score, so the floats are equal
+    return weighted_hostname_score(
+        backend.score_matrix(query_names, candidate_names, 'token_set'),
+        backend.score_matrix(query_names, candidate_names, 'partial'),
+        backend.score_matrix(query_names, candidate_names, 'token_sort'),
+        owner_scores
+    )
+
+def match_hostnames_batch(hostnames: List[str], inventory_hostnames: List[str], threshold: int = 65,
+                          backend: Optional[SimilarityBackend] = None,
+                          index: Optional[EnrichmentIndex] = None) -> List[Tuple[Optional[str], float]]:
     """
-    Process each InsightVM file, match hostnames using enhanced fuzzy matching, and extract relevant data.
+    improved_fuzzy_match_hostname for many hostnames, scoring blocks of them against
+    the whole inventory with a similarity backend, see EnrichmentIndex.best_matches.
     """
-    matched_assets = []
-    unmatched_assets = []
+    index = index if index is not None else EnrichmentIndex(inventory_hostnames)
+    return index.best_matches(hostnames, threshold, backend)
+
+# Matches kept by a MatchCache, and persisted match files kept in a cache directory
+MATCH_CACHE_MAX_ENTRIES = 100000
+MATCH_CACHE_MAX_FILES = 32
+
+class MatchCache:
+    """
+    Best inventory match of each normalized hostname, so a hostname that appears
+    in several InsightVM files of an upload is matched once.
+
+    Holds at most max_entries matches and drops the least recently used one
+    beyond that. With a path, matches are loaded from and saved to that file;
+    for_inventory names it after the inventory content, so saved matches are
+    only reused against the same inventory.
+    """
+
+    def __init__(self, max_entries: int = MATCH_CACHE_MAX_ENTRIES, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.path = path
+        self.lookups = 0
+        self.misses = 0
+        self._matches = OrderedDict()
+        if path and os.path.exists(path):
+            self.load()
+
+    @classmethod
+    def for_inventory(cls, inventory_csv: str, cache_dir: Optional[str] = None,
+                      max_entries: int = MATCH_CACHE_MAX_ENTRIES) -> 'MatchCache':
+        """Cache for one inventory file, persisted in cache_dir when it is set."""
+        if not cache_dir:
+            return cls(max_entries)
+        digest = hashlib.sha256()
+        with open(inventory_csv, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        return cls(max_entries, os.path.join(cache_dir, f"{digest.hexdigest()}.json"))
+
+    def __len__(self) -> int:
+        return len(self._matches)
+
+    @property
+    def hits(self) -> int:
+        return self.lookups - self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    def get(self, key: str) -> Optional[Tuple[Optional[str], float]]:
+        match = self._matches.get(key)
+        if match is not None:
+            self._matches.move_to_end(key)
+        return match
+
+    def put(self, key: str, match: Tuple[Optional[str], float]):
+        self._matches[key] = match
+        self._matches.move_to_end(key)
+        while len(self._matches) > self.max_entries:
+            self._matches.popitem(last=False)
+
+    def items(self) -> List[Tuple[str, Tuple[Optional[str], float]]]:
+        return list(self._matches.items())
+
+    def stats(self) -> Dict:
+        return {'lookups': self.lookups, 'hits': self.hits, 'hit_rate': round(self.hit_rate, 4)}
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                entries = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable match cache {self.path}: {e}")
+            return
+        for key, match, score in entries:
+            self.put(key, (match, score))
+
+    def save(self):
+        """Write the matches to the cache file, replacing it at once so a concurrent reader never sees half a file."""
+        if not self.path:
+            return
+        cache_dir = os.path.dirname(self.path)
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump([[key, match, score] for key, (match, score) in self._matches.items()], file)
+        os.replace(temp_path, self.path)
+        # Keep only the most recently used cache files
+        entries = sorted(Path(cache_dir).glob('*.json'), key=lambda path: path.stat().st_mtime, reverse=True)
+        for path in entries[MATCH_CACHE_MAX_FILES:]:
+            path.unlink(missing_ok=True)
+
+def match_hostnames(hostnames: List[str], index: EnrichmentIndex, backend: Optional[SimilarityBackend] = None,
+                    cache: Optional[MatchCache] = None) -> List[Tuple[Optional[str], float]]:
+    """
+    Best match of each hostname, matching each normalized hostname only once.
+
+    Matches depend only on the normalized hostname, so hostnames already in the
+    cache and repeats within the list are not matched again.
+    """
+    cache = cache if cache is not None else MatchCache()
+    keys = [hostname_forms(hostname).canonical for hostname in hostnames]
+    # Hits are kept here, as putting the new matches can evict them from a full cache
+    matches = {}
+    missing = {}
+    for key, hostname in zip(keys, hostnames):
+        if key in matches or key in missing:
+            continue
+        match = cache.get(key)
+        if match is None:
+            missing[key] = hostname
+        else:
+            matches[key] = match
+    cache.lookups += len(keys)
+    cache.misses += len(missing)
+
+    for key, match in zip(missing, index.best_matches(list(missing.values()), backend=backend)):
+        matches[key] = match
+        cache.put(key, match)
+    return [matches[key] for key in keys]
+
+# Columns of the per-file sheets and of the unmatched summary sheet
+MATCHED_COLUMNS = ["Hostname", "Asset Name", "Serial Number"]
+UNMATCHED_COLUMNS = ["Source File", "Unmatched Hostname"]
+
+# InsightVM rows read and matched at a time, so a scan is never held in memory whole
+CHUNK_ROWS = 10000
+
+def iter_insightvm_file(insightvm_csv: str, enrichment_data: Dict,
+                        backend: Optional[SimilarityBackend] = None,
+                        index: Optional[EnrichmentIndex] = None,
+                        cache: Optional[MatchCache] = None,
+                        chunk_rows: int = CHUNK_ROWS):
+    """
+    Yield (matched assets, unmatched assets) of consecutive chunks of an InsightVM file.
+
+    Yields at least once, an empty file giving one empty chunk. Matching is per
+    hostname, so the chunks together equal matching the whole file.
+    """
+    index = index if index is not None else EnrichmentIndex(enrichment_data)
+    cache = cache if cache is not None else MatchCache()
+
+    def match_chunk(hostnames: List[str]) -> Tuple[List[Dict], List[str]]:
+        matched_assets = []
+        unmatched_assets = []
+        matches = match_hostnames(hostnames, index, backend, cache)
+        for hostname, (matched_hostname, score) in zip(hostnames, matches):
+            if matched_hostname:
+                matched_data = {
+                    "Hostname": hostname,
+                    "Asset Name": enrichment_data[matched_hostname]["displayName"],
+                    "Serial Number": enrichment_data[matched_hostname]["serialNumber"]
+                }
+                matched_assets.append(matched_data)
+            else:
+                unmatched_assets.append(hostname)
+        return matched_assets, unmatched_assets
 
     with open(insightvm_csv, "r", encoding='utf-8-sig') as file:
         reader = csv.DictReader(file)
+        hostnames = []
+        yielded = False
         for row in reader:
             hostname = row.get("Asset Name")
             if hostname:
-                matched_hostname, score = improved_fuzzy_match_hostname(hostname, enrichment_data)
-
-                if matched_hostname:
-                    matched_data = {
-                        "Hostname": hostname,
-                        "Asset Name": enrichment_data[matched_hostname]["displayName"],
-                        "Serial Number": enrichment_data[matched_hostname]["serialNumber"]
-                    }
-                    matched_assets.append(matched_data)
-                else:
-                    unmatched_assets.append(hostname)
+                hostnames.append(hostname)
             else:
                 print(f"Warning: Missing 'Asset Name' in row {row}")
+            if len(hostnames) >= chunk_rows:
+                yield match_chunk(hostnames)
+                hostnames = []
+                yielded = True
+        if hostnames or not yielded:
+            yield match_chunk(hostnames)
+
+def process_insightvm_file(insightvm_csv: str, enrichment_data: Dict,
+                           backend: Optional[SimilarityBackend] = None,
+                           index: Optional[EnrichmentIndex] = None,
+                           cache: Optional[MatchCache] = None) -> Tuple[List[Dict], List[str]]:
+    """
+    Process each InsightVM file, match hostnames using enhanced fuzzy matching, and extract relevant data.
 
+    index is the EnrichmentIndex of enrichment_data, built here when not given.
+    Hostnames already in the match cache are not matched again. With a similarity
+    backend all other hostnames of the file are matched in one batch.
+    """
+    matched_assets = []
+    unmatched_assets = []
+    for matched_chunk, unmatched_chunk in iter_insightvm_file(insightvm_csv, enrichment_data, backend, index, cache,
+                                                               chunk_rows=float('inf')):
+        matched_assets.extend(matched_chunk)
+        unmatched_assets.extend(unmatched_chunk)
     return matched_assets, unmatched_assets
 
-def process_insightvm_files(insightvm_csv_files: List[str], inventory_csv: str, output_directory: str) -> str:
+# The web app matches files from request threads, which must not be forked, so workers come from a fork server
+POOL_CONTEXT = multiprocessing.get_context(
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+)
+
+# Enrichment data, index, backend and match cache of the current pool worker, set once by _init_file_worker
+_worker_state = None
+
+def _init_file_worker(enrichment_data: Dict, index: EnrichmentIndex, backend: Optional[SimilarityBackend],
+                      cached_matches: List, max_entries: int):
+    global _worker_state
+    cache = MatchCache(max_entries)
+    for key, match in cached_matches:
+        cache.put(key, match)
+    _worker_state = (enrichment_data, index, backend, cache)
+
+def spool_paths(spool_prefix: str) -> Tuple[str, str]:
+    """Files a pool worker writes the matched rows and the unmatched hostnames of one InsightVM file to."""
+    return f"{spool_prefix}_matched.csv", f"{spool_prefix}_unmatched.csv"
+
+def _process_file_in_worker(insightvm_csv: str, spool_prefix: str):
+    """
+    Match an InsightVM file in a pool worker, chunk by chunk like iter_insightvm_file.
+
+    Matched rows and unmatched hostnames are appended to the spool_paths files
+    as each chunk is matched, so neither the worker nor the parent holds the
+    file's rows. Returns (lookups, misses, matches of the file's hostnames) so
+    the parent can update its cache, or the exception the file raised so the
+    parent reports it like a serial run.
+    """
+    enrichment_data, index, backend, cache = _worker_state
+    lookups, misses = cache.lookups, cache.misses
+    matched_path, unmatched_path = spool_paths(spool_prefix)
+    keys = set()
+    try:
+        with open(matched_path, 'w', encoding='utf-8', newline='') as matched_file, \
+                open(unmatched_path, 'w', encoding='utf-8', newline='') as unmatched_file:
+            matched_writer = csv.writer(matched_file)
+            unmatched_writer = csv.writer(unmatched_file)
+            for matched_assets, unmatched_assets in iter_insightvm_file(insightvm_csv, enrichment_data, backend,
+                                                                        index, cache):
+                for asset in matched_assets:
+                    matched_writer.writerow([asset[column] for column in MATCHED_COLUMNS])
+                    keys.add(hostname_forms(asset["Hostname"]).canonical)
+                for hostname in unmatched_assets:
+                    unmatched_writer.writerow([hostname])
+                    keys.add(hostname_forms(hostname).canonical)
+    except Exception as e:
+        return e
+    matches = []
+    for key in keys:
+        match = cache.get(key)
+        if match is not None:
+            matches.append((key, match))
+    return cache.lookups - lookups, cache.misses - misses, matches
+
+def iter_spooled_file(spool_prefix: str, chunk_rows: int = CHUNK_ROWS):
+    """
+    Yield (matched assets, unmatched assets) chunks of a file a pool worker spooled,
+    like iter_insightvm_file, and remove the spool files once they are read.
+    """
+    matched_path, unmatched_path = spool_paths(spool_prefix)
+    try:
+        yielded = False
+        with open(matched_path, 'r', encoding='utf-8', newline='') as file:
+            chunk = []
+            for row in csv.reader(file):
+                chunk.append(dict(zip(MATCHED_COLUMNS, row)))
+                if len(chunk) >= chunk_rows:
+                    yield chunk, []
+                    chunk = []
+                    yielded = True
+        with open(unmatched_path, 'r', encoding='utf-8', newline='') as file:
+            unmatched = []
+            for row in csv.reader(file):
+                unmatched.append(row[0])
+                if len(unmatched) >= chunk_rows:
+                    yield chunk, unmatched
+                    chunk, unmatched = [], []
+                    yielded = True
+        if chunk or unmatched or not yielded:
+            yield chunk, unmatched
+    finally:
+        for path in (matched_path, unmatched_path):
+            Path(path).unlink(missing_ok=True)
+
+def process_files_parallel(insightvm_csv_files: List[str], enrichment_data: Dict, index: EnrichmentIndex,
+                           backend: Optional[SimilarityBackend], cache: MatchCache, workers: int, spool_dir: str):
+    """
+    Yield the iter_spooled_file chunks (or the exception a file raised) of each file in input order,
+    matching the files in a process pool.
+
+    Each worker receives the enrichment data, index and the cache's matches once
+    and keeps its own cache, so a hostname is matched at most once per worker.
+    Workers spool the rows they match to files in spool_dir instead of sending
+    them back, so memory stays flat as in a serial run. The matches and hit
+    counts of the workers are added to cache.
+    """
+    initargs = (enrichment_data, index, backend, cache.items(), cache.max_entries)
+    spool_prefixes = [os.path.join(spool_dir, str(number)) for number in range(len(insightvm_csv_files))]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT, initializer=_init_file_worker,
+                             initargs=initargs) as executor:
+        for spool_prefix, result in zip(spool_prefixes,
+                                        executor.map(_process_file_in_worker, insightvm_csv_files, spool_prefixes)):
+            if isinstance(result, Exception):
+                yield result
+                continue
+            lookups, misses, matches = result
+            cache.lookups += lookups
+            cache.misses += misses
+            for key, match in matches:
+                cache.put(key, match)
+            yield iter_spooled_file(spool_prefix)
+
+def process_insightvm_files(insightvm_csv_files: List[str], inventory_csv: str, output_directory: str,
+                            backend: Optional[SimilarityBackend] = None,
+                            cache: Optional[MatchCache] = None, workers: int = 1) -> str:
     """
     Main function to process multiple InsightVM files and create a consolidated Excel report.
     
@@ -97,6 +652,11 @@ def process_insightvm_files(insightvm_csv_files: List[str], inventory_csv: str,
         insightvm_csv_files: List of paths to InsightVM CSV files
         inventory_csv: Path to the asset inventory CSV file
         output_directory: Directory to save the consolidated Excel file
+        backend: Optional tools.similarity backend to score hostnames in batches
+        cache: Optional MatchCache shared by the files, a new one for this batch when not given.
+            Its hit counts are updated, and it is saved when it has a path.
+        workers: Number of processes matching files at the same time (1 = one file after another).
+            Sheets are written in input order either way.
         
     Returns:
         str: Path to the generated Excel file
@@ -114,49 +674,71 @@ def process_insightvm_files(insightvm_csv_files: List[str], inventory_csv: str,
     except Exception as e:
         raise Exception(f"Error reading the inventory file: {e}")
 
+    # Normalize the inventory hostnames once for every file
+    index = EnrichmentIndex(enrichment_data)
+    cache = cache if cache is not None else MatchCache()
+
     output_file = os.path.join(output_directory, 'consolidated_results.xlsx')
-    
-    # Create a new Excel writer
-    with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-        all_unmatched = {}
+
+    # Rows are written as they are matched. Unmatched hostnames are spooled to a temporary
+    # file until the summary sheet, which comes after every file's sheet, can be written.
+    with StreamingWorkbook(output_file) as workbook, \
+            tempfile.TemporaryFile('w+', encoding='utf-8', newline='') as unmatched_spool, \
+            tempfile.TemporaryDirectory() as spool_dir:
+        results = None
+        if workers and workers > 1 and len(insightvm_csv_files) > 1:
+            # Match the files in a process pool, results come back in input order
+            results = process_files_parallel(insightvm_csv_files, enrichment_data, index, backend, cache,
+                                             min(workers, len(insightvm_csv_files)), spool_dir)
+
+        unmatched_writer = csv.writer(unmatched_spool)
 
         for insightvm_csv in insightvm_csv_files:
             print(f"Processing {insightvm_csv}...")
+            spool_start = unmatched_spool.tell()
 
             try:
-                matched_assets, unmatched_assets = process_insightvm_file(
-                    insightvm_csv, enrichment_data)
-
-                # Create DataFrame for the matched assets
-                matched_df = pd.DataFrame(matched_assets)
-
-                # Generate sheet name from the input file name
-                sheet_name = sanitize_sheet_name(os.path.basename(insightvm_csv).split('.')[0])
+                if results is None:
+                    chunks = iter_insightvm_file(insightvm_csv, enrichment_data, backend, index, cache)
+                else:
+                    chunks = next(results)
+                    if isinstance(chunks, Exception):
+                        raise chunks
 
-                # Write the DataFrame to a new sheet in the consolidated workbook
-                matched_df.to_excel(writer, sheet_name=sheet_name, index=False)
+                sheet = None
+                for matched_assets, unmatched_assets in chunks:
+                    # Generate sheet name from the input file name
+                    if sheet is None:
+                        sheet = workbook.sheet(sanitize_sheet_name(os.path.basename(insightvm_csv).split('.')[0]),
+                                               MATCHED_COLUMNS)
+                    sheet.extend(matched_assets)
 
-                # Store unmatched assets
-                if unmatched_assets:
-                    all_unmatched[sheet_name] = unmatched_assets
-                    print(f"\nUnmatched hostnames in {insightvm_csv}:")
+                    # Store unmatched assets
+                    if unmatched_assets and unmatched_spool.tell() == spool_start:
+                        print(f"\nUnmatched hostnames in {insightvm_csv}:")
                     for hostname in unmatched_assets:
+                        unmatched_writer.writerow([sheet.sheet_names[0], hostname])
                         print(f"  - {hostname}")
 
             except Exception as e:
+                # Drop the unmatched hostnames of the failed file
+                unmatched_spool.seek(spool_start)
+                unmatched_spool.truncate()
                 print(f"Error processing file {insightvm_csv}: {e}")
 
+        if results is not None:
+            # Shut the pool down before its spool directory is removed
+            results.close()
+
         # Create a summary sheet for unmatched assets
-        if all_unmatched:
-            summary_data = []
-            for file_name, unmatched in all_unmatched.items():
-                for hostname in unmatched:
-                    summary_data.append({
-                        "Source File": file_name,
-                        "Unmatched Hostname": hostname
-                    })
-            unmatched_df = pd.DataFrame(summary_data)
-            unmatched_df.to_excel(writer, sheet_name='Unmatched_Assets', index=False)
+        if unmatched_spool.tell() > 0:
+            unmatched_spool.seek(0)
+            summary = workbook.sheet('Unmatched_Assets', UNMATCHED_COLUMNS)
+            for file_name, hostname in csv.reader(unmatched_spool):
+                summary.append({"Source File": file_name, "Unmatched Hostname": hostname})
+
+    print(f"Match cache: {cache.hits} of {cache.lookups} hostnames reused ({cache.hit_rate:.1%})")
+    cache.save()
 
     # Verify the file exists before returning
     if not os.path.exists(output_file):
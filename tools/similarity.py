@@ -0,0 +1,136 @@
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from fuzzywuzzy import fuzz
+
+from tools.hostname_normalization import hostname_forms, token_set_ratio, token_sort_ratio
+
+# The batched backend needs rapidfuzz
+try:
+    from rapidfuzz import fuzz as rapidfuzz_fuzz, process as rapidfuzz_process
+    from rapidfuzz.distance import Indel
+except ImportError:
+    rapidfuzz_process = None
+
+SCORERS = ('ratio', 'partial', 'token_set', 'token_sort')
+
+# Queries scored per block, so a block holds BLOCK_ROWS x candidates scores
+BLOCK_ROWS = 256
+
+class SimilarityBackend:
+    """
+    Scores a block of query strings against candidate strings in one call.
+
+    Scores are the integers fuzzywuzzy returns: ratio is fuzz.ratio, partial is
+    fuzz.partial_ratio and token_set / token_sort are fuzz.token_set_ratio /
+    fuzz.token_sort_ratio. This reference backend scores one pair at a time.
+    """
+
+    name = 'fuzzywuzzy'
+    # Scorers whose scores are exactly fuzzywuzzy's
+    exact_scorers = frozenset(SCORERS)
+    # Whether a block is scored in one call. Matching only scores whole blocks against every
+    # candidate with batched backends, pairwise ones go through the pruned candidate search.
+    batched = False
+
+    def _check_scorer(self, scorer: str):
+        if scorer not in SCORERS:
+            raise ValueError(f"Unknown scorer {scorer!r}, expected one of {', '.join(SCORERS)}")
+
+    def score_matrix(self, queries: Sequence[str], candidates: Sequence[str], scorer: str = 'ratio') -> np.ndarray:
+        """Scores of every query (rows) against every candidate (columns) as an int16 matrix."""
+        self._check_scorer(scorer)
+        if scorer in ('token_set', 'token_sort'):
+            pair_score = token_set_ratio if scorer == 'token_set' else token_sort_ratio
+            queries = [hostname_forms(query) for query in queries]
+            candidates = [hostname_forms(candidate) for candidate in candidates]
+        else:
+            pair_score = fuzz.ratio if scorer == 'ratio' else fuzz.partial_ratio
+
+        matrix = np.zeros((len(queries), len(candidates)), dtype=np.int16)
+        for row, query in enumerate(queries):
+            matrix[row] = [pair_score(query, candidate) for candidate in candidates]
+        return matrix
+
+    def blocks(self, queries: Sequence[str], candidates: Sequence[str], scorer: str = 'ratio',
+               block_rows: int = BLOCK_ROWS) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yield (first query row, score matrix) for consecutive blocks of queries."""
+        for start in range(0, len(queries), block_rows):
+            yield start, self.score_matrix(queries[start:start + block_rows], candidates, scorer)
+
+def ratio_from_distances(distances: np.ndarray, query_lengths: np.ndarray, candidate_lengths: np.ndarray) -> np.ndarray:
+    """fuzz.ratio from Indel distances, with the same float rounding as python-Levenshtein's ratio."""
+    totals = query_lengths[:, None] + candidate_lengths[None, :]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scores = np.rint(100 * (1 - distances / totals))
+    # Two empty strings are equal
+    return np.where(totals == 0, 100, scores).astype(np.int16)
+
+class RapidfuzzBackend(SimilarityBackend):
+    """
+    Batched backend on rapidfuzz's process.cdist, which scores a whole block in
+    C++ with up to workers threads (-1 uses every core).
+
+    ratio, token_sort and token_set scores equal fuzzywuzzy's. partial is
+    rapidfuzz's partial_ratio, which searches every alignment of the shorter
+    string and so is never lower than fuzz.partial_ratio.
+    """
+
+    name = 'rapidfuzz'
+    exact_scorers = frozenset({'ratio', 'token_set', 'token_sort'})
+    batched = True
+
+    def __init__(self, workers: int = -1):
+        if rapidfuzz_process is None:
+            raise ValueError("The rapidfuzz similarity backend needs the rapidfuzz package")
+        self.workers = workers
+
+    def _ratio(self, queries: List[str], candidates: List[str]) -> np.ndarray:
+        distances = rapidfuzz_process.cdist(queries, candidates, scorer=Indel.distance, dtype=np.int32,
+                                            workers=self.workers)
+        return ratio_from_distances(
+            distances,
+            np.fromiter(map(len, queries), dtype=np.int64, count=len(queries)),
+            np.fromiter(map(len, candidates), dtype=np.int64, count=len(candidates))
+        )
+
+    def _token_set(self, queries: List[str], candidates: List[str]) -> np.ndarray:
+        query_forms = [hostname_forms(query) for query in queries]
+        candidate_forms = [hostname_forms(candidate) for candidate in candidates]
+        scores = rapidfuzz_process.cdist(
+            [' '.join(sorted(forms.tokens)) for forms in query_forms],
+            [' '.join(sorted(forms.tokens)) for forms in candidate_forms],
+            scorer=rapidfuzz_fuzz.token_set_ratio, dtype=np.float64, workers=self.workers
+        )
+        # rapidfuzz computes 100 - 100 * d / n where fuzzywuzzy computes 100 * (1 - d / n),
+        # so scores on a .5 boundary can round apart. Those few pairs are scored exactly.
+        matrix = np.rint(scores).astype(np.int16)
+        for row, column in zip(*np.nonzero(np.abs(scores - np.floor(scores) - 0.5) < 1e-6)):
+            matrix[row, column] = token_set_ratio(query_forms[row], candidate_forms[column])
+        return matrix
+
+    def score_matrix(self, queries: Sequence[str], candidates: Sequence[str], scorer: str = 'ratio') -> np.ndarray:
+        self._check_scorer(scorer)
+        queries, candidates = list(queries), list(candidates)
+        if not queries or not candidates:
+            return np.zeros((len(queries), len(candidates)), dtype=np.int16)
+        if scorer == 'ratio':
+            return self._ratio(queries, candidates)
+        if scorer == 'token_sort':
+            return self._ratio([hostname_forms(query).sorted_tokens for query in queries],
+                               [hostname_forms(candidate).sorted_tokens for candidate in candidates])
+        if scorer == 'token_set':
+            return self._token_set(queries, candidates)
+        scores = rapidfuzz_process.cdist(queries, candidates, scorer=rapidfuzz_fuzz.partial_ratio,
+                                         dtype=np.float64, workers=self.workers)
+        return np.rint(scores).astype(np.int16)
+
+SIMILARITY_BACKENDS = {'fuzzywuzzy': SimilarityBackend, 'rapidfuzz': RapidfuzzBackend}
+
+def get_similarity_backend(name: Optional[str]) -> Optional[SimilarityBackend]:
+    """Backend by name, or None for an empty name. Raises ValueError for unknown or unavailable backends."""
+    if not name:
+        return None
+    if name not in SIMILARITY_BACKENDS:
+        raise ValueError(f"Unknown similarity backend {name!r}, expected one of {', '.join(SIMILARITY_BACKENDS)}")
+    return SIMILARITY_BACKENDS[name]()
@@ -0,0 +1,113 @@
+from typing import Dict, List, Sequence
+
+import xlsxwriter
+
+# Rows of an Excel worksheet, header row included
+EXCEL_MAX_ROWS = 1048576
+SHEET_NAME_MAX_LENGTH = 31
+
+# Style pandas gives header cells, so reports look the same as when written with pandas
+HEADER_FORMAT = {'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'}
+
+class StreamingSheet:
+    """
+    Rows of one report sheet, written as they are appended.
+
+    The header is written with the first row, so a sheet without rows stays
+    empty like an empty DataFrame written with pandas. A sheet that reaches the
+    workbook's max_rows continues on a new sheet named "<name>_2", "<name>_3", ...
+    with the same header.
+    """
+
+    def __init__(self, workbook: 'StreamingWorkbook', name: str, columns: Sequence[str]):
+        self.workbook = workbook
+        self.name = name
+        self.columns = list(columns)
+        self.rows = 0
+        self.sheet_names = []
+        self._worksheet = None
+        self._next_row = 0
+        self._add_worksheet(name)
+
+    def _add_worksheet(self, name: str):
+        self._worksheet = self.workbook.add_worksheet(name)
+        self.sheet_names.append(self._worksheet.name)
+        self._next_row = 0
+
+    def _write_header(self):
+        self._worksheet.write_row(self._next_row, 0, self.columns, self.workbook.header_format)
+        self._next_row += 1
+
+    def append(self, row: Dict):
+        """Write one row, a dict keyed by column. Missing and None values are left blank."""
+        if self._next_row >= self.workbook.max_rows:
+            suffix = f"_{len(self.sheet_names) + 1}"
+            self._add_worksheet(self.name[:SHEET_NAME_MAX_LENGTH - len(suffix)] + suffix)
+        if self._next_row == 0:
+            self._write_header()
+        for column_number, column in enumerate(self.columns):
+            value = row.get(column)
+            if value is None:
+                continue
+            if isinstance(value, str):
+                # Written as text even when it looks like a formula or a number
+                self._worksheet.write_string(self._next_row, column_number, value)
+            else:
+                self._worksheet.write(self._next_row, column_number, value)
+        self._next_row += 1
+        self.rows += 1
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+class StreamingWorkbook:
+    """
+    XLSX workbook written with xlsxwriter's constant_memory mode.
+
+    Each worksheet only holds its current row in memory and flushes it to a
+    temporary file when the next row starts, so memory stays flat however many
+    rows are written. Rows of a sheet must be appended in order, which
+    StreamingSheet does. Sheet names are made unique, ignoring case as Excel does.
+    """
+
+    def __init__(self, path: str, max_rows: int = EXCEL_MAX_ROWS):
+        self.path = path
+        self.max_rows = max_rows
+        self._workbook = xlsxwriter.Workbook(path, {
+            'constant_memory': True,
+            'strings_to_numbers': False,
+            'strings_to_formulas': False,
+            'strings_to_urls': False
+        })
+        self.header_format = self._workbook.add_format(HEADER_FORMAT)
+        self._used_names = set()
+
+    def __enter__(self) -> 'StreamingWorkbook':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_worksheet(self, name: str):
+        """New worksheet named name, or name with a "_<n>" suffix when a sheet already has that name."""
+        unique_name = name[:SHEET_NAME_MAX_LENGTH]
+        number = 1
+        while unique_name.lower() in self._used_names:
+            number += 1
+            suffix = f"_{number}"
+            unique_name = name[:SHEET_NAME_MAX_LENGTH - len(suffix)] + suffix
+        self._used_names.add(unique_name.lower())
+        return self._workbook.add_worksheet(unique_name)
+
+    def sheet(self, name: str, columns: Sequence[str]) -> StreamingSheet:
+        """Start a new sheet with the given columns."""
+        return StreamingSheet(self, name, columns)
+
+    @property
+    def sheet_names(self) -> List[str]:
+        return [worksheet.name for worksheet in self._workbook.worksheets()]
+
+    def close(self):
+        """Write the workbook file. A workbook without sheets gets an empty "Sheet1", as Excel needs one."""
+        self._workbook.close()